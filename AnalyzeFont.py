@@ -0,0 +1,148 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Generate CheckFontLog.txt, CheckFontError.txt, CheckFontResults.json and
+# index.html for a font, opening it only once with fontforge. This is
+# equivalent to running
+#   CheckFont.py directory/font > directory/CheckFontLog.txt \
+#       2> directory/CheckFontError.txt
+#   CheckFont.py --format=json directory/font > directory/CheckFontResults.json
+#   GenerateHTMLTest.py directory font
+#
+# The hashes of the inputs (font, fallback fonts, scripts, tool versions and
+# options) are recorded in directory/AnalyzeFont.manifest.json and nothing is
+# regenerated when they did not change, unless --force is passed.
+
+from __future__ import print_function
+from FontSources import fileDigest
+from GlyphIndex import GlyphIndex
+from collections import OrderedDict
+from contextlib import redirect_stderr, redirect_stdout
+import CheckFont
+import GenerateHTMLTest
+import fontTools
+import fontforge
+import json
+import os
+import sys
+
+kManifestName = "AnalyzeFont.manifest.json"
+kManifestVersion = 1
+kScripts = ["AnalyzeFont.py", "CheckFont.py", "GenerateHTMLTest.py",
+            "GlyphIndex.py", "MathStretchy.py"]
+# The CheckFont.py options giving fallback fonts, whose content is hashed.
+# The other options only affect the generated files through their value,
+# recorded with the arguments.
+kFallbackFontOptions = ["italic", "bold", "bold_italic", "sans_serif",
+                        "sans_serif_italic", "sans_serif_bold",
+                        "sans_serif_bold_italic", "monospace"]
+
+def manifestInputs(aPath, aArgs, aCheckFontArguments, aSharded):
+    # Everything that may affect the generated files.
+    inputs = OrderedDict()
+    inputs["version"] = kManifestVersion
+    inputs["font"] = fileDigest(aPath)
+    fallbackFonts = OrderedDict()
+    for name in kFallbackFontOptions:
+        value = getattr(aArgs, name)
+        if value:
+            fallbackFonts[name] = fileDigest(value)
+    inputs["fallbackFonts"] = fallbackFonts
+    scriptDirectory = os.path.dirname(os.path.abspath(__file__))
+    inputs["scripts"] = OrderedDict(
+        (script, fileDigest(os.path.join(scriptDirectory, script)))
+        for script in kScripts)
+    inputs["fontforge"] = fontforge.version()
+    inputs["fontTools"] = fontTools.version
+    inputs["python"] = sys.version.split()[0]
+    inputs["arguments"] = aCheckFontArguments + \
+        (["--sharded"] if aSharded else [])
+    return inputs
+
+def outputFiles(aDirectory, aSharded):
+    outputs = ["CheckFontLog.txt", "CheckFontError.txt",
+               "CheckFontResults.json", "index.html", "coverage.json"]
+    if aSharded:
+        outputs += [fileName for fileName, title, printSection
+                    in GenerateHTMLTest.kSections]
+    return ["%s/%s" % (aDirectory, fileName) for fileName in outputs]
+
+def isUpToDate(aDirectory, aInputs, aSharded):
+    try:
+        with open("%s/%s" % (aDirectory, kManifestName)) as f:
+            manifest = json.load(f)
+    except (EnvironmentError, ValueError):
+        return False
+    return (manifest == aInputs and
+            all(os.path.isfile(output)
+                for output in outputFiles(aDirectory, aSharded)))
+
+def main(aDirectory, aFontName, aCheckFontArguments, aSharded=False,
+         aForce=False):
+    path = "%s/%s" % (aDirectory, aFontName)
+    args = CheckFont.createArgumentParser().parse_args(
+        [path] + aCheckFontArguments)
+    try:
+        inputs = manifestInputs(path, args, aCheckFontArguments, aSharded)
+    except EnvironmentError as e:
+        print("Failed to read %s!" % e.filename, file=sys.stderr)
+        exit(1)
+    if not aForce and isUpToDate(aDirectory, inputs, aSharded):
+        print("%s is up to date" % path)
+        return
+
+    timer = CheckFont.PhaseTimer()
+    timer.begin("open")
+    try:
+        font = fontforge.open(path)
+    except EnvironmentError:
+        print("Failed to open %s!" % path, file=sys.stderr)
+        exit(1)
+
+    # CheckFont.py fixes the font in memory, so the testcase must be
+    # generated first to describe the original font. Both share the same
+    # glyph index, which CheckFont.py keeps up-to-date with its fixes.
+    timer.begin("index")
+    index = GlyphIndex(font)
+    timer.begin("testcase")
+    GenerateHTMLTest.generateHTMLTest(aDirectory, aFontName, font, index,
+                                      aSharded)
+    timer.end()
+
+    with open("%s/CheckFontLog.txt" % aDirectory, "w") as log, \
+         open("%s/CheckFontError.txt" % aDirectory, "w") as error:
+        with redirect_stdout(log), redirect_stderr(error):
+            print("Opening file %s... Done" % path)
+            print("")
+            results = CheckFont.runProfiled(args.cprofile,
+                                            CheckFont.checkFont, font, args,
+                                            index, None, timer)
+    if args.timings:
+        timer.report()
+    with open("%s/CheckFontResults.json" % aDirectory, "w") as f:
+        results.write(f, "json")
+
+    font.close()
+
+    # Only record the inputs once all the files have been generated.
+    GenerateHTMLTest.writeAtomically(
+        "%s/%s" % (aDirectory, kManifestName),
+        "%s\n" % json.dumps(inputs, indent=1))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python %s [directory] [opentype-math-font] [--sharded] [--force] [CheckFont.py options]" % sys.argv[0],
+              file=sys.stderr)
+        exit(1)
+    # --sharded is passed to GenerateHTMLTest.py, --force regenerates the
+    # files even if the inputs did not change and the other options are
+    # passed to CheckFont.py.
+    arguments = sys.argv[3:]
+    sharded = "--sharded" in arguments
+    if sharded:
+        arguments.remove("--sharded")
+    force = "--force" in arguments
+    if force:
+        arguments.remove("--force")
+    main(sys.argv[1], sys.argv[2], arguments, sharded, force)
@@ -0,0 +1,158 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Compare the MathConstants of the math fonts of all the families. The
+# constants are loaded into a matrix (one row per font, one column per
+# constant) normalized by the em size, and each value gets a robust z-score
+# computed from the median and the median absolute deviation of its column.
+# Values far from those of the other fonts are reported, which covers all
+# the constants instead of the few thresholds hard-coded in CheckFont.py.
+# This requires numpy.
+
+from __future__ import print_function
+from collections import OrderedDict
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.tables.otData import otData
+import argparse
+import json
+import os
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from BuildFonts import kFamilies, kRootDirectory
+
+# Constants in the order of the MATH table specification.
+kMathConstants = [field[1] for name, fields in otData
+                  if name == "MathConstants" for field in fields]
+# These are percentages and are not normalized by the em size.
+kPercentConstants = ["ScriptPercentScaleDown", "ScriptScriptPercentScaleDown",
+                     "RadicalDegreeBottomRaisePercent"]
+# Scale of the robust z-score, so that it matches the standard score for
+# normally distributed values.
+kMADScale = 0.6745
+# Same for the mean absolute deviation, used when more than half of the
+# fonts have the same value.
+kMeanADScale = 0.7979
+kDefaultThreshold = 3.5
+
+def readMathConstants(aPath):
+    # Return the MathConstants of a font normalized by the em size, or None
+    # if it has no MATH table.
+    font = TTFont(aPath, lazy=True)
+    if "MATH" not in font:
+        font.close()
+        return None
+    constants = font["MATH"].table.MathConstants
+    unitsPerEm = float(font["head"].unitsPerEm)
+    values = []
+    for name in kMathConstants:
+        value = getattr(constants, name)
+        value = getattr(value, "Value", value)
+        values.append(value if name in kPercentConstants
+                      else value / unitsPerEm)
+    font.close()
+    return values
+
+def robustScores(aMatrix):
+    # Column statistics and the robust z-score of each value.
+    median = numpy.median(aMatrix, axis=0)
+    deviation = numpy.abs(aMatrix - median)
+    mad = numpy.median(deviation, axis=0) / kMADScale
+    meanAD = numpy.mean(deviation, axis=0) / kMeanADScale
+    scale = numpy.where(mad > 0, mad, meanAD)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        scores = numpy.where(scale > 0, (aMatrix - median) / scale, 0.)
+    return median, scale, scores
+
+def mathFonts(aFamilies, aExtraFonts):
+    # The math font analyzed by AnalyzeFont.py for each family, if it has
+    # been built, and the fonts passed on the command line.
+    fonts = OrderedDict()
+    for family in aFamilies:
+        path = os.path.join(kRootDirectory, family,
+                            kFamilies[family]["check"])
+        if os.path.isfile(path):
+            fonts[family] = path
+        else:
+            print("Skipping %s: %s not found" % (family, path),
+                  file=sys.stderr)
+    for path in aExtraFonts:
+        fonts[path] = path
+    return fonts
+
+def formatValue(aName, aValue):
+    if aName in kPercentConstants:
+        return "%d%%" % aValue
+    return "%.3fem" % aValue
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the MathConstants of the math fonts of all the families and report the values that deviate from the other fonts.")
+    parser.add_argument("families", type=str, nargs="*", metavar="family", help="Families to compare (default: all of them).")
+    parser.add_argument("--font", type=str, action="append", default=[], help="Additional font to compare with the families, e.g. a new upstream version. Can be repeated.")
+    parser.add_argument("--threshold", type=float, default=kDefaultThreshold, help="Absolute robust z-score above which a value is reported (default: %(default)s).")
+    parser.add_argument("--json", type=str, help="Also write the normalized constants, the statistics and the scores into this JSON file.")
+    args = parser.parse_args()
+
+    if numpy is None:
+        print("AnalyzeMathConstants.py requires numpy!", file=sys.stderr)
+        sys.exit(1)
+    families = args.families or list(kFamilies)
+    for name in families:
+        if name not in kFamilies:
+            print("Unknown family %s!" % name, file=sys.stderr)
+            sys.exit(1)
+
+    names = []
+    rows = []
+    for name, path in mathFonts(families, args.font).items():
+        values = readMathConstants(path)
+        if values is None:
+            print("Skipping %s: no MATH table" % path, file=sys.stderr)
+            continue
+        names.append(name)
+        rows.append(values)
+    if len(rows) < 3:
+        print("At least 3 math fonts are needed, build the families first!",
+              file=sys.stderr)
+        sys.exit(1)
+
+    matrix = numpy.array(rows, dtype=float)
+    median, scale, scores = robustScores(matrix)
+    print("%-40s %10s %10s %10s %10s" %
+          ("Constant", "Median", "Deviation", "Min", "Max"))
+    for j, constant in enumerate(kMathConstants):
+        print("%-40s %10s %10s %10s %10s" %
+              (constant, formatValue(constant, median[j]),
+               formatValue(constant, scale[j]),
+               formatValue(constant, matrix[:, j].min()),
+               formatValue(constant, matrix[:, j].max())))
+    print("")
+
+    outliers = numpy.argwhere(numpy.abs(scores) > args.threshold)
+    # Sort by decreasing score.
+    order = numpy.argsort(-numpy.abs(scores[outliers[:, 0], outliers[:, 1]]))
+    for i, j in outliers[order]:
+        print("Warning: %s: %s is %s (median %s, score %+.1f)" %
+              (names[i], kMathConstants[j],
+               formatValue(kMathConstants[j], matrix[i, j]),
+               formatValue(kMathConstants[j], median[j]), scores[i, j]))
+    print("%d value(s) out of %d deviate from the %d fonts" %
+          (len(outliers), matrix.size, len(names)))
+
+    if args.json:
+        report = OrderedDict()
+        report["constants"] = kMathConstants
+        report["median"] = median.tolist()
+        report["deviation"] = scale.tolist()
+        report["fonts"] = OrderedDict(
+            (name, OrderedDict([("values", matrix[i].tolist()),
+                                ("scores", scores[i].tolist())]))
+            for i, name in enumerate(names))
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+            f.write("\n")
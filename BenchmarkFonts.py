@@ -0,0 +1,212 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Measure the sizes of the fonts of each family (raw, WOFF, WOFF2 and the
+# bytes of the main tables) and the time fontTools takes to decode them. Each
+# run is appended to a JSON history file and compared with the previous run,
+# so that size or decoding time regressions between releases are flagged.
+
+from __future__ import print_function
+from collections import OrderedDict
+from datetime import datetime
+from fontTools.ttLib import TTFont
+from io import BytesIO
+import argparse
+import fontTools
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+from BuildFonts import kFamilies, kRootDirectory
+
+kDefaultHistoryFile = os.path.join(kRootDirectory, ".cache",
+                                   "BenchmarkFonts.history.json")
+kHistoryVersion = 1
+
+kRawExtensions = [".otf", ".ttf"]
+kFlavors = ["woff", "woff2"]
+# Tables whose size is reported, the others being counted together.
+kTables = OrderedDict([("MATH", ["MATH"]),
+                       ("outlines", ["CFF ", "CFF2", "glyf", "loca"]),
+                       ("GSUB", ["GSUB"]),
+                       ("GPOS", ["GPOS"])])
+# Relative increase above which a measure is flagged as a regression.
+kDefaultSizeThreshold = 0.01
+kDefaultTimeThreshold = 0.25
+# Decoding time differences below that many seconds are just noise.
+kMinimumTimeIncrease = 0.005
+
+def familyFonts(aFamily):
+    # Return {font name: {extension: path}} for the fonts at the top of the
+    # family directory. The chunks of compress-font.py --split are skipped.
+    fonts = OrderedDict()
+    directory = os.path.join(kRootDirectory, aFamily)
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        name, extension = os.path.splitext(os.path.basename(path))
+        if extension not in kRawExtensions + ["." + f for f in kFlavors]:
+            continue
+        if re.search(r"\.(core|alphanumeric|arabic|other)$", name):
+            continue
+        fonts.setdefault(name, OrderedDict())[extension[1:]] = path
+    return fonts
+
+def decodeTime(aData, aRepeat):
+    # Best time to parse the font and decompile all its tables.
+    best = None
+    for _ in range(aRepeat):
+        start = time.time()
+        font = TTFont(BytesIO(aData), lazy=False)
+        for tag in font.keys():
+            font[tag]
+        font.close()
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+def tableSizes(aFont):
+    # Uncompressed size of the main tables, from the table directory. The
+    # length of a WOFF or WOFF2 entry is the compressed one, origLength the
+    # one of the table in the sfnt font.
+    sizes = OrderedDict((name, 0) for name in kTables)
+    sizes["other"] = 0
+    for tag, entry in aFont.reader.tables.items():
+        length = getattr(entry, "origLength", entry.length)
+        for name, tags in kTables.items():
+            if tag in tags:
+                sizes[name] += length
+                break
+        else:
+            sizes["other"] += length
+    return sizes
+
+def measureFont(aPaths, aRepeat):
+    result = OrderedDict()
+    raw = None
+    for extension in kRawExtensions:
+        raw = aPaths.get(extension[1:], raw)
+    tables = None
+    for flavor in [None] + kFlavors:
+        path = raw if flavor is None else aPaths.get(flavor)
+        if path is None:
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        font = TTFont(BytesIO(data), lazy=True)
+        if tables is None:
+            tables = tableSizes(font)
+        if "raw" not in result:
+            # The WOFF and WOFF2 headers record the size of the sfnt font.
+            result["raw"] = len(data) if flavor is None else \
+                font.reader.totalSfntSize
+        font.close()
+        if flavor:
+            result[flavor] = len(data)
+            result["%sDecodeTime" % flavor] = round(decodeTime(data, aRepeat),
+                                                    4)
+    result["tables"] = tables
+    return result
+
+def loadHistory(aPath):
+    if not os.path.exists(aPath):
+        return []
+    with open(aPath) as f:
+        return json.load(f)["runs"]
+
+def saveHistory(aPath, aRuns):
+    os.makedirs(os.path.dirname(os.path.abspath(aPath)), exist_ok=True)
+    temporaryPath = "%s.%d.tmp" % (aPath, os.getpid())
+    with open(temporaryPath, "w") as f:
+        json.dump(OrderedDict([("version", kHistoryVersion),
+                               ("runs", aRuns)]), f, indent=1)
+        f.write("\n")
+    os.replace(temporaryPath, aPath)
+
+def regressions(aPrevious, aCurrent, aSizeThreshold, aTimeThreshold):
+    # Return a list of (font, measure, previous, current) for the measures
+    # that grew more than the thresholds.
+    found = []
+    for font, measures in aCurrent.items():
+        previousMeasures = aPrevious.get(font)
+        if not previousMeasures:
+            continue
+        for name, value in measures.items():
+            previous = previousMeasures.get(name)
+            if name == "tables" or not previous:
+                continue
+            if name.endswith("DecodeTime"):
+                if value - previous < kMinimumTimeIncrease:
+                    continue
+                threshold = aTimeThreshold
+            else:
+                threshold = aSizeThreshold
+            if value > previous * (1 + threshold):
+                found.append((font, name, previous, value))
+    return found
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the size and decoding time of the fonts of each family, record them in a history file and flag regressions.")
+    parser.add_argument("families", type=str, nargs="*", metavar="family", help="Families to measure (default: all of them).")
+    parser.add_argument("--history", type=str, default=kDefaultHistoryFile, help="JSON file where the runs are recorded (default: %(default)s).")
+    parser.add_argument("--label", type=str, help="Name of this run in the history, e.g. a release number (default: the date).")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times each font is decoded, the best time being kept (default: %(default)s).")
+    parser.add_argument("--size-threshold", type=float, default=kDefaultSizeThreshold, help="Relative size increase flagged as a regression (default: %(default)s).")
+    parser.add_argument("--time-threshold", type=float, default=kDefaultTimeThreshold, help="Relative decoding time increase flagged as a regression (default: %(default)s).")
+    parser.add_argument("--no-save", action="store_true", help="Compare with the history without recording this run.")
+    parser.add_argument("--strict", action="store_true", help="Exit with an error status when a regression is found.")
+    args = parser.parse_args()
+
+    families = args.families or list(kFamilies)
+    start = time.time()
+    fonts = OrderedDict()
+    print("%-44s %9s %9s %9s %8s %9s %8s %8s %8s" %
+          ("Font", "Raw", "WOFF", "WOFF2", "MATH", "Outlines", "GSUB", "GPOS",
+           "Decode"))
+    for family in families:
+        for name, paths in familyFonts(family).items():
+            key = "%s/%s" % (family, name)
+            measures = measureFont(paths, max(1, args.repeat))
+            fonts[key] = measures
+            tables = measures["tables"]
+            print("%-44s %9d %9s %9s %8d %9d %8d %8d %7.0fms" %
+                  (key, measures["raw"], measures.get("woff", "-"),
+                   measures.get("woff2", "-"), tables["MATH"],
+                   tables["outlines"], tables["GSUB"], tables["GPOS"],
+                   1000 * measures.get("woff2DecodeTime",
+                                       measures.get("woffDecodeTime", 0))))
+    if not fonts:
+        print("No font found, build the families first!", file=sys.stderr)
+        sys.exit(1)
+    for flavor in kFlavors:
+        total = sum(m.get(flavor, 0) for m in fonts.values())
+        print("Total %s: %d bytes" % (flavor.upper(), total))
+
+    runs = loadHistory(args.history)
+    found = []
+    if runs:
+        previous = runs[-1]
+        found = regressions(previous["fonts"], fonts, args.size_threshold,
+                            args.time_threshold)
+        print("Compared with %s:" % previous["label"])
+        for font, name, before, after in found:
+            print("REGRESSION %s %s: %s => %s (%+.1f%%)" %
+                  (font, name, before, after, 100. * (after - before) / before))
+        if not found:
+            print("No regression.")
+    if not args.no_save:
+        run = OrderedDict()
+        date = datetime.now().isoformat(timespec="seconds")
+        run["label"] = args.label or date
+        run["date"] = date
+        run["fontTools"] = fontTools.version
+        run["fonts"] = fonts
+        runs.append(run)
+        saveHistory(args.history, runs)
+        print("Recorded in %s" % args.history)
+    print("Measured %d font(s) of %d family(ies) in %.2fs" %
+          (len(fonts), len(families), time.time() - start))
+    if found and args.strict:
+        sys.exit(1)
@@ -0,0 +1,672 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Build the font directories in parallel. The family targets of Makefile.in
+# run this script, each family being described by a declarative spec below,
+# the only place where its data lives. The build is split into tasks
+# (downloads, preparation of the family directory, compression of each font,
+# analysis of the math font) whose dependencies form a graph. Ready tasks are
+# run on a pool of worker threads, the slow steps being done in subprocesses.
+
+from __future__ import print_function
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from FontSources import fileDigest
+from fnmatch import fnmatch
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import zipfile
+
+kRootDirectory = os.path.dirname(os.path.abspath(__file__))
+kDefaultDownloadDirectory = os.path.join(kRootDirectory, ".cache",
+                                         "downloads")
+# SHA-256 of the downloads, by URL. Downloads whose URL is not pinned (null
+# or missing) are used with a warning, or refused with --require-pins, and
+# --update-lock records their SHA-256. Some URLs are not versioned (e.g.
+# xits.zip or Asana-Math.zip) so their pins must be refreshed with
+# --update-lock when upstream publishes a new release.
+kDefaultLockFile = os.path.join(kRootDirectory, "BuildFonts.lock.json")
+
+kOFLLicenseURL = "https://openfontlicense.org/documents/OFL.txt"
+kOFLFAQURL = "https://openfontlicense.org/documents/OFL-FAQ.txt"
+kOFLDownloads = [("OFL.txt", kOFLLicenseURL), ("OFL-FAQ.txt", kOFLFAQURL)]
+kOFLCopies = [("OFL.txt",), ("OFL-FAQ.txt",)]
+
+# Each family is described by:
+# - downloads: list of (name, url) of the files to download.
+# - copy: list of (download, member pattern, destination) of the files copied
+#   into the family directory. The member pattern selects files inside a zip
+#   download, with the wildcards of fnmatch applied to each path component; a
+#   leading "**/" matches members at any depth. Without member pattern, the
+#   download itself is copied. The destination defaults to the base name.
+# - ofl: for fonts distributed without a completed OFL, the (dates, copyright
+#   holder, reserved font name) to fill the OFL.txt template with.
+# - compress: patterns of the fonts of the family directory to compress.
+# - split: patterns of the fonts to compress, also split into chunks loaded
+#   on demand by the @font-face rules of the mathfonts.css of the family.
+# - remove: patterns of the files to remove after the compression.
+# - copyAfterCompress: same as copy, after the compression.
+# - check: the compressed math font to analyze.
+def family(aDownloads, aCopy, aCheck, aCompress=(), aRemove=(), aOFL=None,
+           aCopyAfterCompress=(), aSplit=()):
+    return {"downloads": list(aDownloads), "copy": list(aCopy),
+            "ofl": aOFL, "compress": list(aCompress), "split": list(aSplit),
+            "remove": list(aRemove),
+            "copyAfterCompress": list(aCopyAfterCompress), "check": aCheck}
+
+def texGyreFamily(aName, aPrefix, aFontsURL, aMathURL, aHistoryURL,
+                  aManifestURL, aReadmeURL, aJunkPaths=False):
+    # The TeX Gyre fonts and their math font are distributed by GUST.
+    fonts = "%s.zip" % aPrefix
+    math = "texgyre%s-math.zip" % aName.lower()
+    member = "**/%s" if aJunkPaths else "%s"
+    return family(
+        [(fonts, aFontsURL), (math, aMathURL),
+         ("%s-hist.txt" % aPrefix, aHistoryURL),
+         ("MANIFEST-TeX-Gyre-%s.TXT" % aName, aManifestURL),
+         ("README-TeX-Gyre-%s.TXT" % aName, aReadmeURL)],
+        [(fonts, member % "*.txt"), (fonts, member % "*.TXT"),
+         (fonts, member % "*.otf"),
+         (math, "**/*.txt"), (math, "**/*.TXT"), (math, "**/*.otf"),
+         ("%s-hist.txt" % aPrefix,), ("MANIFEST-TeX-Gyre-%s.TXT" % aName,),
+         ("README-TeX-Gyre-%s.TXT" % aName,)],
+        "texgyre%s-math.woff" % aName.lower(),
+        aCompress=["*.otf"], aRemove=["*.otf"])
+
+kGUSTFoundry = "http://www.gust.org.pl/projects/e-foundry"
+kNewComputerModernURL = "https://mirrors.ctan.org/fonts/newcomputermodern.zip"
+kGUSTFontLicenseURL = "http://tug.org/fonts/licenses/GUST-FONT-LICENSE.txt"
+kNewComputerModernFonts = ["NewCMMath-Book.otf", "NewCM10-Book.otf",
+                           "NewCM10-BookItalic.otf", "NewCM10-Bold.otf",
+                           "NewCM10-BoldItalic.otf"]
+kNotoSansURL = "https://cdn.jsdelivr.net/gh/notofonts/notofonts.github.io/fonts/NotoSans/full/otf"
+kNotoSansFonts = ["NotoSansMath-Regular.otf", "NotoSans-Regular.otf",
+                  "NotoSans-Italic.otf", "NotoSans-Bold.otf",
+                  "NotoSans-BoldItalic.otf"]
+kFiraMathGitHub = "https://raw.githubusercontent.com/firamath/firamath/main"
+kPlexURL = "https://github.com/IBM/plex/releases/download"
+kPlexSerifStyles = ["Regular", "Italic", "Bold", "BoldItalic"]
+kSTIXFonts = ["STIXTwoText-Regular", "STIXTwoText-Bold", "STIXTwoText-Italic",
+              "STIXTwoText-BoldItalic", "STIXTwoMath-Regular"]
+kDejaVuVersion = "2.36"
+kDejaVuDirectory = "dejavu-fonts-ttf-%s" % kDejaVuVersion
+kLibertinusFonts = ["libertinusmath-regular.otf",
+                    "libertinusserif-regular.otf", "libertinusserif-bold.otf",
+                    "libertinusserif-italic.otf",
+                    "libertinusserif-bolditalic.otf"]
+kLatinModernURL = "%s/latin-modern/download" % kGUSTFoundry
+
+kFamilies = OrderedDict([
+    ("Asana", family(
+        [("Asana-Math.zip", "http://mirrors.ctan.org/fonts/Asana-Math.zip")] +
+        kOFLDownloads,
+        [("Asana-Math.zip", "Asana-Math/*")] + kOFLCopies,
+        "Asana-Math.woff",
+        aCompress=["Asana-Math.otf"], aRemove=["*.TTC", "*.otf"],
+        aOFL=("2007-2015", "Apostolos Syropoulos", "Asana Math"))),
+    ("DejaVu", family(
+        [("%s.zip" % kDejaVuDirectory, "http://sourceforge.net/projects/dejavu/files/dejavu/%s/%s.zip" % (kDejaVuVersion, kDejaVuDirectory))],
+        [("%s.zip" % kDejaVuDirectory, "%s/%s" % (kDejaVuDirectory, name))
+         for name in ["AUTHORS", "LICENSE", "README.md", "NEWS",
+                      "ttf/DejaVuSerif.ttf", "ttf/DejaVuSerif-Bold.ttf",
+                      "ttf/DejaVuSerif-Italic.ttf",
+                      "ttf/DejaVuSerif-BoldItalic.ttf",
+                      "ttf/DejaVuMathTeXGyre.ttf"]],
+        "DejaVuMathTeXGyre.woff",
+        aCompress=["*.ttf"], aRemove=["*.ttf"])),
+    ("Euler", family(
+        [("euler-math.zip", "http://mirrors.ctan.org/fonts/euler-math.zip")] +
+        kOFLDownloads,
+        [("euler-math.zip", "euler-math/*.otf")] + kOFLCopies,
+        "Euler-Math.woff",
+        aCompress=["Euler-Math.otf"], aRemove=["*.otf"],
+        aOFL=("2024", "Daniel Flipo", "Euler Math"))),
+    ("FiraMath", family(
+        [("LICENSE", "%s/LICENSE" % kFiraMathGitHub),
+         ("README.md", "%s/README.md" % kFiraMathGitHub),
+         ("FiraMath-Regular.otf", "https://github.com/firamath/firamath/releases/download/v0.3.4/FiraMath-Regular.otf")],
+        [("LICENSE",), ("README.md",), ("FiraMath-Regular.otf",)],
+        "FiraMath-Regular.woff",
+        aCompress=["*.otf"], aRemove=["*.otf"])),
+    ("Garamond", family(
+        [("garamond.zip", "https://bitbucket.org/georgd/eb-garamond/downloads/EBGaramond-0.016.zip"),
+         ("garamond-math.zip", "https://mirrors.ctan.org/fonts/garamond-math.zip")],
+        [("garamond.zip", "**/COPYING", "Garamond-COPYING"),
+         ("garamond.zip", "**/README.markdown", "Garamond-README"),
+         ("garamond-math.zip", "**/README.md", "GaramondMath-README"),
+         ("garamond.zip", "**/EBGaramond12-Regular.otf"),
+         ("garamond.zip", "**/EBGaramond12-Italic.otf"),
+         ("garamond-math.zip", "**/Garamond-Math.otf")],
+        "Garamond-Math.woff",
+        aCompress=["*.otf"], aRemove=["*.otf"])),
+    ("GFS_NeoHellenic", family(
+        [("GFS_NeoHellenic.zip", "https://greekfontsociety-gfs.gr/_assets/fonts/GFS_NeoHellenic.zip"),
+         ("GFS_NeoHellenic_Math.zip", "https://greekfontsociety-gfs.gr/_assets/fonts/GFS_NeoHellenic_Math.zip")],
+        [("GFS_NeoHellenic.zip", "**/OFL-FAQ.txt"),
+         ("GFS_NeoHellenic.zip", "**/OFL.txt"),
+         ("GFS_NeoHellenic.zip", "**/README"),
+         ("GFS_NeoHellenic.zip", "**/GFSNeohellenicBoldIt.otf"),
+         ("GFS_NeoHellenic.zip", "**/GFSNeohellenicBold.otf"),
+         ("GFS_NeoHellenic.zip", "**/GFSNeohellenicIt.otf"),
+         ("GFS_NeoHellenic.zip", "**/GFSNeohellenic.otf"),
+         ("GFS_NeoHellenic_Math.zip", "**/GFSNeohellenicMath.otf")],
+        "GFSNeohellenicMath.woff",
+        aCompress=["*.otf"], aRemove=["*.otf"])),
+    ("LatinModern", family(
+        [("lm2.004otf.zip", "%s/lm2.004otf.zip" % kLatinModernURL),
+         ("lm-hist.txt", "%s/lm-hist.txt/at_download/file" % kLatinModernURL),
+         ("MANIFEST-Latin-Modern.TXT", "%s/manifest-latin-modern.txt/at_download/file" % kLatinModernURL),
+         ("README-Latin-Modern.TXT", "%s/readme-latin-modern.txt/at_download/file" % kLatinModernURL),
+         ("latinmodern-math.zip", "%s/lm-math/download/latinmodern-math-1959.zip" % kGUSTFoundry)],
+        [("lm2.004otf.zip", "*.txt"), ("lm2.004otf.zip", "*.TXT"),
+         ("lm2.004otf.zip", "lmroman12*.otf"),
+         ("lm-hist.txt",), ("MANIFEST-Latin-Modern.TXT",),
+         ("README-Latin-Modern.TXT",),
+         ("latinmodern-math.zip", "**/*.txt"),
+         ("latinmodern-math.zip", "**/*.TXT"),
+         ("latinmodern-math.zip", "**/latinmodern-math.otf")],
+        "latinmodern-math.woff",
+        aCompress=["*.otf"], aRemove=["*.otf"])),
+    ("LeteSansMath", family(
+        [("lete-sans-math.zip", "http://mirrors.ctan.org/fonts/lete-sans-math.zip")] +
+        kOFLDownloads,
+        [("lete-sans-math.zip", "lete-sans-math/*.otf")] + kOFLCopies,
+        "LeteSansMath.woff",
+        aCompress=["LeteSansMath.otf", "LeteSansMath-Bold.otf"],
+        aRemove=["*.otf"],
+        aOFL=("2024", "Chenjing Bu, Daniel Flipo", "Lete Sans Math"))),
+    ("Libertinus", family(
+        [("libertinus.zip", "https://github.com/khaledhosny/libertinus/releases/download/v6.2/libertinus-6.2.zip")],
+        [("libertinus.zip", "*/*.txt")] +
+        [("libertinus.zip", "*/%s" % font) for font in kLibertinusFonts],
+        "libertinusmath-regular.woff",
+        aCompress=kLibertinusFonts, aRemove=["*.otf"])),
+    ("Luciole", family(
+        [("luciole.zip", "https://mirrors.ctan.org/fonts/luciole.zip")] +
+        kOFLDownloads +
+        [("CC-BY.txt", "https://creativecommons.org/licenses/by/4.0/legalcode.txt")],
+        [("luciole.zip", "luciole/%s" % name)
+         for name in ["README.md", "Luciole-Regular.ttf", "Luciole-Bold.ttf",
+                      "Luciole-Regular-Italic.ttf", "Luciole-Bold-Italic.ttf",
+                      "Luciole-Math.otf", "Luciole-Math-Bold.otf"]] +
+        kOFLCopies + [("CC-BY.txt",)],
+        "Luciole-Math.woff",
+        aCompress=["*.ttf", "*.otf"], aRemove=["*.ttf", "*.otf"],
+        aOFL=("2024-2025",
+              "Laurent Bourcellier, Jonathan Fabreguettes, Daniel Flipo",
+              "Luciole Math"))),
+    ("NewComputerModern", family(
+        [("newcomputermodern.zip", kNewComputerModernURL),
+         ("GUST-FONT-LICENSE.txt", kGUSTFontLicenseURL)],
+        [("newcomputermodern.zip", "newcomputermodern/otf/%s" % font)
+         for font in kNewComputerModernFonts] +
+        [("GUST-FONT-LICENSE.txt",)],
+        "NewCMMath-Book.woff",
+        aCompress=kNewComputerModernFonts, aRemove=kNewComputerModernFonts)),
+    ("NewComputerModernSans", family(
+        [("newcomputermodern.zip", kNewComputerModernURL),
+         ("GUST-FONT-LICENSE.txt", kGUSTFontLicenseURL)],
+        [("newcomputermodern.zip",
+          "newcomputermodern/otf/NewCMSansMath-Regular.otf"),
+         ("GUST-FONT-LICENSE.txt",)],
+        "NewCMSansMath-Regular.woff",
+        aCompress=["NewCMSansMath-Regular.otf"],
+        aRemove=["NewCMSansMath-Regular.otf"])),
+    ("NotoSans", family(
+        [("NotoSansMath-Regular.otf", "https://notofonts.github.io/math/fonts/NotoSansMath/full/otf/NotoSansMath-Regular.otf"),
+         ("LICENSE", "https://raw.githubusercontent.com/notofonts/notofonts.github.io/refs/heads/main/fonts/LICENSE")] +
+        [(font, "%s/%s" % (kNotoSansURL, font))
+         for font in kNotoSansFonts[1:]],
+        [(font,) for font in kNotoSansFonts] + [("LICENSE",)],
+        "NotoSansMath-Regular.woff",
+        aCompress=kNotoSansFonts, aRemove=kNotoSansFonts)),
+    ("Plex", family(
+        [("ibm-plex-math.zip", "%s/%%40ibm%%2Fplex-math%%401.1.0/ibm-plex-math.zip" % kPlexURL),
+         ("ibm-plex-serif.zip", "%s/%%40ibm%%2Fplex-serif%%401.1.0/ibm-plex-serif.zip" % kPlexURL)],
+        [("ibm-plex-math.zip",
+          "ibm-plex-math/fonts/complete/woff2/IBMPlexMath-Regular.woff2"),
+         ("ibm-plex-math.zip",
+          "ibm-plex-math/fonts/complete/woff/IBMPlexMath-Regular.woff"),
+         ("ibm-plex-math.zip", "ibm-plex-math/LICENSE.txt",
+          "license-ibm-plex-math.txt"),
+         ("ibm-plex-serif.zip", "ibm-plex-serif/LICENSE.txt",
+          "license-ibm-plex-serif.txt")] +
+        [("ibm-plex-serif.zip",
+          "ibm-plex-serif/fonts/complete/%s/IBMPlexSerif-%s.%s" %
+          (flavor, style, flavor))
+         for style in kPlexSerifStyles for flavor in ["woff", "woff2"]],
+        "IBMPlexMath-Regular.woff")),
+    ("STIX", family(
+        [("STIX.zip", "https://github.com/stipub/stixfonts/blob/master/zipfiles/STIX2_13-all.zip?raw=true")],
+        [("STIX.zip", "**/%s.otf" % font) for font in kSTIXFonts],
+        "STIXTwoMath-Regular.woff",
+        aCompress=["*.otf"], aRemove=["*.otf", "*.woff2"],
+        # Keep the upstream WOFF2 fonts.
+        aCopyAfterCompress=[("STIX.zip", "**/%s.woff2" % font)
+                            for font in kSTIXFonts])),
+    ("TeXGyreBonum", texGyreFamily(
+        "Bonum", "qbk",
+        "%s/tex-gyre/bonum/qbk2.004otf.zip" % kGUSTFoundry,
+        "%s/tg-math/download/texgyrebonum-math-1005.zip" % kGUSTFoundry,
+        "%s/tex-gyre/bonum/qbk-hist.txt/at_download/file" % kGUSTFoundry,
+        "%s/tex-gyre/bonum/manifest-tex-gyre-bonum.txt/at_download/file" % kGUSTFoundry,
+        "%s/tex-gyre/bonum/readme-tex-gyre-bonum.txt/at_download/file" % kGUSTFoundry)),
+    ("TeXGyrePagella", texGyreFamily(
+        "Pagella", "qpl",
+        "https://www.gust.org.pl/projects/e-foundry/tex-gyre/pagella/qpl2_501otf.zip",
+        "https://www.gust.org.pl/projects/e-foundry/tg-math/download/texgyrepagella-math-1632.zip",
+        "%s/tex-gyre/pagella/qpl-hist.txt/at_download/file" % kGUSTFoundry,
+        "https://www.gust.org.pl/projects/e-foundry/tex-gyre/pagella/MANIFEST-TeX-Gyre-Pagella.txt/at_download/file",
+        "https://www.gust.org.pl/projects/e-foundry/tex-gyre/pagella/README-TeX-Gyre-Pagella.txt/at_download/file",
+        aJunkPaths=True)),
+    ("TeXGyreSchola", texGyreFamily(
+        "Schola", "qcs",
+        "%s/tex-gyre/schola/qcs2.005otf.zip" % kGUSTFoundry,
+        "%s/tg-math/download/texgyreschola-math-1533.zip" % kGUSTFoundry,
+        "%s/tex-gyre/schola/qcs-hist.txt/at_download/file" % kGUSTFoundry,
+        "%s/tex-gyre/schola/manifest-tex-gyre-schola.txt/at_download/file" % kGUSTFoundry,
+        "%s/tex-gyre/schola/readme-tex-gyre-schola.txt/at_download/file" % kGUSTFoundry)),
+    ("TeXGyreTermes", texGyreFamily(
+        "Termes", "qtm",
+        "%s/tex-gyre/termes/qtm2.004otf.zip" % kGUSTFoundry,
+        "%s/tg-math/download/texgyretermes-math-1543.zip" % kGUSTFoundry,
+        "%s/tex-gyre/termes/qtm-hist.txt/at_download/file" % kGUSTFoundry,
+        "%s/tex-gyre/termes/manifest-tex-gyre-termes.txt/at_download/file" % kGUSTFoundry,
+        "%s/tex-gyre/termes/readme-tex-gyre-termes.txt/at_download/file" % kGUSTFoundry)),
+    ("XITS", family(
+        [("xits.zip", "http://mirrors.ctan.org/fonts/xits.zip")],
+        [("xits.zip", "xits/FONTLOG.txt"), ("xits.zip", "xits/OFL*.txt"),
+         ("xits.zip", "xits/README.txt"), ("xits.zip", "xits/*.otf")],
+        "XITSMath-Regular.woff",
+        aCompress=["*.otf"], aRemove=["*.otf"],
+        aSplit=["XITSMath-Regular.otf"])),
+])
+
+class Task:
+    # A step of the build. aFunction is called once all the dependencies
+    # succeeded. It returns the output to print and, optionally, new tasks
+    # to add to the graph (e.g. the compression of the fonts of a family,
+    # which are only known once its directory is prepared).
+    def __init__(self, aName, aFunction, aDependencies=()):
+        self.name = aName
+        self.function = aFunction
+        self.dependencies = list(aDependencies)
+
+class Scheduler:
+    # Run a graph of tasks on a bounded pool of worker threads.
+    def __init__(self, aJobs):
+        self.jobs = aJobs
+        self.tasks = OrderedDict()
+        self.done = set()
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def add(self, aTask):
+        if aTask.name not in self.tasks:
+            self.tasks[aTask.name] = aTask
+
+    def report(self, aTask, aStatus, aDuration, aOutput):
+        with self.lock:
+            print("[%d/%d] %s %s (%.2fs)" %
+                  (len(self.done) + len(self.failed), len(self.tasks),
+                   aTask.name, aStatus, aDuration))
+            if aOutput:
+                print(aOutput.rstrip("\n"))
+            sys.stdout.flush()
+
+    def run(self):
+        pending = set(self.tasks)
+        running = {}
+        with ThreadPoolExecutor(self.jobs) as executor:
+            while pending or running:
+                # Tasks depending on a failed task can never run.
+                for name in sorted(pending):
+                    if any(dependency in self.failed for dependency
+                           in self.tasks[name].dependencies):
+                        pending.discard(name)
+                        self.failed.add(name)
+                        self.report(self.tasks[name], "skipped", 0, None)
+                for name in [name for name in self.tasks if name in pending]:
+                    if len(running) >= self.jobs:
+                        break
+                    if all(dependency in self.done for dependency
+                           in self.tasks[name].dependencies):
+                        pending.discard(name)
+                        future = executor.submit(self.execute,
+                                                 self.tasks[name])
+                        running[future] = name
+                if not running:
+                    break
+                finished, unused = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = self.tasks[running.pop(future)]
+                    success, duration, output, newTasks = future.result()
+                    if success:
+                        self.done.add(task.name)
+                        for newTask in newTasks:
+                            if newTask.name not in self.tasks:
+                                self.add(newTask)
+                                pending.add(newTask.name)
+                    else:
+                        self.failed.add(task.name)
+                    self.report(task, "done" if success else "FAILED",
+                                duration, output)
+        # Tasks still pending depend, directly or not, on tasks that were
+        # never added to the graph.
+        for name in [name for name in self.tasks if name in pending]:
+            self.failed.add(name)
+            waiting = [dependency for dependency
+                       in self.tasks[name].dependencies
+                       if dependency not in self.done]
+            self.report(self.tasks[name], "blocked", 0,
+                        "Waiting for: %s" % ", ".join(waiting))
+        return not self.failed
+
+    def execute(self, aTask):
+        start = time.time()
+        try:
+            result = aTask.function()
+        except Exception as e:
+            return False, time.time() - start, "%s: %s" % \
+                (type(e).__name__, e), []
+        output, newTasks = result if isinstance(result, tuple) \
+            else (result, [])
+        return True, time.time() - start, output, newTasks
+
+def runScript(aArguments, aDirectory=kRootDirectory):
+    # Run one of the python scripts, raising an exception on failure.
+    process = subprocess.run([sys.executable] + aArguments, cwd=aDirectory,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             universal_newlines=True)
+    if process.returncode != 0:
+        raise RuntimeError("%s failed:\n%s" % (" ".join(aArguments),
+                                               process.stdout))
+    return process.stdout
+
+class DownloadStore:
+    # Content-addressed store of the downloads. A download is identified by
+    # its URL and the SHA-256 pinned in the lock file, so it is fetched at
+    # most once and always verified. In offline mode nothing is fetched and
+    # a mirror directory, containing files named after their SHA-256 or
+    # their download name, can stand in for the remote servers. Unpinned
+    # URLs are fetched with a warning, unless aRequirePins, and their SHA-256
+    # is only written to the lock file with aUpdateLock, which also replaces
+    # the pins that no longer match.
+    def __init__(self, aDirectory, aLockFile, aOffline=False, aMirror=None,
+                 aUpdateLock=False, aRequirePins=False):
+        self.directory = aDirectory
+        self.lockFile = aLockFile
+        self.offline = aOffline
+        self.mirror = aMirror
+        self.updateLock = aUpdateLock
+        self.requirePins = aRequirePins
+        self.lock = threading.Lock()
+        self.digests = {}
+        if os.path.isfile(aLockFile):
+            with open(aLockFile) as f:
+                self.digests = json.load(f)
+        # SHA-256 of the unpinned URLs downloaded during this run.
+        self.unpinned = {}
+
+    def pinned(self, aURL):
+        return self.digests.get(aURL) is not None
+
+    def path(self, aURL):
+        digest = self.digests.get(aURL) or self.unpinned[aURL]
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def record(self, aURL, aDigest):
+        with self.lock:
+            self.digests[aURL] = aDigest
+            self.unpinned.pop(aURL, None)
+            # Merge the pins recorded meanwhile by other processes, e.g.
+            # the families built by make -j.
+            digests = {}
+            if os.path.isfile(self.lockFile):
+                with open(self.lockFile) as f:
+                    digests = json.load(f)
+            digests[aURL] = aDigest
+            temporaryPath = "%s.%d.tmp" % (self.lockFile, os.getpid())
+            with open(temporaryPath, "w") as f:
+                json.dump(digests, f, indent=1, sort_keys=True)
+                f.write("\n")
+            os.replace(temporaryPath, self.lockFile)
+
+    def store(self, aURL, aSource, aDescription):
+        # Verify and add a file to the store, consuming aSource.
+        digest = fileDigest(aSource)
+        expected = self.digests.get(aURL)
+        if expected is not None and digest != expected and \
+           not self.updateLock:
+            os.remove(aSource)
+            raise RuntimeError("SHA-256 mismatch for %s: expected %s, got %s "
+                               "(if upstream published a new release, run "
+                               "BuildFonts.py --update-lock to refresh the "
+                               "pin)" % (aDescription, expected, digest))
+        path = os.path.join(self.directory, digest[:2], digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(aSource, path)
+        if self.updateLock and digest != expected:
+            self.record(aURL, digest)
+            return "Recorded SHA-256 %s for %s" % (digest, aURL)
+        if expected is None:
+            with self.lock:
+                self.unpinned[aURL] = digest
+            return "WARNING: %s is not pinned in %s (SHA-256 %s)" % \
+                (aURL, self.lockFile, digest)
+        return "Verified %s" % aDescription
+
+    def fetch(self, aURL, aName):
+        if not self.pinned(aURL) and self.requirePins and \
+           not self.updateLock:
+            raise RuntimeError("%s is not pinned in %s, run BuildFonts.py "
+                               "--update-lock to record its SHA-256" %
+                               (aURL, self.lockFile))
+        if self.pinned(aURL) and os.path.isfile(self.path(aURL)) and \
+           (self.offline or not self.updateLock):
+            return "Reusing %s" % aURL
+        temporaryPath = os.path.join(self.directory, "%s.%d.%d.tmp" %
+                                     (aName, os.getpid(),
+                                      threading.get_ident()))
+        os.makedirs(self.directory, exist_ok=True)
+        if self.mirror:
+            candidates = [os.path.join(self.mirror, aName)]
+            if self.pinned(aURL):
+                candidates.insert(0, os.path.join(self.mirror,
+                                                  self.digests[aURL]))
+            for candidate in candidates:
+                if os.path.isfile(candidate):
+                    shutil.copyfile(candidate, temporaryPath)
+                    return self.store(aURL, temporaryPath, candidate)
+        if self.offline:
+            raise RuntimeError("%s is not available offline" % aURL)
+        with urllib.request.urlopen(aURL) as response, \
+             open(temporaryPath, "wb") as f:
+            shutil.copyfileobj(response, f)
+        return self.store(aURL, temporaryPath, aURL)
+
+def matchMember(aName, aPattern):
+    # Match a zip member against a pattern, component by component.
+    if aPattern.startswith("**/"):
+        return fnmatch(os.path.basename(aName), aPattern[3:]) and \
+            not aName.endswith("/")
+    components = aName.split("/")
+    patterns = aPattern.split("/")
+    return (len(components) == len(patterns) and components[-1] != "" and
+            all(fnmatch(c, p) for c, p in zip(components, patterns)))
+
+def copyFiles(aDirectory, aStore, aDownloads, aCopies, aStreamed=()):
+    # Copy downloads or the zip members they contain into aDirectory. Only
+    # the members matching the patterns are extracted from the archives.
+    # Patterns with wildcards may match nothing, exact names may not.
+    # Members matching the aStreamed patterns are not extracted but returned
+    # as "archive!member" filenames, that compress-font.py reads directly.
+    copied = []
+    streamed = []
+    for copy in aCopies:
+        source = aStore.path(aDownloads[copy[0]])
+        pattern = copy[1] if len(copy) > 1 else None
+        destination = copy[2] if len(copy) > 2 else None
+        if pattern is None:
+            target = os.path.join(aDirectory, destination or copy[0])
+            shutil.copyfile(source, target)
+            copied.append(os.path.basename(target))
+            continue
+        found = False
+        with zipfile.ZipFile(source) as archive:
+            for name in archive.namelist():
+                if not matchMember(name, pattern):
+                    continue
+                found = True
+                if destination is None and \
+                   any(fnmatch(os.path.basename(name), streamedPattern)
+                       for streamedPattern in aStreamed):
+                    streamed.append("%s!%s" % (source, name))
+                    continue
+                target = os.path.join(aDirectory,
+                                      destination or os.path.basename(name))
+                with archive.open(name) as member, open(target, "wb") as f:
+                    shutil.copyfileobj(member, f)
+                copied.append(os.path.basename(target))
+        if not found and not any(c in pattern for c in "*?["):
+            raise RuntimeError("%s not found in %s" % (pattern, copy[0]))
+    return copied, streamed
+
+def fixOFL(aPath, aDates, aCopyrightHolder, aReservedFontName):
+    # Complete the copyright information of an OFL.txt template.
+    with open(aPath) as f:
+        lines = [line for line in f
+                 if "additional Copyright Holder>" not in line and
+                 "<additional Reserved Font Name>" not in line]
+    replacements = [("<dates>", aDates),
+                    ("<Copyright Holder>", aCopyrightHolder),
+                    (" (<URL|email>)", ""),
+                    ("<Reserved Font Name>", aReservedFontName)]
+    for old, new in replacements:
+        lines = [line.replace(old, new, 1) for line in lines]
+    with open(aPath, "w") as f:
+        f.write("".join(lines))
+
+def familyFiles(aDirectory, aPatterns):
+    files = []
+    for pattern in aPatterns:
+        for path in sorted(glob.glob(os.path.join(aDirectory, pattern))):
+            if os.path.basename(path) not in files:
+                files.append(os.path.basename(path))
+    return files
+
+def familyTasks(aName, aSpec, aStore, aArgs):
+    # The downloads and the preparation of a family directory. Preparing the
+    # directory adds the tasks compressing each font, then the task
+    # finishing the directory and analyzing the math font.
+    directory = os.path.join(kRootDirectory, aName)
+    downloads = OrderedDict(aSpec["downloads"])
+    downloadTasks = [Task("download %s" % url,
+                          lambda url=url, name=name: aStore.fetch(url, name))
+                     for name, url in aSpec["downloads"]]
+
+    def analyze():
+        return runScript(["AnalyzeFont.py", aName, aSpec["check"]] +
+                         (["--force"] if aArgs.force else []))
+
+    def finish():
+        for name in familyFiles(directory, aSpec["remove"]):
+            os.remove(os.path.join(directory, name))
+        copied, streamed = copyFiles(directory, aStore, downloads,
+                                     aSpec["copyAfterCompress"])
+        return ("Copied %s" % ", ".join(copied) if copied else None,
+                [Task("analyze %s" % aName, analyze,
+                      ["finish %s" % aName])])
+
+    def compress(aFont):
+        return runScript(["../compress-font.py", "--jobs", "1",
+                          "--profile", aArgs.profile, "--output-dir", ".",
+                          aFont], directory)
+
+    def split(aFonts):
+        # All the fonts are split by a single compress-font.py run, which
+        # updates the mathfonts.css of the family.
+        return runScript(["../compress-font.py", "--jobs", "1",
+                          "--profile", aArgs.profile, "--output-dir", ".",
+                          "--split"] + aFonts, directory)
+
+    def prepare():
+        # The fonts to compress are streamed from the archives, instead of
+        # being extracted into the family directory.
+        copied, streamed = copyFiles(directory, aStore, downloads,
+                                     aSpec["copy"], aSpec["compress"])
+        if aSpec["ofl"]:
+            fixOFL(os.path.join(directory, "OFL.txt"), *aSpec["ofl"])
+        fonts = familyFiles(directory, aSpec["compress"]) + streamed
+        compressTasks = [Task("compress %s/%s" %
+                              (aName, os.path.basename(font)),
+                              lambda font=font: compress(font),
+                              ["prepare %s" % aName])
+                         for font in fonts]
+        splitFonts = [font for font in fonts
+                      if any(fnmatch(os.path.basename(font), pattern)
+                             for pattern in aSpec["split"])]
+        if splitFonts:
+            compressTasks.append(Task("split %s" % aName,
+                                      lambda: split(splitFonts),
+                                      ["prepare %s" % aName]))
+        finishTask = Task("finish %s" % aName, finish,
+                          ["prepare %s" % aName] +
+                          [task.name for task in compressTasks])
+        return "Copied %s" % ", ".join(copied), compressTasks + [finishTask]
+
+    return downloadTasks + [Task("prepare %s" % aName, prepare,
+                                 [task.name for task in downloadTasks])]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download, convert and check the open source math fonts, running independent steps in parallel.")
+    parser.add_argument("families", type=str, nargs="*", metavar="family", help="Families to build (default: all of them).")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Maximum number of steps running at the same time (default: number of CPUs).")
+    parser.add_argument("--download-dir", type=str, default=kDefaultDownloadDirectory, help="Directory where the downloaded files are kept (default: %(default)s).")
+    parser.add_argument("--lock-file", type=str, default=kDefaultLockFile, help="JSON file pinning the SHA-256 of each download (default: %(default)s).")
+    parser.add_argument("--update-lock", action="store_true", help="Download the URLs again and record their SHA-256 in the lock file, replacing the pins that no longer match.")
+    parser.add_argument("--require-pins", action="store_true", help="Refuse the URLs that are not pinned in the lock file instead of warning about them.")
+    parser.add_argument("--offline", action="store_true", help="Never fetch anything, only use the downloads already stored or in the mirror directory.")
+    parser.add_argument("--mirror", type=str, help="Local directory to take the downloads from, before trying the network. Files are named after their SHA-256 or their download name.")
+    parser.add_argument("--profile", choices=["fast", "release"], default="release", help="Compression profile passed to compress-font.py (default: %(default)s).")
+    parser.add_argument("--force", action="store_true", help="Analyze the math fonts even if AnalyzeFont.py considers them up to date.")
+    parser.add_argument("--list", action="store_true", help="List the families and exit.")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(kFamilies))
+        sys.exit(0)
+    families = args.families or list(kFamilies)
+    for name in families:
+        if name not in kFamilies:
+            print("Unknown family %s!" % name, file=sys.stderr)
+            sys.exit(1)
+
+    start = time.time()
+    scheduler = Scheduler(max(1, args.jobs or 1))
+    store = DownloadStore(args.download_dir, args.lock_file, args.offline,
+                          args.mirror, args.update_lock, args.require_pins)
+    for name in families:
+        for task in familyTasks(name, kFamilies[name], store, args):
+            scheduler.add(task)
+    success = scheduler.run()
+    print("Built %d family(ies) with %d job(s) in %.2fs" %
+          (len(families), scheduler.jobs, time.time() - start))
+    if store.unpinned:
+        print("WARNING: %d download(s) not verified, run BuildFonts.py "
+              "--update-lock to pin them in %s:\n  %s" %
+              (len(store.unpinned), args.lock_file,
+               "\n  ".join(sorted(store.unpinned))), file=sys.stderr)
+    if not success:
+        print("Failed: %s" % ", ".join(sorted(scheduler.failed)),
+              file=sys.stderr)
+        sys.exit(1)
@@ -3,21 +3,33 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 from __future__ import print_function
+from GlyphIndex import GlyphIndex
+from MathStretchy import formatGaps, glyphIndexConstructions, kLargeOperators
+from collections import OrderedDict
+from contextlib import redirect_stderr, redirect_stdout
 from datetime import datetime
+from io import StringIO
 from math import sqrt
+import cProfile
 import fontforge
+import importlib.util
+import json
+import os
 import psMat
 import sys
+import tempfile
+import time
 import argparse
 
-# List op "largeop" operators. See http://www.w3.org/TR/MathML3/appendixc.html
-kLargeOperators = [0x220F, 0x2210, 0x2211, 0x222B, 0x222C, 0x222D, 0x222E,
-                   0x222F, 0x2230, 0x2231, 0x2232, 0x2233, 0x22C0, 0x22C1,
-                   0x22C2, 0x22C3, 0x2A00, 0x2A01, 0x2A02, 0x2A03, 0x2A04,
-                   0x2A05, 0x2A06, 0x2A07, 0x2A08, 0x2A09, 0x2A0A, 0x2A0B,
-                   0x2A0C, 0x2A0D, 0x2A0E, 0x2A0F, 0x2A10, 0x2A11, 0x2A12,
-                   0x2A13, 0x2A14, 0x2A15, 0x2A16, 0x2A17, 0x2A18, 0x2A19,
-                   0x2A1A, 0x2A1B, 0x2A1C, 0x2AFC, 0x2AFF]
+# compress-font.py can not be imported with a regular import statement.
+kCompressFontSpec = importlib.util.spec_from_file_location(
+    "compressFont", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "compress-font.py"))
+compressFont = importlib.util.module_from_spec(kCompressFontSpec)
+kCompressFontSpec.loader.exec_module(compressFont)
+
+kOutputFormats = ["woff", "woff2", "sfd"]
+
 kLargeOpMinDisplayOperatorFactor = 1.3
 kLargeOpDisplayOperatorFactor = sqrt(2)
 kLargeOpIntegrals = [0x222B, 0x222C, 0x222D, 0x222E, 0x222F, 0x2230, 0x2231,
@@ -782,6 +794,53 @@ mathvariantToBMP = [
     (0x1D7FE, 0x0038),
     (0x1D7FF, 0x0039)
 ]
+kMathvariantToBMP = dict(mathvariantToBMP)
+
+def mathvariantToBMPCodePoint(aCodePoint):
+    # Return the BMP code point corresponding to a math alphanumeric character
+    # or 0 if there is none.
+    return kMathvariantToBMP.get(aCodePoint, 0)
+
+def searchMathvariantToBMP(aCodePoint):
+    # The binary search in mathvariantToBMP that mathvariantToBMPCodePoint
+    # replaced, kept as a reference for --benchmark. The upper bound used to
+    # be len(mathvariantToBMP), which could index past the end of the list.
+    lo = 0
+    hi = len(mathvariantToBMP) - 1
+    while hi >= lo:
+        mid = (lo+hi)//2
+        if mathvariantToBMP[mid][0] == aCodePoint:
+            return mathvariantToBMP[mid][1]
+        elif mathvariantToBMP[mid][0] < aCodePoint: lo = mid + 1
+        else: hi = mid - 1
+    return 0
+
+def benchmarkMathvariantToBMP(aRepeat=200):
+    # Check that mathvariantToBMPCodePoint returns the same as the binary
+    # search for every entry of mathvariantToBMP and every code point from
+    # U+2000 to U+1EFFF, then time both on all the entries. Return whether
+    # they agree.
+    codePoints = sorted(set([u for u, _ in mathvariantToBMP] +
+                            list(range(0x2000, 0x1F000))))
+    mismatches = [u for u in codePoints if mathvariantToBMPCodePoint(u) !=
+                  searchMathvariantToBMP(u)]
+    for u in mismatches[:10]:
+        print("Mismatch for U+%04X: U+%04X instead of U+%04X" %
+              (u, mathvariantToBMPCodePoint(u), searchMathvariantToBMP(u)),
+              file=sys.stderr)
+    print("Compared %d code points (%d entries): %d mismatches" %
+          (len(codePoints), len(mathvariantToBMP), len(mismatches)))
+    durations = []
+    for lookup in [searchMathvariantToBMP, mathvariantToBMPCodePoint]:
+        start = time.time()
+        for i in range(aRepeat):
+            for u, _ in mathvariantToBMP:
+                lookup(u)
+        durations.append(time.time() - start)
+    print("Looked up the %d entries %d times: binary search %.3fs, "
+          "dictionary %.3fs" % (len(mathvariantToBMP), aRepeat,
+                                durations[0], durations[1]))
+    return not mismatches
 
 # List of Unicode Constructions
 # Based on https://mxr.mozilla.org/mozilla-central/source/layout/mathml/mathfontUnicode.properties
@@ -844,6 +903,78 @@ kUnicodeConstructions = [
     (0x2950, False, None, ((0x21BD, 0), (0x23AF, 1), (0x21C1, 0))), # LEFT BARB DOWN RIGHT BARB DOWN HARPOON
 ]
 
+class CheckResults:
+    # Machine-readable results of the checks: one record per check, with the
+    # check id, the code point or glyph name, the status ("pass", "fail" or
+    # "fixed" when a patch was recorded for it), the severity ("info",
+    # "warning" or "error"), the measured and suggested values and a message.
+    def __init__(self):
+        self.records = []
+
+    def add(self, aCheck, aStatus, aSeverity=None, aCodePoint=None,
+            aGlyphName=None, aValue=None, aSuggestedValue=None, aMessage=None):
+        if aSeverity is None:
+            aSeverity = "info" if aStatus == "pass" else "warning"
+        record = OrderedDict()
+        record["check"] = aCheck
+        record["codePoint"] = \
+            None if aCodePoint is None else "U+%04X" % aCodePoint
+        record["glyph"] = aGlyphName
+        record["status"] = aStatus
+        record["severity"] = aSeverity
+        record["value"] = aValue
+        record["suggestedValue"] = aSuggestedValue
+        record["message"] = aMessage
+        self.records.append(record)
+
+    def write(self, aFile, aFormat):
+        if aFormat == "json":
+            aFile.write(json.dumps(self.records, indent=1))
+            aFile.write("\n")
+        else:
+            aFile.write("".join("%s\n" % json.dumps(record)
+                                for record in self.records))
+
+class PhaseTimer:
+    # Durations of the named phases of a check (opening the font, each group
+    # of tests, saving...), reported on stderr with --timings so that the
+    # logs do not change from one run to another.
+    def __init__(self):
+        self.durations = OrderedDict()
+        self.phase = None
+        self.start = None
+
+    def begin(self, aPhase):
+        # Start a phase, ending the current one.
+        self.end()
+        self.phase = aPhase
+        self.start = time.time()
+
+    def end(self):
+        if self.phase is not None:
+            self.durations[self.phase] = self.durations.get(self.phase, 0) + \
+                time.time() - self.start
+            self.phase = None
+
+    def report(self):
+        self.end()
+        print("Phase durations:", file=sys.stderr)
+        for phase, duration in self.durations.items():
+            print("  %s: %.3fs" % (phase, duration), file=sys.stderr)
+        print("  total: %.3fs" % sum(self.durations.values()),
+              file=sys.stderr)
+
+def runProfiled(aPath, aFunction, *aArguments):
+    # Call aFunction, writing cProfile statistics into aPath if specified.
+    # They can be read with the pstats module or tools like snakeviz.
+    if not aPath:
+        return aFunction(*aArguments)
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(aFunction, *aArguments)
+    finally:
+        profile.dump_stats(aPath)
+
 def warnMissingGlyph(aCodePoint):
     if aCodePoint < 0x7F:
         print("Warning: Missing glyph for ASCII character '%s' (U+%02X)!" %
@@ -852,39 +983,245 @@ def warnMissingGlyph(aCodePoint):
         print("Warning: Missing glyph for Unicode character U+%06X!" %
               aCodePoint, file=sys.stderr)
 
-def testSSTY(aFont, aCodePoint):
+def testSSTY(aIndex, aResults, aCodePoint):
     print("Testing ssty for U+%04X... " % aCodePoint, end="")
-    for table in aFont[aCodePoint].getPosSub("*"):
+    for table in aIndex[aCodePoint].getPosSub("*"):
         if table[0].find("ssty") > 0:
             print("Done")
+            aResults.add("ssty", "pass", aCodePoint=aCodePoint)
             return
     print("Warning: Missing ssty table for prescripted operator U+%02X!" %
           aCodePoint, file=sys.stderr)
     print("Failed")
+    aResults.add("ssty", "fail", aCodePoint=aCodePoint,
+                 aMessage="Missing ssty table for prescripted operator")
 
-def testItalicCorrection(aGlyph):
+def testItalicCorrection(aResults, aCodePoint, aGlyph):
     print("Testing italic correction for glyph '%s'... " % aGlyph.glyphname,
           end="")
     if aGlyph.italicCorrection == fontforge.unspecifiedMathValue:
         print("Failed")
         print("Warning: Missing italic correction for glyph '%s'!" %
               aGlyph.glyphname, file=sys.stderr)
+        aResults.add("integral-italic-correction", "fail",
+                     aCodePoint=aCodePoint, aGlyphName=aGlyph.glyphname,
+                     aMessage="Missing italic correction")
         return
     if not (aGlyph.italicCorrection > 0):
         print("Failed")
         print("Warning: Italic correction for glyph '%s' is not positive!" %
               aGlyph.glyphname, file=sys.stderr)
+        aResults.add("integral-italic-correction", "fail",
+                     aCodePoint=aCodePoint, aGlyphName=aGlyph.glyphname,
+                     aValue=aGlyph.italicCorrection,
+                     aMessage="Italic correction is not positive")
         return
     print("Done")
-
-def testMathVariants(aFont, aVariantName, aRanges, aFallbackFont=None):
-    # Open fallback font file, if specified.
-    fallbackFont = None
-    if aFallbackFont is not None:
+    aResults.add("integral-italic-correction", "pass", aCodePoint=aCodePoint,
+                 aGlyphName=aGlyph.glyphname, aValue=aGlyph.italicCorrection)
+
+class FallbackFontPool:
+    # Fonts passed via --bold, --italic etc. Each distinct file is opened only
+    # once for the whole run, and the glyphs missing from the checked font are
+    # all copied at the end, with as few clipboard operations as possible.
+    def __init__(self):
+        self.fonts = {}
+        self.copies = {}
+
+    def get(self, aPath):
+        # Return the (font, glyph index) pair for aPath, or None if it can not
+        # be opened.
+        if aPath not in self.fonts:
+            try:
+                font = fontforge.open(aPath)
+                self.fonts[aPath] = (font, GlyphIndex(font))
+            except EnvironmentError:
+                self.fonts[aPath] = None
+        return self.fonts[aPath]
+
+    def requestCopy(self, aPath, aCodePoint, aFallbackCodePoint):
+        self.copies.setdefault(aPath, []).append((aCodePoint,
+                                                  aFallbackCodePoint))
+
+    def copyGlyphs(self, aFont, aIndex):
+        for path, copies in self.copies.items():
+            fallbackFont = self.fonts[path][0]
+            # FontForge copies and pastes the selected glyphs in encoding
+            # order, so split the copies into batches where both the target
+            # and the source code points are increasing.
+            batches = []
+            for u, v in sorted(copies):
+                for batch in batches:
+                    if batch[-1][1] < v:
+                        batch.append((u, v))
+                        break
+                else:
+                    batches.append([(u, v)])
+            print("Copying %d glyphs from fallback font %s... " %
+                  (len(copies), path), end="")
+            for batch in batches:
+                fallbackFont.selection.select(*[v for (u, v) in batch])
+                fallbackFont.copy()
+                aFont.selection.select(*[u for (u, v) in batch])
+                aFont.paste()
+                for u, v in batch:
+                    aIndex.update(aFont[u])
+            print("Done")
+            print("")
+        self.copies = {}
+
+    def close(self):
+        for entry in self.fonts.values():
+            if entry is not None:
+                entry[0].close()
+        self.fonts = {}
+
+class FontPatches:
+    # The fixes found by the checks, as a list of JSON-serializable patches
+    # {"op": operation, ...}. The checks only record them and they are all
+    # applied at the end, in the order they were recorded. The list can be
+    # saved with --patches and replayed on another version of the font with
+    # --replay, without running the checks again.
+    def __init__(self, aPatches=None):
+        self.patches = list(aPatches or [])
+
+    def add(self, aOperation, **aArguments):
+        patch = OrderedDict([("op", aOperation)])
+        for name in sorted(aArguments):
+            patch[name] = aArguments[name]
+        self.patches.append(patch)
+
+    def mathConstant(self, aFont, aName):
+        # The value of a MathConstant once the patches are applied.
+        for patch in reversed(self.patches):
+            if patch["op"] == "setMathConstant" and patch["name"] == aName:
+                return patch["value"]
+        return getattr(aFont.math, aName)
+
+    def variants(self, aIndex, aGlyphName, aVertical):
+        # The variants of a glyph once the patches are applied.
+        for patch in reversed(self.patches):
+            if patch["op"] == "setVariants" and \
+               patch["glyph"] == aGlyphName and patch["vertical"] == aVertical:
+                return patch["variants"]
+        return aIndex.variants(aGlyphName, aVertical)
+
+    def write(self, aPath):
+        temporaryPath = "%s.%d.tmp" % (aPath, os.getpid())
+        with open(temporaryPath, "w") as f:
+            f.write(json.dumps(self.patches, indent=1))
+            f.write("\n")
+        os.replace(temporaryPath, aPath)
+
+    @staticmethod
+    def read(aPath):
+        with open(aPath) as f:
+            return FontPatches(json.load(f, object_pairs_hook=OrderedDict))
+
+    def apply(self, aFont, aIndex, aFallbackFonts):
+        # Apply all the patches to the font, keeping its glyph index
+        # up-to-date. Return the number of patches that could not be applied,
+        # e.g. because a glyph is missing from the font they are replayed on.
+        failures = 0
+        for patch in self.patches:
+            operation = patch["op"]
+            if operation == "createMathTable":
+                # Dummy read operation to force the creation of the table.
+                aFont.math.ScriptPercentScaleDown
+            elif operation == "setMathConstant":
+                setattr(aFont.math, patch["name"], patch["value"])
+            elif operation in ["setVariants", "setComponents", "scaleGlyph"]:
+                if patch.get("source", patch["glyph"]) not in aIndex:
+                    print("Warning: glyph '%s' not found, skipping %s patch!" %
+                          (patch.get("source", patch["glyph"]), operation),
+                          file=sys.stderr)
+                    failures += 1
+                elif operation == "scaleGlyph":
+                    # Add a scaled copy of the source glyph.
+                    g = aFont.createChar(-1, patch["glyph"])
+                    aFont.selection.select(patch["source"])
+                    aFont.copy()
+                    aFont.selection.select(patch["glyph"])
+                    aFont.paste()
+                    g.transform(psMat.scale(patch["scale"]), ("round",))
+                    aIndex.update(g)
+                else:
+                    glyph = aIndex[patch["glyph"]]
+                    direction = "vertical" if patch["vertical"] \
+                        else "horizontal"
+                    if operation == "setVariants":
+                        setattr(glyph, "%sVariants" % direction,
+                                patch["variants"])
+                    else:
+                        # Note: this makes FontForge crash.
+                        # See https://github.com/fontforge/fontforge/pull/2225
+                        setattr(glyph, "%sComponents" % direction,
+                                tuple(tuple(c) for c in patch["components"]))
+                    aIndex.update(glyph)
+            elif operation == "copyGlyph":
+                fallback = aFallbackFonts.get(patch["font"])
+                if fallback is None or \
+                   patch["fallbackCodePoint"] not in fallback[1]:
+                    print("Warning: U+%04X not found in %s, skipping copyGlyph patch!" %
+                          (patch["fallbackCodePoint"], patch["font"]),
+                          file=sys.stderr)
+                    failures += 1
+                else:
+                    aFallbackFonts.requestCopy(patch["font"],
+                                               patch["codePoint"],
+                                               patch["fallbackCodePoint"])
+            else:
+                print("Warning: unknown patch operation %s!" % operation,
+                      file=sys.stderr)
+                failures += 1
+        # The glyphs of the fallback fonts are copied in as few clipboard
+        # operations as possible.
+        aFallbackFonts.copyGlyphs(aFont, aIndex)
+        return failures
+
+def generateSfnt(aFont, aPath):
+    # Generate an OpenType font with fontforge. TrueType outlines are kept,
+    # other fonts get CFF outlines.
+    extension = ".ttf" if getattr(aFont, "is_quadratic", False) else ".otf"
+    path = "%s%s" % (aPath, extension)
+    aFont.generate(path)
+    return path
+
+def saveFont(aFont, aInput, aFormat):
+    # Save the patched font as <input>.fixed.<format>. WOFF and WOFF2 fonts
+    # are compressed like compress-font.py does, from an sfnt font generated
+    # into a temporary directory, so no SFD file or external tool is needed.
+    output = "%s.fixed.%s" % (aInput, aFormat)
+    print("Saving file %s... " % output, end="")
+    if aFormat == "sfd":
+        aFont.save(output)
+    else:
+        temporaryDirectory = tempfile.mkdtemp()
         try:
-            fallbackFont = fontforge.open(aFallbackFont)
-        except EnvironmentError:
-            None
+            sfntPath = generateSfnt(aFont, os.path.join(temporaryDirectory,
+                                                        "fixed"))
+            sfntVersion, tables = compressFont.compileTables(sfntPath)
+        finally:
+            for name in os.listdir(temporaryDirectory):
+                os.remove(os.path.join(temporaryDirectory, name))
+            os.rmdir(temporaryDirectory)
+        compressFont.applyProfile(compressFont.kDefaultProfile)
+        temporaryPath = "%s.%d.tmp" % (output, os.getpid())
+        with open(temporaryPath, "wb") as f:
+            compressFont.writeFont(f, aFormat, sfntVersion, tables)
+        os.replace(temporaryPath, output)
+    print("Done")
+    print("")
+    return output
+
+def testMathVariants(aIndex, aResults, aPatches, aFallbackFonts, aVariantName,
+                     aRanges, aFallbackFont=None, aTimer=None):
+    if aTimer:
+        aTimer.begin("mathvariant %s" % aVariantName)
+    # Get the fallback font, if specified.
+    fallback = None
+    if aFallbackFont is not None:
+        fallback = aFallbackFonts.get(aFallbackFont)
 
     print("Testing %s mathvariants..." % aVariantName)
     for r in aRanges:
@@ -895,93 +1232,114 @@ def testMathVariants(aFont, aVariantName, aRanges, aFallbackFont=None):
             upper = lower
         for u in range(lower,upper+1):
             print("Testing mathvariant U+%04X... " % u, end="")
-            if u not in aFont:
+            check = "mathvariant-%s" % aVariantName
+            if u not in aIndex:
                 print("Failed")
                 warnMissingGlyph(u)
-                if fallbackFont:
-                    # binary search in mathvariantToBMP
-                    v = 0
-                    lo = 0
-                    hi = len(mathvariantToBMP)
-                    while hi >= lo:
-                        mid = (lo+hi)//2
-                        if mathvariantToBMP[mid][0] == u:
-                            v = mathvariantToBMP[mid][1]
-                            break
-                        elif mathvariantToBMP[mid][0] < u: lo = mid + 1
-                        else: hi = mid - 1
-                    if v > 0 and v in fallbackFont:
-                        print("Copying U+%04X from fallback font..." % u,
-                              end="")
-                        fallbackFont.selection.select(v)
-                        fallbackFont.copy()
-                        aFont.selection.select(u)
-                        aFont.paste()
-                        print("Done")
+                if fallback:
+                    v = mathvariantToBMPCodePoint(u)
+                    if v > 0 and v in fallback[1]:
+                        print("U+%04X will be copied from fallback font" % u)
+                        aPatches.add("copyGlyph", font=aFallbackFont,
+                                     codePoint=u, fallbackCodePoint=v)
+                        aResults.add(check, "fixed", aCodePoint=u,
+                                     aSuggestedValue="U+%04X" % v,
+                                     aMessage="Copied from %s" %
+                                     aFallbackFont)
+                        continue
+                aResults.add(check, "fail", aCodePoint=u,
+                             aMessage="Missing glyph")
             else:
                 print("Done")
+                aResults.add(check, "pass", aCodePoint=u)
     print("")
 
-    # close fallback font
-    if fallbackFont is not None:
-        fallbackFont.close()
-
-def main(aArgs):
-
-    ############################################################################
-    # Open the font
-    print("Opening file %s... " % aArgs.input, end="")
-    try:
-        font = fontforge.open(aArgs.input)
-    except EnvironmentError:
-        print("Failed!")
-        exit(1)
-    print("Done")
+def applyPatches(aFont, aIndex, aPatches, aFallbackFonts):
+    print("Applying %d patches..." % len(aPatches.patches))
+    failures = aPatches.apply(aFont, aIndex, aFallbackFonts)
+    aFallbackFonts.close()
+    if failures:
+        print("Failed to apply %d patches" % failures)
     print("")
-
+    return failures
+
+def checkFont(aFont, aArgs, aIndex=None, aResults=None, aTimer=None):
+    # Run all the checks on an opened font, recording patches to fix it when
+    # possible. They are applied at the end, before the verifications that
+    # depend on them. The results are also recorded into aResults, if
+    # specified. The duration of each phase is recorded into aTimer, if
+    # specified, or printed with --timings.
+    font = aFont
+    timer = aTimer
+    if timer is None:
+        timer = PhaseTimer()
+    index = aIndex
+    if index is None:
+        timer.begin("index")
+        index = GlyphIndex(font)
+    results = aResults
+    if results is None:
+        results = CheckResults()
+    patches = FontPatches()
     tolerance = font.em / 50
 
     ############################################################################
     # Ensure that the font has glyphs for all the ASCII characters.
+    timer.begin("Basic Latin")
     print("Testing Basic Latin Unicode Block... ")
     for u in range(0x20, 0x7F):
         print("Testing U+%2X... " % u, end="")
-        if u not in font:
+        if u not in index:
             print("Failed")
             warnMissingGlyph(u)
+            results.add("basic-latin", "fail", aCodePoint=u,
+                        aMessage="Missing glyph")
         else:
             print("Done")
+            results.add("basic-latin", "pass", aCodePoint=u)
     print("")
 
     ############################################################################
     # Test the "use typo metrics" bit
+    timer.begin("OS/2")
     print("Testing OS/2 version... ", end="")
     if font.os2_version and font.os2_version < 4:
         print("Failed")
         print("Warning: OS/2 version does not support USE_TYPO_METRICS!",
               file=sys.stderr)
+        results.add("os2-version", "fail", aValue=font.os2_version,
+                    aSuggestedValue=4,
+                    aMessage="OS/2 version does not support USE_TYPO_METRICS")
     else:
         print("Done")
+        results.add("os2-version", "pass", aValue=font.os2_version)
 
     print("Testing USE_TYPO_METRICS... ", end="")
     if not font.os2_use_typo_metrics:
         print("Failed")
         print("Warning: USE_TYPO_METRICS set to false in the OS/2 table!",
               file=sys.stderr)
+        results.add("use-typo-metrics", "fail", aValue=False,
+                    aSuggestedValue=True,
+                    aMessage="USE_TYPO_METRICS set to false in the OS/2 table")
     else:
         print("Done")
+        results.add("use-typo-metrics", "pass", aValue=True)
     print("")
 
     ############################################################################
     # Ensure that the MathConstants table exists.
+    timer.begin("MathConstants")
     print("Testing MathConstants table... ", end="")
     if not font.math.exists():
         print("Not found!")
         print("Creating a new MathConstants table... Done")
-        # Dummy read operation to force the creation of the table.
-        font.math.ScriptPercentScaleDown
+        patches.add("createMathTable")
+        results.add("math-constants-table", "fixed", "error",
+                    aMessage="Missing MathConstants table")
     else:
         print("Done")
+        results.add("math-constants-table", "pass")
     print("")
 
     # ScriptPercentScaleDown
@@ -997,27 +1355,44 @@ def main(aArgs):
     print("Testing DisplayOperatorMinHeight... ")
     if font.math.DisplayOperatorMinHeight == 0:
         print("Error: DisplayOperatorMinHeight is set to 0!", file=sys.stderr)
-        if 0x4F in font:
+        suggestedValue = None
+        if 0x4F in index:
             # use the height of the letter 'O'
-            box = font[0x4F].boundingBox()
-            suggestedValue = (box[3] - box[1]) * \
+            suggestedValue = index.height(0x4F) * \
                              kLargeOpMinDisplayOperatorFactor
             print("Setting DisplayOperatorMinHeight to %d." % suggestedValue)
-            font.math.DisplayOperatorMinHeight = suggestedValue
+            patches.add("setMathConstant", name="DisplayOperatorMinHeight",
+                        value=suggestedValue)
+        results.add("display-operator-min-height",
+                    "fail" if suggestedValue is None else "fixed", "error",
+                    aValue=0, aSuggestedValue=suggestedValue,
+                    aMessage="DisplayOperatorMinHeight is set to 0")
+    else:
+        results.add("display-operator-min-height", "pass",
+                    aValue=font.math.DisplayOperatorMinHeight)
+    displayOperatorMinHeight = \
+        patches.mathConstant(font, "DisplayOperatorMinHeight")
     for c in kLargeOperators:
         # Verify that the DisplayOperatorMinHeight ensure that the size of
         # operator will really be increased in display mode.
-        if c not in font:
+        if c not in index:
             continue
         print("Testing large operator U+%04X... " % c, end="")
-        glyph = font[c]
-        box = glyph.boundingBox()
-        baseHeight = box[3] - box[1]
+        baseHeight = index.height(c)
         print("Done")
-        if (font.math.DisplayOperatorMinHeight <
+        if (displayOperatorMinHeight <
             kLargeOpMinDisplayOperatorFactor * baseHeight):
             print("Warning: DisplayOperatorMinHeight is less than %f times the base height of U+%04X." % (kLargeOpMinDisplayOperatorFactor, c),
                   file=sys.stderr)
+            results.add("display-operator-min-height-largeop", "fail",
+                        aCodePoint=c,
+                        aValue=displayOperatorMinHeight,
+                        aSuggestedValue=kLargeOpMinDisplayOperatorFactor *
+                        baseHeight,
+                        aMessage="DisplayOperatorMinHeight is less than %f times the base height" % kLargeOpMinDisplayOperatorFactor)
+        else:
+            results.add("display-operator-min-height-largeop", "pass",
+                        aCodePoint=c, aValue=displayOperatorMinHeight)
     print("")
 
     # MathLeading
@@ -1025,8 +1400,8 @@ def main(aArgs):
     # AxisHeight
     # Note: FontForge defaults to zero.
     # See https://github.com/fontforge/fontforge/pull/2242
-    if 0x2B in font:
-        plusBoundingBox = font[0x2B].boundingBox()
+    if 0x2B in index:
+        plusBoundingBox = index.boundingBox(0x2B)
         suggestedValue = (plusBoundingBox[1] + plusBoundingBox[3]) / 2
     else:
         suggestedValue = 0
@@ -1036,7 +1411,11 @@ def main(aArgs):
         print("Error: AxisHeight is set to 0!", file=sys.stderr)
         if suggestedValue > 0:
             print("Setting AxisHeight to %d." % suggestedValue)
-            font.math.AxisHeight = suggestedValue
+            patches.add("setMathConstant", name="AxisHeight",
+                        value=suggestedValue)
+        results.add("axis-height", "fixed" if suggestedValue > 0 else "fail",
+                    "error", aValue=0, aSuggestedValue=suggestedValue,
+                    aMessage="AxisHeight is set to 0")
     else:
         print("Done")
         if (suggestedValue > 0 and
@@ -1044,6 +1423,12 @@ def main(aArgs):
             print("Warning: AxisHeight is set to %d while the center of the\
 plus sign is %d." % (font.math.AxisHeight, suggestedValue),
                   file=sys.stderr)
+            results.add("axis-height", "fail", aValue=font.math.AxisHeight,
+                        aSuggestedValue=suggestedValue,
+                        aMessage="AxisHeight differs from the center of the plus sign")
+        else:
+            results.add("axis-height", "pass", aValue=font.math.AxisHeight,
+                        aSuggestedValue=suggestedValue)
     print("")
 
     # AccentBaseHeight
@@ -1086,9 +1471,14 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
         print("Failed")
         print("Error: FractionRuleThickness is set to 0!", file=sys.stderr)
         print("Setting FractionRuleThickness to %d." % font.uwidth)
-        font.math.FractionRuleThickness = font.uwidth
+        patches.add("setMathConstant", name="FractionRuleThickness",
+                    value=font.uwidth)
+        results.add("fraction-rule-thickness", "fixed", "error", aValue=0,
+                    aSuggestedValue=font.uwidth,
+                    aMessage="FractionRuleThickness is set to 0")
     else:
         print("Done")
+        results.add("fraction-rule-thickness", "pass", aValue=font.math.FractionRuleThickness)
     print("")
 
     # FractionDenominatorGapMin
@@ -1104,9 +1494,14 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
         print("Failed")
         print("Error: OverbarRuleThickness is set to 0!", file=sys.stderr)
         print("Setting OverBarRuleThickness to %d." % font.uwidth)
-        font.math.OverbarRuleThickness = font.uwidth
+        patches.add("setMathConstant", name="OverbarRuleThickness",
+                    value=font.uwidth)
+        results.add("overbar-rule-thickness", "fixed", "error", aValue=0,
+                    aSuggestedValue=font.uwidth,
+                    aMessage="OverbarRuleThickness is set to 0")
     else:
         print("Done")
+        results.add("overbar-rule-thickness", "pass", aValue=font.math.OverbarRuleThickness)
     print("")
 
     # OverbarExtraAscender
@@ -1118,9 +1513,14 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
         print("Failed")
         print("Error: UnderbarRuleThickness is set to 0!", file=sys.stderr)
         print("Setting OverBarRuleThickness to %d." % font.uwidth)
-        font.math.UnderbarRuleThickness = font.uwidth
+        patches.add("setMathConstant", name="UnderbarRuleThickness",
+                    value=font.uwidth)
+        results.add("underbar-rule-thickness", "fixed", "error", aValue=0,
+                    aSuggestedValue=font.uwidth,
+                    aMessage="UnderbarRuleThickness is set to 0")
     else:
         print("Done")
+        results.add("underbar-rule-thickness", "pass", aValue=font.math.UnderbarRuleThickness)
     print("")
 
     # UnderbarExtraDescender
@@ -1136,9 +1536,16 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
         print("Failed")
         print("Error: RadicalDisplayStyleVerticalGap is set to 0!", file=sys.stderr)
         print("Setting RadicalDisplayStyleVerticalGap to %d." % suggestedValue)
-        font.math.RadicalDisplayStyleVerticalGap = suggestedValue
+        patches.add("setMathConstant", name="RadicalDisplayStyleVerticalGap",
+                    value=suggestedValue)
+        results.add("radical-display-style-vertical-gap", "fixed", "error",
+                    aValue=0, aSuggestedValue=suggestedValue,
+                    aMessage="RadicalDisplayStyleVerticalGap is set to 0")
     else:
         print("Done")
+        results.add("radical-display-style-vertical-gap", "pass",
+                    aValue=font.math.RadicalDisplayStyleVerticalGap,
+                    aSuggestedValue=suggestedValue)
     print("")
 
     # RadicalRuleThickness
@@ -1150,9 +1557,14 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
         print("Failed")
         print("Error: RadicalRuleThickness is set to 0!", file=sys.stderr)
         print("Setting RadicalRuleThickness to %d." % font.uwidth)
-        font.math.RadicalRuleThickness = font.uwidth
+        patches.add("setMathConstant", name="RadicalRuleThickness",
+                    value=font.uwidth)
+        results.add("radical-rule-thickness", "fixed", "error", aValue=0,
+                    aSuggestedValue=font.uwidth,
+                    aMessage="RadicalRuleThickness is set to 0")
     else:
         print("Done")
+        results.add("radical-rule-thickness", "pass", aValue=font.math.RadicalRuleThickness)
     print("")
 
     # RadicalExtraAscender
@@ -1163,6 +1575,7 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
     ############################################################################
     # Verify whether the MathVariant table has appropriate data for some basic
     # unicode constructions.
+    timer.begin("constructions")
     print("Testing Unicode Constructions in the MathVariant table...")
     for c in kUnicodeConstructions:
 
@@ -1176,23 +1589,26 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
 
         # Verify whether the character is present.
         print("Testing base glyph for U+%04X... " % codePoint, end="")
-        if codePoint not in font:
+        if codePoint not in index:
             print("Failed")
             warnMissingGlyph(codePoint)
+            results.add("construction-base-glyph", "fail",
+                        aCodePoint=codePoint, aMessage="Missing glyph")
             continue
         print("Done")
-        glyph = font[codePoint]
+        glyph = index[codePoint]
+        results.add("construction-base-glyph", "pass", aCodePoint=codePoint,
+                    aGlyphName=glyph.glyphname)
 
         # Verify whether the variants are available.
         if variants is not None:
             print("Testing variants for U+%04X... " % codePoint, end="")
-            v = None
-            if isVertical:
-                v = glyph.verticalVariants
-            else:
-                v = glyph.horizontalVariants
+            v = index.variants(codePoint, isVertical)
             if v is not None:
                 print("Done")
+                results.add("construction-variants", "pass",
+                            aCodePoint=codePoint, aGlyphName=glyph.glyphname,
+                            aValue=v)
             else:
                 print("Failed")
                 print("Warning: missing variants for operator U+%04X!"
@@ -1201,34 +1617,39 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
                       end="")
                 # FIXME: Is it really necessary to specify the base glyph?
                 # This is done in Latin Modern but not XITS.
-                v = "%s " % font[codePoint].glyphname
+                v = "%s " % glyph.glyphname
                 allGlyphsAvailable = True
                 for u in variants:
-                    if u not in font:
+                    if u not in index:
                         warnMissingGlyph(u)
                         allGlyphsAvailable = False
                         break
-                    v += "%s " % font[u].glyphname
+                    v += "%s " % index[u].glyphname
                 if not allGlyphsAvailable:
                     print("Failed")
+                    results.add("construction-variants", "fail",
+                                aCodePoint=codePoint,
+                                aGlyphName=glyph.glyphname,
+                                aMessage="Missing variants")
                 else:
-                    # Set the variants
-                    if isVertical:
-                        glyph.verticalVariants = v
-                    else:
-                        glyph.horizontalVariants = v
+                    patches.add("setVariants", glyph=glyph.glyphname,
+                                vertical=isVertical, variants=v)
                     print("Done")
+                    results.add("construction-variants", "fixed",
+                                aCodePoint=codePoint,
+                                aGlyphName=glyph.glyphname,
+                                aSuggestedValue=v.strip(),
+                                aMessage="Missing variants")
 
         # Verify whether the components are available.
         if parts is not None:
             print("Testing components for U+%04X... " % codePoint, end="")
-            components = None
-            if isVertical:
-                components = glyph.verticalComponents
-            else:
-                components = glyph.horizontalComponents
+            components = index.components(codePoint, isVertical)
             if components:
                 print("Done")
+                results.add("construction-components", "pass",
+                            aCodePoint=codePoint, aGlyphName=glyph.glyphname,
+                            aValue=[list(c) for c in components])
             else:
                 print("Failed")
                 print("Warning: missing components for operator U+%04X!"
@@ -1242,7 +1663,7 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
                 overlap = font.math.MinConnectorOverlap
                 i = 0
                 for p in parts:
-                    if p[0] not in font:
+                    if p[0] not in index:
                         warnMissingGlyph(p[0])
                         allGlyphsAvailable = False
                         break
@@ -1254,130 +1675,124 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
                         endConnectorLength = 0
                     else:
                         endConnectorLength = overlap
-                    boundingBox = font[p[0]].boundingBox()
                     if isVertical:
-                        fullAdvance = int(boundingBox[3] - boundingBox[1])
+                        fullAdvance = int(index.height(p[0]))
                     else:
-                        fullAdvance = int(boundingBox[2] - boundingBox[0])
+                        fullAdvance = int(index.width(p[0]))
                     components.append(
-                        (font[p[0]].glyphname, p[1],
+                        (index[p[0]].glyphname, p[1],
                          startConnectorLength, endConnectorLength, fullAdvance))
                     i = i + 1
 
                 if not allGlyphsAvailable:
                     print("Failed")
+                    results.add("construction-components", "fail",
+                                aCodePoint=codePoint,
+                                aGlyphName=glyph.glyphname,
+                                aMessage="Missing components")
                 else:
-                    # Set the components.
-                    # Note: this makes FontForge crash.
-                    # See https://github.com/fontforge/fontforge/pull/2225
-                    components = tuple(components)
-                    if isVertical:
-                        glyph.verticalComponents = components
-                    else:
-                        glyph.horizontalComponents = components
+                    results.add("construction-components", "fixed",
+                                aCodePoint=codePoint,
+                                aGlyphName=glyph.glyphname,
+                                aSuggestedValue=[list(c) for c in components],
+                                aMessage="Missing components")
+                    patches.add("setComponents", glyph=glyph.glyphname,
+                                vertical=isVertical,
+                                components=[list(c) for c in components])
                     print("Done")
     print("")
 
     ############################################################################
     # Verify whether the MathVariant table has appropriate data for large
     # operators.
+    timer.begin("large operators")
     print("Testing large operators in the MathVariant table...")
     for c in kLargeOperators:
 
         # Verify whether the character is present.
         print("Testing base glyph for large operator U+%04X... " % c, end="")
-        if c not in font:
+        if c not in index:
             print("Failed")
             warnMissingGlyph(c)
+            results.add("largeop-base-glyph", "fail", aCodePoint=c,
+                        aMessage="Missing glyph")
             continue
         print("Done")
-        glyph = font[c]
+        glyph = index[c]
+        results.add("largeop-base-glyph", "pass", aCodePoint=c,
+                    aGlyphName=glyph.glyphname)
 
         # Verify variants
         print("Testing variants for large operator U+%04X... " % c, end="")
-        if glyph.verticalVariants is not None:
+        variants = patches.variants(index, glyph.glyphname, True)
+        if variants is not None:
             # Verify whether DisplayOperatorMinHeight can be satisfied.
-            variants = glyph.verticalVariants.split(" ")
             hasDisplaySize = False
-            for v in variants:
-                if v in font:
-                    box = font[v].boundingBox()
-                    height = box[3] - box[1]
-                    if font.math.DisplayOperatorMinHeight <= height:
+            for v in variants.split(" "):
+                if v in index:
+                    if displayOperatorMinHeight <= index.height(v):
                         hasDisplaySize = True
                         break
             if hasDisplaySize:
                 print("Done")
+                results.add("largeop-variants", "pass", aCodePoint=c,
+                            aGlyphName=glyph.glyphname, aValue=variants)
             else:
                 print("Failed")
                 print("Warning: U+%04X does not have any size variant of height at least DisplayOperatorMinHeight" % c, file=sys.stderr)
+                results.add("largeop-variants", "fail", aCodePoint=c,
+                            aGlyphName=glyph.glyphname, aValue=variants,
+                            aMessage="No size variant of height at least DisplayOperatorMinHeight")
         else:
             print("Failed")
             print("Setting variants for operator U+%04X... " % c,
                   end="")
             # Add a glyph for the operator in display mode
-            baseGlyphName = font[c].glyphname
+            baseGlyphName = glyph.glyphname
             displayGlyphName = "%s.display" % baseGlyphName
-            g = font.createChar(-1, displayGlyphName)
-            font.selection.select(baseGlyphName)
-            font.copy()
-            font.selection.select(displayGlyphName)
-            font.paste()
-            g.transform(psMat.scale(kLargeOpDisplayOperatorFactor),
-                        ("round",))
+            patches.add("scaleGlyph", glyph=displayGlyphName,
+                        source=baseGlyphName,
+                        scale=kLargeOpDisplayOperatorFactor)
             # FIXME: Is it really necessary to specify the base glyph?
             # This is done in Latin Modern but not XITS.
-            glyph.verticalVariants = "%s %s" % (baseGlyphName, displayGlyphName)
+            variants = "%s %s" % (baseGlyphName, displayGlyphName)
+            patches.add("setVariants", glyph=baseGlyphName, vertical=True,
+                        variants=variants)
             print("Done")
-    print("")
-
-    ############################################################################
-    # Verify whether integrals have italic correction
-    print("Testing italic correction for integrals...")
-    for c in kLargeOpIntegrals:
-        if c not in font:
-            continue
-        print("Testing italic correction for operator U+%04X..." % c)
-
-        # Get the list of variants, including the base size
-        variants = font[c].verticalVariants.split(" ")
-        baseGlyphName = font[c].glyphname
-        if variants[0] != baseGlyphName:
-            variants.insert(0, baseGlyphName)
-
-        # Test italic correction for each variant
-        for v in variants:
-            if v in font:
-                testItalicCorrection(font[v])
+            results.add("largeop-variants", "fixed", aCodePoint=c,
+                        aGlyphName=glyph.glyphname, aSuggestedValue=variants,
+                        aMessage="Missing variants")
     print("")
 
     ############################################################################
     # Testing Prescripted Operators / ssty tables
+    timer.begin("ssty")
     print("Testing Prescripted Operators / ssty tables...")
     for c in kPreScriptedOperators:
-        testSSTY(font, c)
+        testSSTY(index, results, c)
     print("")
 
     ############################################################################
     # Testing Mathematical Alphanumeric Characters
-    testMathVariants(font, "bold",
+    fallbackFonts = FallbackFontPool()
+    testMathVariants(index, results, patches, fallbackFonts, "bold",
                      ((0x1D400, 0x1D433),
                       (0x1D6A8, 0x1D6E1),
                       (0x1D7CA, 0x1D7CB),
-                      (0x1D7CE, 0x1D7D7)), aArgs.bold)
+                      (0x1D7CE, 0x1D7D7)), aArgs.bold, timer)
 
-    testMathVariants(font, "italic",
+    testMathVariants(index, results, patches, fallbackFonts, "italic",
                      ((0x1D434, 0x1D454),
                       (0x210E,),
                       (0x1D456, 0x1D467),
                       (0x1D6A4, 0x1D6A5),
-                      (0x1D6E2, 0x1D6D6)), aArgs.italic)
+                      (0x1D6E2, 0x1D6D6)), aArgs.italic, timer)
 
-    testMathVariants(font, "bold-italic",
+    testMathVariants(index, results, patches, fallbackFonts, "bold-italic",
                      ((0x1D468, 0x1D49B),
-                      (0x1D71C, 0x1D755)), aArgs.bold_italic)
+                      (0x1D71C, 0x1D755)), aArgs.bold_italic, timer)
 
-    testMathVariants(font, "script",
+    testMathVariants(index, results, patches, fallbackFonts, "script",
                      ((0x1D49C,),
                       (0x212C,),
                       (0x1D49E, 0x1D49F),
@@ -1396,12 +1811,12 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
                       (0x210A,),
                       (0x1D4BD, 0x1D4C3),
                       (0x2134,),
-                      (0x1D4C5, 0x1D4CF)), None)
+                      (0x1D4C5, 0x1D4CF)), None, timer)
 
-    testMathVariants(font, "bold-script",
-                     ((0x1D4D0, 0x1D503),), None)
+    testMathVariants(index, results, patches, fallbackFonts, "bold-script",
+                     ((0x1D4D0, 0x1D503),), None, timer)
 
-    testMathVariants(font, "fraktur",
+    testMathVariants(index, results, patches, fallbackFonts, "fraktur",
                      ((0x1D504, 0x1D505),
                       (0x212D,),
                       (0x1D507, 0x1D50A),
@@ -1411,32 +1826,32 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
                       (0x211C,),
                       (0x1D516, 0x1D51C),
                       (0x2128,),
-                      (0x1D51E, 0x1D537)), None)
+                      (0x1D51E, 0x1D537)), None, timer)
 
-    testMathVariants(font, "bold-fraktur",
-                     ((0x1D56C, 0x1D59F),), None)
+    testMathVariants(index, results, patches, fallbackFonts, "bold-fraktur",
+                     ((0x1D56C, 0x1D59F),), None, timer)
 
-    testMathVariants(font, "sans-serif",
+    testMathVariants(index, results, patches, fallbackFonts, "sans-serif",
                      ((0x1D5A0, 0x1D5D3),
-                      (0x1D7E2, 0x1D7EB)), aArgs.sans_serif)
+                      (0x1D7E2, 0x1D7EB)), aArgs.sans_serif, timer)
 
-    testMathVariants(font, "sans-serif-bold",
+    testMathVariants(index, results, patches, fallbackFonts, "sans-serif-bold",
                      ((0x1D5D4, 0x1D607),
                       (0x1D756, 0x1D78F),
-                      (0x1D7EC, 0x1D7F5)), aArgs.sans_serif_bold)
+                      (0x1D7EC, 0x1D7F5)), aArgs.sans_serif_bold, timer)
 
-    testMathVariants(font, "sans-serif-italic",
-                     ((0x1D608, 0x1D63B),), aArgs.sans_serif_italic)
+    testMathVariants(index, results, patches, fallbackFonts, "sans-serif-italic",
+                     ((0x1D608, 0x1D63B),), aArgs.sans_serif_italic, timer)
 
-    testMathVariants(font, "sans-serif-bold-italic",
+    testMathVariants(index, results, patches, fallbackFonts, "sans-serif-bold-italic",
                      ((0x1D63C, 0x1D66F),
-                      (0x1D790, 0x1D7C9)), aArgs.sans_serif_bold_italic)
+                      (0x1D790, 0x1D7C9)), aArgs.sans_serif_bold_italic, timer)
 
-    testMathVariants(font, "monospace",
+    testMathVariants(index, results, patches, fallbackFonts, "monospace",
                      ((0x1D670, 0x1D6A3),
-                      (0x1D7F6, 0x1D7FF)), aArgs.monospace)
+                      (0x1D7F6, 0x1D7FF)), aArgs.monospace, timer)
 
-    testMathVariants(font, "double-struck",
+    testMathVariants(index, results, patches, fallbackFonts, "double-struck",
                      ((0x1D538, 0x1D539),
                       (0x2102,),
                       (0x1D53B, 0x1D53E),
@@ -1452,18 +1867,18 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
                       (0x1D7D8, 0x1D7E1),
                       (0x1EEA1, 0x1EEA3),
                       (0x1EEA5, 0x1EEA9),
-                      (0x1EEAB, 0x1EEBB)), None)
+                      (0x1EEAB, 0x1EEBB)), None, timer)
 
-    testMathVariants(font, "initial",
+    testMathVariants(index, results, patches, fallbackFonts, "initial",
                      ((0x1EE21, 0x1EE22),
                       (0x1EE24,),
                       (0x1EE27,),
                       (0x1EE29, 0x1EE32),
                       (0x1EE34, 0x1EE37),
                       (0x1EE39,),
-                      (0x1EE3B,)), None)
+                      (0x1EE3B,)), None, timer)
 
-    testMathVariants(font, "tailed",
+    testMathVariants(index, results, patches, fallbackFonts, "tailed",
                      ((0x1EE42,),
                       (0x1EE47,),
                       (0x1EE49,),
@@ -1475,33 +1890,166 @@ plus sign is %d." % (font.math.AxisHeight, suggestedValue),
                       (0x1EE59,),
                       (0x1EE5B,),
                       (0x1EE5D,),
-                      (0x1EE5F,)), None)
+                      (0x1EE5F,)), None, timer)
 
-    testMathVariants(font, "looped",
+    testMathVariants(index, results, patches, fallbackFonts, "looped",
                      ((0x1EE80, 0x1EE89),
-                      (0x1EE8B, 0x1EE9B)), None)
+                      (0x1EE8B, 0x1EE9B)), None, timer)
 
-    testMathVariants(font, "stretched",
+    testMathVariants(index, results, patches, fallbackFonts, "stretched",
                      ((0x1EE61, 0x1EE62),
                       (0x1EE64,),
                       (0x1EE67, 0x1EE6A),
                       (0x1EE6C, 0x1EE72),
                       (0x1EE74, 0x1EE77),
                       (0x1EE79, 0x1EE7C),
-                      (0x1EE7E,)), None)
+                      (0x1EE7E,)), None, timer)
+
+    ############################################################################
+    # Apply all the fixes at once.
+    if aArgs.patches:
+        patches.write(aArgs.patches)
+    timer.begin("patches")
+    applyPatches(font, index, patches, fallbackFonts)
+
+    ############################################################################
+    # Verify that the stretchy glyphs can take any size above their largest
+    # variant, i.e. that the size ranges of their assemblies for consecutive
+    # numbers of repetitions of the extenders overlap.
+    timer.begin("assemblies")
+    print("Testing sizes reachable by the stretchy glyphs...")
+    for construction in glyphIndexConstructions(index,
+                                                font.math.MinConnectorOverlap):
+        print("Testing %s sizes of glyph '%s'... " %
+              (construction.direction(), construction.name), end="")
+        gaps, periodic = construction.gaps()
+        finiteGaps = [gap for gap in gaps if gap[1] is not None]
+        bad = construction.badConnections()
+        for first, second in bad:
+            print("Warning: connection %s-%s is shorter than MinConnectorOverlap!" %
+                  (first, second), file=sys.stderr)
+        if finiteGaps:
+            print("Warning: %s sizes %s of glyph '%s' can not be reached!" %
+                  (construction.direction(), formatGaps(finiteGaps, periodic),
+                   construction.name), file=sys.stderr)
+        if bad or finiteGaps:
+            print("Failed")
+            results.add("assembly-coverage", "fail",
+                        aGlyphName=construction.name,
+                        aValue=[list(gap) for gap in gaps],
+                        aMessage="Unreachable sizes" if finiteGaps else
+                        "Connectors shorter than MinConnectorOverlap")
+        else:
+            print("Done")
+            results.add("assembly-coverage", "pass",
+                        aGlyphName=construction.name,
+                        aValue=[list(gap) for gap in gaps])
+    print("")
+
+    ############################################################################
+    # Verify whether integrals have italic correction
+    timer.begin("integrals")
+    print("Testing italic correction for integrals...")
+    for c in kLargeOpIntegrals:
+        if c not in index:
+            continue
+        print("Testing italic correction for operator U+%04X..." % c)
+
+        # Get the list of variants, including the base size
+        variants = index.variants(c, True).split(" ")
+        baseGlyphName = index[c].glyphname
+        if variants[0] != baseGlyphName:
+            variants.insert(0, baseGlyphName)
+
+        # Test italic correction for each variant
+        for v in variants:
+            if v in index:
+                testItalicCorrection(results, c, index[v])
+    print("")
+
     ############################################################################
+    timer.end()
     if aArgs.output:
         # Output the modified font.
-        output = "%s.fixed.sfd" % aArgs.input
-        print("Saving file %s... " % output, end="")
-        font.save(output)
-        print("Done")
-    font.close()
+        timer.begin("save")
+        saveFont(font, aArgs.input, aArgs.output_format)
+    if aTimer is None and aArgs.timings:
+        timer.report()
+
+    return results
+
+def replayPatches(aFont, aArgs, aTimer=None):
+    # Apply the patches saved by --patches, e.g. on a new upstream version of
+    # the font, without running the checks again.
+    timer = aTimer
+    if timer is None:
+        timer = PhaseTimer()
+    results = CheckResults()
+    timer.begin("index")
+    index = GlyphIndex(aFont)
+    timer.begin("patches")
+    patches = FontPatches.read(aArgs.replay)
+    failures = applyPatches(aFont, index, patches, FallbackFontPool())
+    results.add("replay-patches", "fail" if failures else "pass",
+                aValue=len(patches.patches) - failures,
+                aSuggestedValue=len(patches.patches),
+                aMessage="Patches replayed from %s" % aArgs.replay)
+    timer.end()
+    if aArgs.output:
+        timer.begin("save")
+        saveFont(aFont, aArgs.input, aArgs.output_format)
+    if aTimer is None and aArgs.timings:
+        timer.report()
+    return results
 
-if __name__ == "__main__":
+def main(aArgs):
+    # With --format=json or --format=jsonl, the text log and warnings are
+    # dropped and only the results are written to stdout.
+    log = sys.stdout
+    error = sys.stderr
+    if aArgs.format != "text":
+        log = StringIO()
+        error = StringIO()
+
+    with redirect_stdout(log), redirect_stderr(error):
+        ########################################################################
+        # Open the font
+        timer = PhaseTimer()
+        timer.begin("open")
+        print("Opening file %s... " % aArgs.input, end="")
+        try:
+            font = fontforge.open(aArgs.input)
+        except EnvironmentError:
+            print("Failed!")
+            font = None
+        else:
+            print("Done")
+            print("")
+            if aArgs.replay:
+                results = runProfiled(aArgs.cprofile, replayPatches, font,
+                                      aArgs, timer)
+            else:
+                results = runProfiled(aArgs.cprofile, checkFont, font, aArgs,
+                                      None, None, timer)
+            font.close()
+        timer.end()
+
+    if aArgs.timings:
+        timer.report()
+    if font is None:
+        if aArgs.format != "text":
+            print("Failed to open %s!" % aArgs.input, file=sys.stderr)
+        exit(1)
+    if aArgs.format != "text":
+        results.write(sys.stdout, aArgs.format)
+
+def createArgumentParser():
     parser = argparse.ArgumentParser(description="Check math features of a font and optionally fixes issues.")
-    parser.add_argument("input", type=str, help="Font to verify.")
-    parser.add_argument("--output", action="store_true", help="Whether to output a version with some issues fixed.")
+    parser.add_argument("input", type=str, nargs="?", help="Font to verify.")
+    parser.add_argument("--output", action="store_true", help="Whether to output a version with some issues fixed, as <input>.fixed.<format>.")
+    parser.add_argument("--output-format", choices=kOutputFormats, default="woff2", help="Format of the fixed font: WOFF or WOFF2 compressed like compress-font.py does, or a FontForge SFD file (default: %(default)s).")
+    parser.add_argument("--patches", type=str, metavar="FILE", help="Write the fixes found by the checks into FILE, as a JSON list of patches.")
+    parser.add_argument("--replay", type=str, metavar="FILE", help="Apply the patches of FILE, written by --patches, instead of running the checks.")
     parser.add_argument("--italic", type=str, help="Font from which to take italic glyphs.")
     parser.add_argument("--bold", type=str, help="Font from which to take bold glyphs.")
     parser.add_argument("--bold-italic", type=str, help="Font from which to take bold-italic glyphs.")
@@ -1510,5 +2058,17 @@ if __name__ == "__main__":
     parser.add_argument("--sans-serif-bold", type=str, help="Font from which to take sans-serif bold glyphs.")
     parser.add_argument("--sans-serif-bold-italic", type=str, help="Font from which to take sans-serif bold italic glyphs.")
     parser.add_argument("--monospace", type=str, help="Font from which to take monospace glyphs.")
+    parser.add_argument("--timings", action="store_true", help="Print the duration of each phase of the check on stderr.")
+    parser.add_argument("--cprofile", type=str, metavar="FILE", help="Write cProfile statistics of the checks into FILE, to be read with the pstats module.")
+    parser.add_argument("--benchmark", action="store_true", help="Check the mathvariant to BMP lookup against the former binary search for all the entries and time both, without opening a font.")
+    parser.add_argument("--format", choices=["text", "json", "jsonl"], default="text", help="Output format: the text log and warnings, a JSON array of check results or one JSON check result per line (default: %(default)s).")
+    return parser
+
+if __name__ == "__main__":
+    parser = createArgumentParser()
     args = parser.parse_args()
+    if args.benchmark:
+        sys.exit(0 if benchmarkMathvariantToBMP() else 1)
+    if args.input is None:
+        parser.error("the following arguments are required: input")
     main(args)
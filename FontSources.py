@@ -0,0 +1,47 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Access to the source files of the build, shared by compress-font.py,
+# AnalyzeFont.py and BuildFonts.py. Fonts can be read directly from a zip
+# archive, without extracting it, by passing "archive.zip!path/to/font.otf"
+# as a filename.
+
+import hashlib
+import os
+import zipfile
+
+kArchiveSeparator = "!"
+
+def archiveMember(aFilename):
+    # Return the (archive, member) of a filename, or None for plain files.
+    archive, separator, member = aFilename.partition(kArchiveSeparator)
+    if not separator or not zipfile.is_zipfile(archive):
+        return None
+    return archive, member
+
+def openSource(aFilename):
+    # Open a source font for reading, streaming zip members.
+    location = archiveMember(aFilename)
+    if location is None:
+        return open(aFilename, "rb")
+    archive = zipfile.ZipFile(location[0])
+    member = archive.open(location[1])
+    # The member stream keeps a reference to the open archive file.
+    archive.close()
+    return member
+
+def sourceSize(aFilename):
+    location = archiveMember(aFilename)
+    if location is None:
+        return os.path.getsize(aFilename)
+    with zipfile.ZipFile(location[0]) as archive:
+        return archive.getinfo(location[1]).file_size
+
+def fileDigest(aFilename):
+    # SHA-256 of a file or of an archive member, read by chunks.
+    digest = hashlib.sha256()
+    with openSource(aFilename) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -3,27 +3,23 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 from __future__ import print_function
-from bisect import bisect_left
+from bisect import bisect_left, bisect_right
+from GlyphIndex import GlyphIndex
+from MathStretchy import glyphIndexConstruction, testSizes, kStartSize, \
+    kConsecutiveSizeRatio, kNumberOfSizes, kLargeOperators
+from collections import OrderedDict
 from datetime import datetime
-from math import sqrt
+from fontTools.unicodedata import Blocks
+from functools import lru_cache
+from io import StringIO
+import argparse
 import fontforge
+import json
+import os
 import sys
+import time
 import unicodedata
 
-# Parameters describing the size of stretchy operators as a geometric sequence.
-kStartSize = .25 # size of the first operator (in em)
-kConsecutiveSizeRatio = sqrt(2) # ratio between size i+1 and size i
-kNumberOfSizes = 12 # number of sizes
-
-# List op "largeop" operators. See http://www.w3.org/TR/MathML3/appendixc.html
-kLargeOperators = [0x220F, 0x2210, 0x2211, 0x222B, 0x222C, 0x222D, 0x222E,
-                   0x222F, 0x2230, 0x2231, 0x2232, 0x2233, 0x22C0, 0x22C1,
-                   0x22C2, 0x22C3, 0x2A00, 0x2A01, 0x2A02, 0x2A03, 0x2A04,
-                   0x2A05, 0x2A06, 0x2A07, 0x2A08, 0x2A09, 0x2A0A, 0x2A0B,
-                   0x2A0C, 0x2A0D, 0x2A0E, 0x2A0F, 0x2A10, 0x2A11, 0x2A12,
-                   0x2A13, 0x2A14, 0x2A15, 0x2A16, 0x2A17, 0x2A18, 0x2A19,
-                   0x2A1A, 0x2A1B, 0x2A1C, 0x2AFC, 0x2AFF]
-
 # List of "prescripted" operators.
 # See http://www.w3.org/TR/MathML3/appendixc.html
 kPreScriptedOperators = [0x2032, 0x2033, 0x2034, 0x2035, 0x2036, 0x2037, 0x2057]
@@ -64,6 +60,84 @@ mrow.resizable > mpadded:last-child > mtext > span {\n\
 }\n\
 </style>"
 
+# Script rendering the characters of a Unicode block of the coverage section
+# the first time it is expanded. Toggle events do not bubble so the listener
+# is registered on the capture phase, which also works for the sections of a
+# sharded testcase inserted later.
+kUnicodeBlockScript = "<script>\n\
+document.addEventListener(\"toggle\", (event) => {\n\
+  const block = event.target;\n\
+  if (!block.classList || !block.classList.contains(\"unicodeBlock\") ||\n\
+      !block.open || block.dataset.rendered)\n\
+    return;\n\
+  block.dataset.rendered = true;\n\
+  const names = block.dataset.names.split(\";\");\n\
+  let html = \"<p>\";\n\
+  for (const range of block.dataset.ranges.split(\",\")) {\n\
+    const [start, end] = range.split(\"-\").map(n => parseInt(n, 16));\n\
+    for (let codePoint = start; codePoint <= end; codePoint++) {\n\
+      const hex = codePoint.toString(16).toUpperCase();\n\
+      html += `U+${hex.padStart(6, \"0\")} <math><mn>&#x${hex};</mn></math> ${names.shift()}<br/>`;\n\
+    }\n\
+  }\n\
+  block.insertAdjacentHTML(\"beforeend\", html + \"</p>\");\n\
+}, true);\n\
+</script>"
+
+# Script loading the sections of a sharded testcase when they are scrolled
+# into view. Browsers reject fetch for file:// pages, so the placeholders are
+# then left as is: they link to the fragments, which can be opened directly.
+kLazySectionScript = "<script>\n\
+document.addEventListener(\"DOMContentLoaded\", () => {\n\
+  if (location.protocol === \"file:\")\n\
+    return;\n\
+  const observer = new IntersectionObserver((entries) => {\n\
+    for (const entry of entries) {\n\
+      if (!entry.isIntersecting)\n\
+        continue;\n\
+      const section = entry.target;\n\
+      observer.unobserve(section);\n\
+      fetch(section.dataset.src)\n\
+        .then(response => response.ok ? response.text() : Promise.reject())\n\
+        .then(html => { section.innerHTML = html; })\n\
+        .catch(() => {});\n\
+    }\n\
+  }, {rootMargin: \"200px\"});\n\
+  for (const section of document.querySelectorAll(\"div.lazySection\"))\n\
+    observer.observe(section);\n\
+});\n\
+</script>"
+
+kLazySectionTemplate = "<div class=\"lazySection\" style=\"min-height: 50vh;\" data-src=\"./%s\"><h2>%s</h2><p><a href=\"./%s\">Open %s</a></p></div>\n"
+
+# Templates for the parts of the testcase that are repeated for each glyph.
+# The testcase is assembled in memory with them and written to disk at once.
+kCodePointTemplate = "<a href=\"https://duckduckgo.com/?q=U%%2B%06X\">U+%06X</a>\n"
+kCharacterTemplate = "<span title=\"U+%06X %s\"><math><mn>&#x%X;</mn></math></span>\n"
+kMissingCharacterTemplate = "<span title=\"U+%06X %s\" class=\"missingBox\"></span>\n"
+kUnicodeBlockTemplate = "<details class=\"unicodeBlock\" data-ranges=\"%s\" data-names=\"%s\"><summary>%s (U+%04X&#x2013;U+%04X): %d/%d</summary>%s</details>\n"
+kUnicodeRangeTemplate = "U+%06X&#x2013;U+%06X"
+kLargeOpTemplate = "<math><mstyle displaystyle=\"false\"><mo mathcolor=\"#00f\">&#x%X;</mo></mstyle><mstyle displaystyle=\"true\"><mo mathcolor=\"#f00\">&#x%X;</mo></mstyle></math><br/>\n"
+
+def stretchyTemplate(aVertical):
+    # The kNumberOfSizes - 1 stretched operators of a row of the MathVariants
+    # table only differ by their code point, so the sizes and colors are
+    # substituted once. The result has a single %(codePoint)X placeholder.
+    template = ""
+    size = kStartSize
+    for i in range(1, kNumberOfSizes):
+        blue = (kNumberOfSizes - i) * 256 // kNumberOfSizes
+        red = i * 256 // kNumberOfSizes
+        if aVertical:
+            template += "<math><mrow><mspace height=\"%fem\" depth=\"%fem\" width=\"1px\" mathbackground=\"#%02X00%02X\"/><mo symmetric=\"false\" mathcolor=\"#%02X00%02X\" stretchy=\"true\">&#x%%(codePoint)X;</mo></mrow></math>\n" % (size/2, size/2, red, blue, red, blue)
+        else:
+            template += "<math><mover><mspace width=\"%fem\" height=\"1px\" mathbackground=\"#%02X00%02X\"/><mo mathcolor=\"#%02X00%02X\" stretchy=\"true\">&#x%%(codePoint)X;</mo></mover></math><br/>\n" % (i*.5, red, blue, red, blue)
+        size *= kConsecutiveSizeRatio
+    return template
+
+kVerticalStretchyTemplate = stretchyTemplate(True)
+kHorizontalStretchyTemplate = stretchyTemplate(False)
+
 def isLargeOp(aCodePoint):
     # Binary search in the largeop list.
     i = bisect_left(kLargeOperators, aCodePoint)
@@ -73,37 +147,83 @@ def unicodeName(aCodePoint):
     return unicodedata.name(chr(aCodePoint), "UNKNOWN CHARACTER NAME")
 
 def printCodePoint(aTestFile, aCodePoint):
-    print("<a href=\"https://duckduckgo.com/?q=U%%2B%06X\">U+%06X</a>" %
-          (aCodePoint, aCodePoint), file=aTestFile)
-
-def printCharacter(aTestFile, aFont, aCodePoint):
-    if aCodePoint in aFont:
-        print("<span title=\"U+%06X %s\"><math><mn>&#x%X;</mn></math></span>"
-              % (aCodePoint, unicodeName(aCodePoint), aCodePoint),
-              file=aTestFile)
-    else:
-        print("<span title=\"U+%06X %s\" class=\"missingBox\"></span>"
-              % (aCodePoint, unicodeName(aCodePoint)),
-              file=aTestFile)
-
-def printUnicodeCoverage(aTestFile, aFont):
-    print("<h2 id=\"unicode_coverage\">Unicode Coverage</h2><p>", file=aTestFile)
-    coverage = []
-    for glyph in aFont.glyphs():
-        if glyph.unicode != -1:
-            coverage.append(glyph.unicode)
-    coverage.sort()
-
-    for codePoint in coverage:
-        print("U+%06X <math><mn>&#x%X;</mn></math> %s<br/>" %
-              (codePoint, codePoint, unicodeName(codePoint)),
-              file=aTestFile)
-
-    print("</p>", file=aTestFile)
-
-def printCharacterRange(aTestFile, aFont, aCodePointStart, aCodePointEnd):
-    for codePoint in range(aCodePointStart, aCodePointEnd+1):
-        printCharacter(aTestFile, aFont, codePoint)
+    aTestFile.write(kCodePointTemplate % (aCodePoint, aCodePoint))
+
+def characterHTML(aIndex, aCodePoint):
+    if aCodePoint in aIndex:
+        return kCharacterTemplate % (aCodePoint, unicodeName(aCodePoint),
+                                     aCodePoint)
+    return kMissingCharacterTemplate % (aCodePoint, unicodeName(aCodePoint))
+
+def printCharacter(aTestFile, aIndex, aCodePoint):
+    aTestFile.write(characterHTML(aIndex, aCodePoint))
+
+def codePointRanges(aCodePoints):
+    # Run-length encode sorted code points into [start, end] ranges.
+    ranges = []
+    for codePoint in aCodePoints:
+        if ranges and ranges[-1][1] == codePoint - 1:
+            ranges[-1][1] = codePoint
+        else:
+            ranges.append([codePoint, codePoint])
+    return ranges
+
+@lru_cache(maxsize=None)
+def assignedCodePoints(aStart, aEnd):
+    # Number of characters assigned in a range of code points.
+    return sum(1 for codePoint in range(aStart, aEnd + 1)
+               if unicodedata.category(chr(codePoint)) != "Cn")
+
+def unicodeCoverage(aIndex):
+    # Code points of the font, grouped by Unicode block. Each block has its
+    # name, first and last code points, the number of code points covered by
+    # the font and assigned in the block and the ranges covered by the font.
+    blocks = []
+    for start, end in codePointRanges(aIndex.codePoints()):
+        while start <= end:
+            i = bisect_right(Blocks.RANGES, start) - 1
+            if i + 1 < len(Blocks.RANGES):
+                blockEnd = Blocks.RANGES[i + 1] - 1
+            else:
+                blockEnd = 0x10FFFF
+            if not blocks or blocks[-1]["start"] != Blocks.RANGES[i]:
+                block = OrderedDict()
+                block["name"] = Blocks.VALUES[i]
+                block["start"] = Blocks.RANGES[i]
+                block["end"] = blockEnd
+                block["covered"] = 0
+                block["total"] = assignedCodePoints(Blocks.RANGES[i], blockEnd)
+                block["ranges"] = []
+                blocks.append(block)
+            rangeEnd = min(end, blockEnd)
+            blocks[-1]["covered"] += rangeEnd - start + 1
+            blocks[-1]["ranges"].append([start, rangeEnd])
+            start = rangeEnd + 1
+    return blocks
+
+def printUnicodeCoverage(aTestFile, aIndex):
+    # The characters of a block are only rendered when it is expanded.
+    coverage = unicodeCoverage(aIndex)
+    print("<h2 id=\"unicode_coverage\">Unicode Coverage</h2>", file=aTestFile)
+    print("<p>%d code points in %d blocks. See also <a href=\"./coverage.json\">coverage.json</a>.</p>" %
+          (sum(block["covered"] for block in coverage), len(coverage)),
+          file=aTestFile)
+    for block in coverage:
+        aTestFile.write(kUnicodeBlockTemplate % (
+            ",".join("%X-%X" % (start, end) for start, end in block["ranges"]),
+            ";".join(unicodeName(codePoint)
+                     for start, end in block["ranges"]
+                     for codePoint in range(start, end + 1)),
+            block["name"], block["start"], block["end"], block["covered"],
+            block["total"],
+            ", ".join(kUnicodeRangeTemplate % (start, end)
+                      if start != end else "U+%06X" % start
+                      for start, end in block["ranges"])))
+
+def printCharacterRange(aTestFile, aIndex, aCodePointStart, aCodePointEnd):
+    aTestFile.write("".join(
+        [characterHTML(aIndex, codePoint)
+         for codePoint in range(aCodePointStart, aCodePointEnd+1)]))
 
 def referenceBar(aFont, aValue, aVertical):
     v1 = abs(1. * aValue) / aFont.em
@@ -171,7 +291,15 @@ def printConstruction(aTestFile, aConstruction):
         else:
             print("%s" % c[0], file=aTestFile)
 
-def printMathVariants(aTestFile, aFont):
+def printSizeSelection(aTestFile, aConstruction, aEm):
+    # The variant or assembly that the layout engine should choose for each
+    # stretched operator of the row, according to MathStretchy.py.
+    for size in testSizes(aConstruction.vertical):
+        print("%.2fem: %s<br/>" %
+              (size, aConstruction.formatChoice(
+                  aConstruction.select(size * aEm))), file=aTestFile)
+
+def printMathVariants(aTestFile, aIndex, aMinConnectorOverlap):
     print("\
     <h2 id=\"mathvariants_table\">MathVariants Table</h2>\n\
     <table>\n\
@@ -181,20 +309,11 @@ def printMathVariants(aTestFile, aFont):
         <th style=\"width: 50%%\">Stretched Glyphs</th>\n\
         <th>MathGlyphVariantRecord</th>\n\
         <th>GlyphAssembly (extenders in brackets)</th>\n\
+        <th>Expected Size Selection</th>\n\
       </tr>\n", file=aTestFile)
 
-    for glyph in aFont.glyphs():
-        if glyph.unicode == -1:
-            # Ignore non-unicode character.
-            continue
-
+    for glyph, isHorizontal, isVertical in aIndex.stretchyGlyphs():
         # Try and determine the stretch direction
-        isHorizontal = (glyph.horizontalVariants is not None or
-                        glyph.horizontalComponents is not None)
-        isVertical = (glyph.verticalVariants is not None or
-                      glyph.verticalComponents is not None)
-        if (not isHorizontal) and (not isVertical):
-            continue
         if isHorizontal and isVertical:
             print("Warning: Could not determined stretch direction for glyph \
 U+%06X" % glyph.unicode, file=sys.stderr)
@@ -209,25 +328,22 @@ U+%06X" % glyph.unicode, file=sys.stderr)
          <td>" % glyph.unicode, file=aTestFile)
 
         if isLargeOp(glyph.unicode):
-            print("<math><mstyle displaystyle=\"false\"><mo mathcolor=\"#00f\">&#x%X;</mo></mstyle><mstyle displaystyle=\"true\"><mo mathcolor=\"#f00\">&#x%X;</mo></mstyle></math><br/>" % (glyph.unicode, glyph.unicode), file=aTestFile)
-
-        size = kStartSize
-        for i in range(1, kNumberOfSizes):
-            blue = (kNumberOfSizes - i) * 256 // kNumberOfSizes
-            red = i * 256 // kNumberOfSizes
-            if isVertical:
-                print("<math><mrow><mspace height=\"%fem\" depth=\"%fem\" width=\"1px\" mathbackground=\"#%02X00%02X\"/><mo symmetric=\"false\" mathcolor=\"#%02X00%02X\" stretchy=\"true\">&#x%X;</mo></mrow></math>" % (size/2, size/2, red, blue, red, blue, glyph.unicode), file=aTestFile)
-            else:
-                print("<math><mover><mspace width=\"%fem\" height=\"1px\" mathbackground=\"#%02X00%02X\"/><mo mathcolor=\"#%02X00%02X\" stretchy=\"true\">&#x%X;</mo></mover></math><br/>" % (i*.5, red, blue, red, blue, glyph.unicode), file=aTestFile)
-            size *= kConsecutiveSizeRatio
+            aTestFile.write(kLargeOpTemplate % (glyph.unicode, glyph.unicode))
+
+        if isVertical:
+            template = kVerticalStretchyTemplate
+        else:
+            template = kHorizontalStretchyTemplate
+        aTestFile.write(template % {"codePoint": glyph.unicode})
 
         print("</td>", file=aTestFile)
 
         # Print size variants
-        if glyph.verticalVariants:
-            variants = glyph.verticalVariants
-        elif glyph.horizontalVariants:
-            variants = glyph.horizontalVariants
+        name = glyph.glyphname
+        if aIndex.verticalVariants[name]:
+            variants = aIndex.verticalVariants[name]
+        elif aIndex.horizontalVariants[name]:
+            variants = aIndex.horizontalVariants[name]
         else:
             print("<td>N/A</td>", file=aTestFile);
             variants = None
@@ -239,10 +355,13 @@ U+%06X" % glyph.unicode, file=sys.stderr)
 
         # Print glyph
         print("<td>", file=aTestFile)
-        if isVertical:
-            printConstruction(aTestFile, glyph.verticalComponents)
-        else:
-            printConstruction(aTestFile, glyph.horizontalComponents)
+        printConstruction(aTestFile, aIndex.components(name, isVertical))
+        print("</td>", file=aTestFile)
+
+        # Print the simulated size selection
+        print("<td>", file=aTestFile)
+        printSizeSelection(aTestFile, glyphIndexConstruction(
+            aIndex, name, isVertical, aMinConnectorOverlap), aIndex.font.em)
         print("</td>", file=aTestFile)
 
         print("\n\
@@ -251,7 +370,7 @@ U+%06X" % glyph.unicode, file=sys.stderr)
     print("\
     </table>\n", file=aTestFile)
 
-def printLargeOp(aTestFile, aFont):
+def printLargeOp(aTestFile, aIndex):
     print("\
     <h2 id=\"largeop\">Large Operators</h2>\
 <p>Source: <a href=\"http://www.w3.org/TR/MathML3/appendixc.html#oper-dict.entries-table\">MathML Operator Dictionary</a></p>\
@@ -262,11 +381,11 @@ def printLargeOp(aTestFile, aFont):
         print("<tr><td>", file=aTestFile)
         printCodePoint(aTestFile, u)
         print("</td>", file=aTestFile)
-        if u in aFont:
+        if u in aIndex:
             print("<td><math><mo>&#x%X;</mo></math></td>" % u, file=aTestFile)
-            glyph = aFont[u]
-            if (glyph.verticalVariants is not None or
-                glyph.verticalComponents is not None):
+            glyph = aIndex[u]
+            if (aIndex.variants(u, True) is not None or
+                aIndex.components(u, True) is not None):
                 print("\
         <td><math display=\"block\"><msubsup><mo mathcolor=\"#f00\">&#x%X;</mo><mspace width=\"8px\" height=\"4px\" depth=\"4px\" mathbackground=\"#0f0\"/><mspace width=\"8px\" height=\"4px\" depth=\"4px\" mathbackground=\"#00f\"/></msubsup></math></td>" % u,
                       file=aTestFile)
@@ -285,175 +404,175 @@ def printLargeOp(aTestFile, aFont):
     print("</table>\n", file=aTestFile)
 
 
-def printMathematicalAlphanumericCharacters(aTestFile, aFont):
+def printMathematicalAlphanumericCharacters(aTestFile, aIndex):
     print("<h2 id=\"math_alpha_char\">Mathematical Alphanumeric Characters</h2>\
 <p>Source: <a href=\"http://www.w3.org/TR/xml-entity-names/Overview.html#alphabets\">XML Entity Definitions for Characters</a>.</p>\
     <table><tr><th>mathvariant</th><th>Characters</th></tr>\n",
           file=aTestFile)
 
     print("<tr><td>bold</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D400, 0x1D433)
+    printCharacterRange(aTestFile, aIndex, 0x1D400, 0x1D433)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D6A8, 0x1D6E1)
+    printCharacterRange(aTestFile, aIndex, 0x1D6A8, 0x1D6E1)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D7CA, 0x1D7CB)
+    printCharacterRange(aTestFile, aIndex, 0x1D7CA, 0x1D7CB)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D7CE, 0x1D7D7)
+    printCharacterRange(aTestFile, aIndex, 0x1D7CE, 0x1D7D7)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>italic<br/>(default on single-char variables)</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D434, 0x1D454)
-    printCharacter(aTestFile, aFont, 0x210E)
-    printCharacterRange(aTestFile, aFont, 0x1D456, 0x1D467)
+    printCharacterRange(aTestFile, aIndex, 0x1D434, 0x1D454)
+    printCharacter(aTestFile, aIndex, 0x210E)
+    printCharacterRange(aTestFile, aIndex, 0x1D456, 0x1D467)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D6A4, 0x1D6A5)
+    printCharacterRange(aTestFile, aIndex, 0x1D6A4, 0x1D6A5)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D6E2, 0x1D6D6)
+    printCharacterRange(aTestFile, aIndex, 0x1D6E2, 0x1D6D6)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>bold-italic</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D468, 0x1D49B)
+    printCharacterRange(aTestFile, aIndex, 0x1D468, 0x1D49B)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D71C, 0x1D755)
+    printCharacterRange(aTestFile, aIndex, 0x1D71C, 0x1D755)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>script</td><td>", file=aTestFile)
-    printCharacter(aTestFile, aFont, 0x1D49C)
-    printCharacter(aTestFile, aFont, 0x212C)
-    printCharacterRange(aTestFile, aFont, 0x1D49E, 0x1D49F)
-    printCharacterRange(aTestFile, aFont, 0x2130, 0x2131)
-    printCharacter(aTestFile, aFont, 0x1D4A2)
-    printCharacter(aTestFile, aFont, 0x210B)
-    printCharacter(aTestFile, aFont, 0x2110)
-    printCharacterRange(aTestFile, aFont, 0x1D4A5, 0x1D4A6)
-    printCharacter(aTestFile, aFont, 0x2112)
-    printCharacter(aTestFile, aFont, 0x2133)
-    printCharacterRange(aTestFile, aFont, 0x1D4A9, 0x1D4AC)
-    printCharacter(aTestFile, aFont, 0x211B)
-    printCharacterRange(aTestFile, aFont, 0x1D4AE, 0x1D4B9)
-    printCharacter(aTestFile, aFont, 0x212F)
-    printCharacter(aTestFile, aFont, 0x1D4BB)
-    printCharacter(aTestFile, aFont, 0x210A)
-    printCharacterRange(aTestFile, aFont, 0x1D4BD, 0x1D4C3)
-    printCharacter(aTestFile, aFont, 0x2134)
-    printCharacterRange(aTestFile, aFont, 0x1D4C5, 0x1D4CF)
+    printCharacter(aTestFile, aIndex, 0x1D49C)
+    printCharacter(aTestFile, aIndex, 0x212C)
+    printCharacterRange(aTestFile, aIndex, 0x1D49E, 0x1D49F)
+    printCharacterRange(aTestFile, aIndex, 0x2130, 0x2131)
+    printCharacter(aTestFile, aIndex, 0x1D4A2)
+    printCharacter(aTestFile, aIndex, 0x210B)
+    printCharacter(aTestFile, aIndex, 0x2110)
+    printCharacterRange(aTestFile, aIndex, 0x1D4A5, 0x1D4A6)
+    printCharacter(aTestFile, aIndex, 0x2112)
+    printCharacter(aTestFile, aIndex, 0x2133)
+    printCharacterRange(aTestFile, aIndex, 0x1D4A9, 0x1D4AC)
+    printCharacter(aTestFile, aIndex, 0x211B)
+    printCharacterRange(aTestFile, aIndex, 0x1D4AE, 0x1D4B9)
+    printCharacter(aTestFile, aIndex, 0x212F)
+    printCharacter(aTestFile, aIndex, 0x1D4BB)
+    printCharacter(aTestFile, aIndex, 0x210A)
+    printCharacterRange(aTestFile, aIndex, 0x1D4BD, 0x1D4C3)
+    printCharacter(aTestFile, aIndex, 0x2134)
+    printCharacterRange(aTestFile, aIndex, 0x1D4C5, 0x1D4CF)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>bold-script</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D4D0, 0x1D503)
+    printCharacterRange(aTestFile, aIndex, 0x1D4D0, 0x1D503)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>fraktur</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D504, 0x1D505)
-    printCharacter(aTestFile, aFont, 0x212D)
-    printCharacterRange(aTestFile, aFont, 0x1D507, 0x1D50A)
-    printCharacter(aTestFile, aFont, 0x210C)
-    printCharacter(aTestFile, aFont, 0x2111)
-    printCharacterRange(aTestFile, aFont, 0x1D50D, 0x1D514)
-    printCharacter(aTestFile, aFont, 0x211C)
-    printCharacterRange(aTestFile, aFont, 0x1D516, 0x1D51C)
-    printCharacter(aTestFile, aFont, 0x2128)
-    printCharacterRange(aTestFile, aFont, 0x1D51E, 0x1D537)
+    printCharacterRange(aTestFile, aIndex, 0x1D504, 0x1D505)
+    printCharacter(aTestFile, aIndex, 0x212D)
+    printCharacterRange(aTestFile, aIndex, 0x1D507, 0x1D50A)
+    printCharacter(aTestFile, aIndex, 0x210C)
+    printCharacter(aTestFile, aIndex, 0x2111)
+    printCharacterRange(aTestFile, aIndex, 0x1D50D, 0x1D514)
+    printCharacter(aTestFile, aIndex, 0x211C)
+    printCharacterRange(aTestFile, aIndex, 0x1D516, 0x1D51C)
+    printCharacter(aTestFile, aIndex, 0x2128)
+    printCharacterRange(aTestFile, aIndex, 0x1D51E, 0x1D537)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>bold-fraktur</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D56C, 0x1D59F)
+    printCharacterRange(aTestFile, aIndex, 0x1D56C, 0x1D59F)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>sans-serif</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D5A0, 0x1D5D3)
+    printCharacterRange(aTestFile, aIndex, 0x1D5A0, 0x1D5D3)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D7E2, 0x1D7EB)
+    printCharacterRange(aTestFile, aIndex, 0x1D7E2, 0x1D7EB)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>bold-sans-serif</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D5D4, 0x1D607)
+    printCharacterRange(aTestFile, aIndex, 0x1D5D4, 0x1D607)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D756, 0x1D78F)
+    printCharacterRange(aTestFile, aIndex, 0x1D756, 0x1D78F)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D7EC, 0x1D7F5)
+    printCharacterRange(aTestFile, aIndex, 0x1D7EC, 0x1D7F5)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>sans-serif-italic</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D608, 0x1D63B)
+    printCharacterRange(aTestFile, aIndex, 0x1D608, 0x1D63B)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>sans-serif-bold-italic</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D63C, 0x1D66F)
+    printCharacterRange(aTestFile, aIndex, 0x1D63C, 0x1D66F)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D790, 0x1D7C9)
+    printCharacterRange(aTestFile, aIndex, 0x1D790, 0x1D7C9)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>monospace</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D670, 0x1D6A3)
+    printCharacterRange(aTestFile, aIndex, 0x1D670, 0x1D6A3)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D7F6, 0x1D7FF)
+    printCharacterRange(aTestFile, aIndex, 0x1D7F6, 0x1D7FF)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>double-struck</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D538, 0x1D539)
-    printCharacter(aTestFile, aFont, 0x2102)
-    printCharacterRange(aTestFile, aFont, 0x1D53B, 0x1D53E)
-    printCharacter(aTestFile, aFont, 0x210D)
-    printCharacterRange(aTestFile, aFont, 0x1D540, 0x1D544)
-    printCharacter(aTestFile, aFont, 0x2115)
-    printCharacter(aTestFile, aFont, 0x1D546)
-    printCharacterRange(aTestFile, aFont, 0x2119, 0x211A)
-    printCharacter(aTestFile, aFont, 0x211D)
-    printCharacterRange(aTestFile, aFont, 0x1D54A, 0x1D550)
-    printCharacter(aTestFile, aFont, 0x2124)
-    printCharacterRange(aTestFile, aFont, 0x1D552, 0x1D56B)
+    printCharacterRange(aTestFile, aIndex, 0x1D538, 0x1D539)
+    printCharacter(aTestFile, aIndex, 0x2102)
+    printCharacterRange(aTestFile, aIndex, 0x1D53B, 0x1D53E)
+    printCharacter(aTestFile, aIndex, 0x210D)
+    printCharacterRange(aTestFile, aIndex, 0x1D540, 0x1D544)
+    printCharacter(aTestFile, aIndex, 0x2115)
+    printCharacter(aTestFile, aIndex, 0x1D546)
+    printCharacterRange(aTestFile, aIndex, 0x2119, 0x211A)
+    printCharacter(aTestFile, aIndex, 0x211D)
+    printCharacterRange(aTestFile, aIndex, 0x1D54A, 0x1D550)
+    printCharacter(aTestFile, aIndex, 0x2124)
+    printCharacterRange(aTestFile, aIndex, 0x1D552, 0x1D56B)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1D7D8, 0x1D7E1)
+    printCharacterRange(aTestFile, aIndex, 0x1D7D8, 0x1D7E1)
     print("<br/>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1EEA1, 0x1EEA3)
-    printCharacterRange(aTestFile, aFont, 0x1EEA5, 0x1EEA9)
-    printCharacterRange(aTestFile, aFont, 0x1EEAB, 0x1EEBB)
+    printCharacterRange(aTestFile, aIndex, 0x1EEA1, 0x1EEA3)
+    printCharacterRange(aTestFile, aIndex, 0x1EEA5, 0x1EEA9)
+    printCharacterRange(aTestFile, aIndex, 0x1EEAB, 0x1EEBB)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>initial</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1EE21, 0x1EE22)
-    printCharacter(aTestFile, aFont, 0x1EE24)
-    printCharacter(aTestFile, aFont, 0x1EE27)
-    printCharacterRange(aTestFile, aFont, 0x1EE29, 0x1EE32)
-    printCharacterRange(aTestFile, aFont, 0x1EE34, 0x1EE37)
-    printCharacter(aTestFile, aFont, 0x1EE39)
-    printCharacter(aTestFile, aFont, 0x1EE3B)
+    printCharacterRange(aTestFile, aIndex, 0x1EE21, 0x1EE22)
+    printCharacter(aTestFile, aIndex, 0x1EE24)
+    printCharacter(aTestFile, aIndex, 0x1EE27)
+    printCharacterRange(aTestFile, aIndex, 0x1EE29, 0x1EE32)
+    printCharacterRange(aTestFile, aIndex, 0x1EE34, 0x1EE37)
+    printCharacter(aTestFile, aIndex, 0x1EE39)
+    printCharacter(aTestFile, aIndex, 0x1EE3B)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>tailed</td><td>", file=aTestFile)
-    printCharacter(aTestFile, aFont, 0x1EE42)
-    printCharacter(aTestFile, aFont, 0x1EE47)
-    printCharacter(aTestFile, aFont, 0x1EE49)
-    printCharacter(aTestFile, aFont, 0x1EE4B)
-    printCharacterRange(aTestFile, aFont, 0x1EE4D, 0x1EE4F)
-    printCharacterRange(aTestFile, aFont, 0x1EE51, 0x1EE52)
-    printCharacter(aTestFile, aFont, 0x1EE54)
-    printCharacter(aTestFile, aFont, 0x1EE57)
-    printCharacter(aTestFile, aFont, 0x1EE59)
-    printCharacter(aTestFile, aFont, 0x1EE5B)
-    printCharacter(aTestFile, aFont, 0x1EE5D)
-    printCharacter(aTestFile, aFont, 0x1EE5F)
+    printCharacter(aTestFile, aIndex, 0x1EE42)
+    printCharacter(aTestFile, aIndex, 0x1EE47)
+    printCharacter(aTestFile, aIndex, 0x1EE49)
+    printCharacter(aTestFile, aIndex, 0x1EE4B)
+    printCharacterRange(aTestFile, aIndex, 0x1EE4D, 0x1EE4F)
+    printCharacterRange(aTestFile, aIndex, 0x1EE51, 0x1EE52)
+    printCharacter(aTestFile, aIndex, 0x1EE54)
+    printCharacter(aTestFile, aIndex, 0x1EE57)
+    printCharacter(aTestFile, aIndex, 0x1EE59)
+    printCharacter(aTestFile, aIndex, 0x1EE5B)
+    printCharacter(aTestFile, aIndex, 0x1EE5D)
+    printCharacter(aTestFile, aIndex, 0x1EE5F)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>looped</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1EE80, 0x1EE89)
-    printCharacterRange(aTestFile, aFont, 0x1EE8B, 0x1EE9B)
+    printCharacterRange(aTestFile, aIndex, 0x1EE80, 0x1EE89)
+    printCharacterRange(aTestFile, aIndex, 0x1EE8B, 0x1EE9B)
     print("</td></tr>", file=aTestFile)
 
     print("<tr><td>stretched</td><td>", file=aTestFile)
-    printCharacterRange(aTestFile, aFont, 0x1EE61, 0x1EE62)
-    printCharacter(aTestFile, aFont, 0x1EE64)
-    printCharacterRange(aTestFile, aFont, 0x1EE67, 0x1EE6A)
-    printCharacterRange(aTestFile, aFont, 0x1EE6C, 0x1EE72)
-    printCharacterRange(aTestFile, aFont, 0x1EE74, 0x1EE77)
-    printCharacterRange(aTestFile, aFont, 0x1EE79, 0x1EE7C)
-    printCharacter(aTestFile, aFont, 0x1EE7E)
+    printCharacterRange(aTestFile, aIndex, 0x1EE61, 0x1EE62)
+    printCharacter(aTestFile, aIndex, 0x1EE64)
+    printCharacterRange(aTestFile, aIndex, 0x1EE67, 0x1EE6A)
+    printCharacterRange(aTestFile, aIndex, 0x1EE6C, 0x1EE72)
+    printCharacterRange(aTestFile, aIndex, 0x1EE74, 0x1EE77)
+    printCharacterRange(aTestFile, aIndex, 0x1EE79, 0x1EE7C)
+    printCharacter(aTestFile, aIndex, 0x1EE7E)
     print("</td></tr>", file=aTestFile)
 
     print("</table>\n", file=aTestFile)
 
-def printScriptedOperators(aTestFile, aFont):
+def printScriptedOperators(aTestFile, aIndex):
     print("\
     <h2 id=\"scriptedop_ssty\">Prescripted Operators / ssty tables</h2>\
 <p>Source: <a href=\"http://www.w3.org/TR/MathML3/appendixc.html#oper-dict.entries-table\">MathML Operator Dictionary</a></p>\
@@ -463,11 +582,11 @@ def printScriptedOperators(aTestFile, aFont):
         print("<tr><td>", file=aTestFile)
         printCodePoint(aTestFile, u)
         print("</td>", file=aTestFile)
-        if u in aFont:
+        if u in aIndex:
             print("<td><math><mn>A</mn><mo>&#x%X;</mo></math></td>\
 <td><math><msup><mn>A</mn><mo>&#x%X;</mo></msup></math></td>\
 <td><math><msup><mn>A</mn><msup><mn>B</mn><mo>&#x%X;</mo></msup></math></msup></td>" % (u, u, u), file=aTestFile)
-            glyph = aFont[u]
+            glyph = aIndex[u]
             print("<td>", file=aTestFile)
             foundSSTY = False
             for table in glyph.getPosSub("*"):
@@ -594,8 +713,39 @@ def printMathConstants(aTestFile, aFont):
 
     print("</table>\n", file=aTestFile)
 
-def main(aDirectory, aFont):
-    testfile = open("./%s/index.html" % aDirectory, "w+")
+def writeAtomically(aPath, aContent):
+    # Write to a temporary file first and rename it, so that an interrupted
+    # run never replaces a good file with a half-written one.
+    temporaryPath = "%s.%d.tmp" % (aPath, os.getpid())
+    with open(temporaryPath, "w") as f:
+        f.write(aContent)
+    os.replace(temporaryPath, aPath)
+
+# Sections of the testcase after the font info, as (fragment file name,
+# title, function printing the section from the font and the glyph index).
+kSections = [
+    ("mathconstants.html", "MathConstants tables",
+     lambda aTestFile, aFont, aIndex: printMathConstants(aTestFile, aFont)),
+    ("mathvariants.html", "MathVariants Table",
+     lambda aTestFile, aFont, aIndex:
+     printMathVariants(aTestFile, aIndex, aFont.math.MinConnectorOverlap)),
+    ("largeop.html", "Large Operators",
+     lambda aTestFile, aFont, aIndex: printLargeOp(aTestFile, aIndex)),
+    ("math_alpha_char.html", "Mathematical Alphanumeric Characters",
+     lambda aTestFile, aFont, aIndex:
+     printMathematicalAlphanumericCharacters(aTestFile, aIndex)),
+    ("scriptedop_ssty.html", "Prescripted Operators / ssty tables",
+     lambda aTestFile, aFont, aIndex:
+     printScriptedOperators(aTestFile, aIndex)),
+    ("unicode_coverage.html", "Unicode Coverage",
+     lambda aTestFile, aFont, aIndex: printUnicodeCoverage(aTestFile, aIndex)),
+]
+
+def generateHTMLTestContent(aFontName, aFont, aIndex, aSharded=False):
+    # Assemble the testcase for an opened font in memory. Return the content
+    # of index.html and, in sharded mode, a dictionary of the section
+    # fragments to write next to it.
+    testfile = StringIO()
     print("\
 <!doctype html>\n\
 <html><head><title>%s</title><meta charset=\"utf-8\"/>\n\
@@ -605,25 +755,89 @@ def main(aDirectory, aFont):
     <h1>%s</h1>\n\
     <a href=\"./CheckFontLog.txt\">CheckFontLog.txt</a> - \
     <a href=\"./CheckFontError.txt\">CheckFontError.txt</a>" %
-          (aFont, kStyle, aFont), file=testfile)
-
-    font = fontforge.open("%s/%s" % (aDirectory, aFont))
-    printBasicFontInfo(testfile, font)
-    printMathConstants(testfile, font)
-    printMathVariants(testfile, font)
-    printLargeOp(testfile, font)
-    printMathematicalAlphanumericCharacters(testfile, font)
-    printScriptedOperators(testfile, font)
-    printUnicodeCoverage(testfile, font)
-    font.close()
+          (aFontName, kStyle, aFontName), file=testfile)
+
+    printBasicFontInfo(testfile, aFont)
+    fragments = {}
+    for fileName, title, printSection in kSections:
+        if aSharded:
+            fragment = StringIO()
+            printSection(fragment, aFont, aIndex)
+            fragments[fileName] = fragment.getvalue()
+            testfile.write(kLazySectionTemplate % (fileName, title, fileName,
+                                                   fileName))
+        else:
+            printSection(testfile, aFont, aIndex)
+    if aSharded:
+        print(kLazySectionScript, file=testfile)
+    print(kUnicodeBlockScript, file=testfile)
 
     print("\
   </body>\n\
 </html>", file=testfile)
+    return testfile.getvalue(), fragments
+
+def generateHTMLTest(aDirectory, aFontName, aFont, aIndex=None,
+                     aSharded=False):
+    # Write the testcase for an opened font into aDirectory/index.html. In
+    # sharded mode, index.html only contains the font info and each section
+    # is written into its own fragment, fetched when scrolled into view.
+    index = aIndex
+    if index is None:
+        index = GlyphIndex(aFont)
+    content, fragments = generateHTMLTestContent(aFontName, aFont, index,
+                                                 aSharded)
+    # Write the fragments first, so that index.html never refers to missing
+    # ones.
+    for fileName, fragment in fragments.items():
+        writeAtomically("./%s/%s" % (aDirectory, fileName), fragment)
+    writeAtomically("./%s/index.html" % aDirectory, content)
+    writeCoverage("./%s/coverage.json" % aDirectory, aFontName, index)
+
+def writeCoverage(aPath, aFontName, aIndex):
+    # Compact JSON version of the Unicode coverage, one block per line so
+    # that the coverage of two versions of a font can be diffed.
+    coverage = unicodeCoverage(aIndex)
+    lines = ["{\"font\": %s, \"covered\": %d, \"blocks\": [" %
+             (json.dumps(aFontName),
+              sum(block["covered"] for block in coverage))]
+    lines.append(",\n".join(json.dumps(block, separators=(",", ":"))
+                            for block in coverage))
+    lines.append("]}\n")
+    writeAtomically(aPath, "\n".join(lines))
+
+def benchmark(aDirectory, aFontName, aRepeat=10):
+    # Time the generation of the testcase for a font (e.g. STIX Two Math),
+    # without writing anything to disk.
+    start = time.time()
+    font = fontforge.open("%s/%s" % (aDirectory, aFontName))
+    openTime = time.time() - start
+    start = time.time()
+    index = GlyphIndex(font)
+    indexTime = time.time() - start
+    start = time.time()
+    for i in range(aRepeat):
+        content, fragments = generateHTMLTestContent(aFontName, font, index)
+    generateTime = (time.time() - start) / aRepeat
+    font.close()
+    print("%s: %d glyphs, %d bytes of HTML; open %.3fs, index %.3fs, "
+          "testcase %.3fs (average of %d runs)" %
+          (aFontName, len(index.byName), len(content), openTime, indexTime,
+           generateTime, aRepeat))
+
+def main(aDirectory, aFont, aSharded=False):
+    font = fontforge.open("%s/%s" % (aDirectory, aFont))
+    generateHTMLTest(aDirectory, aFont, font, None, aSharded)
+    font.close()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("usage: python %s [directory] [opentype-math-font]" % sys.argv[0],
-              file=sys.stderr)
-        exit(1)
-    main(sys.argv[1], sys.argv[2])
+    parser = argparse.ArgumentParser(description="Generate an HTML testcase for the math features of a font.")
+    parser.add_argument("directory", type=str, help="Directory containing the font, where index.html is written.")
+    parser.add_argument("font", type=str, help="File name of the OpenType MATH font.")
+    parser.add_argument("--sharded", action="store_true", help="Write a small index.html and one HTML fragment per section, loaded when scrolled into view.")
+    parser.add_argument("--benchmark", action="store_true", help="Time the generation of the testcase, without writing it.")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.directory, args.font)
+    else:
+        main(args.directory, args.font, args.sharded)
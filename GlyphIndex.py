@@ -0,0 +1,97 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Index of the glyphs of a fontforge font, built in a single pass when the
+# font is opened. CheckFont.py and GenerateHTMLTest.py query it instead of
+# calling into the fontforge bindings for each code point.
+
+class GlyphIndex:
+    def __init__(self, aFont):
+        self.font = aFont
+        self.byName = {}
+        self.byCodePoint = {}
+        self.unicodes = {}
+        self.verticalVariants = {}
+        self.horizontalVariants = {}
+        self.verticalComponents = {}
+        self.horizontalComponents = {}
+        self.boundingBoxes = {}
+        for glyph in aFont.glyphs():
+            self.update(glyph)
+
+    def update(self, aGlyph):
+        # (Re)index a glyph, e.g. after it has been created or modified.
+        name = aGlyph.glyphname
+        self.byName[name] = aGlyph
+        self.unicodes[name] = aGlyph.unicode
+        if aGlyph.unicode != -1:
+            self.byCodePoint[aGlyph.unicode] = aGlyph
+        if aGlyph.altuni:
+            for alternate in aGlyph.altuni:
+                self.byCodePoint.setdefault(alternate[0], aGlyph)
+        self.verticalVariants[name] = aGlyph.verticalVariants
+        self.horizontalVariants[name] = aGlyph.horizontalVariants
+        self.verticalComponents[name] = aGlyph.verticalComponents
+        self.horizontalComponents[name] = aGlyph.horizontalComponents
+        self.boundingBoxes.pop(name, None)
+
+    def glyph(self, aKey):
+        # Return the glyph for a code point or a glyph name, or None.
+        if isinstance(aKey, int):
+            return self.byCodePoint.get(aKey)
+        return self.byName.get(aKey)
+
+    def __contains__(self, aKey):
+        return self.glyph(aKey) is not None
+
+    def __getitem__(self, aKey):
+        glyph = self.glyph(aKey)
+        if glyph is None:
+            raise KeyError(aKey)
+        return glyph
+
+    def boundingBox(self, aKey):
+        name = self[aKey].glyphname
+        if name not in self.boundingBoxes:
+            self.boundingBoxes[name] = self.byName[name].boundingBox()
+        return self.boundingBoxes[name]
+
+    def height(self, aKey):
+        box = self.boundingBox(aKey)
+        return box[3] - box[1]
+
+    def width(self, aKey):
+        box = self.boundingBox(aKey)
+        return box[2] - box[0]
+
+    def variants(self, aKey, aVertical):
+        name = self[aKey].glyphname
+        if aVertical:
+            return self.verticalVariants[name]
+        return self.horizontalVariants[name]
+
+    def components(self, aKey, aVertical):
+        name = self[aKey].glyphname
+        if aVertical:
+            return self.verticalComponents[name]
+        return self.horizontalComponents[name]
+
+    def codePoints(self):
+        # Sorted list of the code points of the glyphs.
+        return sorted(u for u in self.unicodes.values() if u != -1)
+
+    def stretchyGlyphs(self):
+        # Unicode glyphs with size variants or a glyph assembly, as a list of
+        # (glyph, isHorizontal, isVertical) in font order.
+        stretchy = []
+        for name, glyph in self.byName.items():
+            if glyph.unicode == -1:
+                continue
+            isHorizontal = (self.horizontalVariants[name] is not None or
+                            self.horizontalComponents[name] is not None)
+            isVertical = (self.verticalVariants[name] is not None or
+                          self.verticalComponents[name] is not None)
+            if isHorizontal or isVertical:
+                stretchy.append((glyph, isHorizontal, isVertical))
+        return stretchy
@@ -0,0 +1,378 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Sizes reachable by the stretchy glyphs of a math font: its size variants
+# and its glyph assembly, laid out as described in the MathML Core
+# specification (https://w3c.github.io/mathml-core/#the-glyph-assembly).
+# The extenders are all repeated r times and the same overlap o is used for
+# all the connections, with
+#   MinConnectorOverlap <= o <= min(connector lengths of the connections)
+# so the assembly with r repetitions can take any size in a range computed
+# from a few sums over its parts. The ranges of all r are used to find the
+# sizes, above the largest variant, that the glyph can not take exactly.
+# The same ranges give a sorted size table of the variants and assemblies,
+# in which the choice of a layout engine for a target size is found by
+# binary search.
+#
+# The constructions are read from the glyph index used by CheckFont.py or,
+# when this script is run, from the MATH table of a font with fonttools.
+
+from __future__ import print_function
+from bisect import bisect_left
+from math import sqrt
+import argparse
+import sys
+import time
+
+# A part is a (glyph name, is extender, start connector length, end connector
+# length, full advance) tuple, like in fontforge's verticalComponents and
+# horizontalComponents.
+
+# Number of repetitions of the extenders after which the gaps between the
+# assemblies are considered to repeat forever.
+kMaxRepeat = 1000
+
+# List op "largeop" operators. See http://www.w3.org/TR/MathML3/appendixc.html
+kLargeOperators = [0x220F, 0x2210, 0x2211, 0x222B, 0x222C, 0x222D, 0x222E,
+                   0x222F, 0x2230, 0x2231, 0x2232, 0x2233, 0x22C0, 0x22C1,
+                   0x22C2, 0x22C3, 0x2A00, 0x2A01, 0x2A02, 0x2A03, 0x2A04,
+                   0x2A05, 0x2A06, 0x2A07, 0x2A08, 0x2A09, 0x2A0A, 0x2A0B,
+                   0x2A0C, 0x2A0D, 0x2A0E, 0x2A0F, 0x2A10, 0x2A11, 0x2A12,
+                   0x2A13, 0x2A14, 0x2A15, 0x2A16, 0x2A17, 0x2A18, 0x2A19,
+                   0x2A1A, 0x2A1B, 0x2A1C, 0x2AFC, 0x2AFF]
+
+# Parameters describing the size of stretchy operators of the MathVariants
+# table of GenerateHTMLTest.py as a geometric sequence.
+kStartSize = .25 # size of the first operator (in em)
+kConsecutiveSizeRatio = sqrt(2) # ratio between size i+1 and size i
+kNumberOfSizes = 12 # number of sizes
+
+def testSizes(aVertical):
+    # The sizes (in em) that the stretched operators of a row of the
+    # MathVariants table are given: the height + depth of an mspace for
+    # vertical operators and the width of an mover base for horizontal ones.
+    if aVertical:
+        return [kStartSize * kConsecutiveSizeRatio ** (i - 1)
+                for i in range(1, kNumberOfSizes)]
+    return [i * .5 for i in range(1, kNumberOfSizes)]
+
+class StretchyGlyph:
+    # Precomputed table of the construction of a glyph in one direction: the
+    # sorted sizes of its variants and the sums over the parts of its
+    # assembly, from which the size range of the assembly is computed in
+    # constant time for any number of repetitions.
+    def __init__(self, aName, aVertical, aVariants, aParts,
+                 aMinConnectorOverlap):
+        self.name = aName
+        self.vertical = aVertical
+        # List of (size, glyph name) sorted by size.
+        self.variants = sorted((size, glyph) for glyph, size in aVariants)
+        self.parts = tuple(aParts or ())
+        self.minConnectorOverlap = aMinConnectorOverlap
+        extenders = [part for part in self.parts if part[1]]
+        self.extenderCount = len(extenders)
+        self.extenderAdvance = sum(part[4] for part in extenders)
+        self.nonExtenderCount = len(self.parts) - self.extenderCount
+        self.nonExtenderAdvance = sum(part[4] for part in self.parts
+                                      if not part[1])
+        # The connections, hence the maximum overlap, only depend on whether
+        # the extenders are absent, present once or repeated.
+        self.maxOverlaps = [self.maxOverlap(r) for r in range(3)]
+        self.sizeBounds = None
+        self.sizeChoices = None
+
+    def partSequence(self, aRepeat):
+        sequence = []
+        for part in self.parts:
+            sequence.extend([part] * (aRepeat if part[1] else 1))
+        return sequence
+
+    def connections(self, aRepeat):
+        sequence = self.partSequence(aRepeat)
+        return list(zip(sequence, sequence[1:]))
+
+    def maxOverlap(self, aRepeat):
+        overlaps = [min(first[3], second[2])
+                    for first, second in self.connections(aRepeat)]
+        return min(overlaps) if overlaps else 0
+
+    def badConnections(self):
+        # Connections (as pairs of glyph names) whose connectors are shorter
+        # than MinConnectorOverlap, so that the parts can not be joined.
+        bad = []
+        for first, second in self.connections(2):
+            if min(first[3], second[2]) < self.minConnectorOverlap and \
+               (first[0], second[0]) not in bad:
+                bad.append((first[0], second[0]))
+        return bad
+
+    def partCount(self, aRepeat):
+        return self.nonExtenderCount + aRepeat * self.extenderCount
+
+    def assemblyRange(self, aRepeat):
+        # The (minimum, maximum) size of the assembly with each extender
+        # repeated aRepeat times, or None if it has no parts.
+        count = self.partCount(aRepeat)
+        if count == 0:
+            return None
+        advance = self.nonExtenderAdvance + aRepeat * self.extenderAdvance
+        maxOverlap = max(self.minConnectorOverlap,
+                         self.maxOverlaps[min(aRepeat, 2)])
+        return (advance - (count - 1) * maxOverlap,
+                advance - (count - 1) * self.minConnectorOverlap)
+
+    def grows(self):
+        # Whether repeating the extenders makes the assembly larger.
+        return self.extenderCount > 0 and \
+            self.assemblyRange(3)[1] > self.assemblyRange(2)[1]
+
+    def assemblyRanges(self):
+        # Return the size ranges of the assembly for increasing repetitions,
+        # until they overlap, and whether the gaps between them repeat
+        # forever.
+        ranges = [self.assemblyRange(r) for r in range(3)]
+        ranges = [r for r in ranges if r is not None]
+        if not self.grows():
+            return ranges, False
+        minimum, maximum = self.assemblyRange(2)
+        minimumGrowth = self.assemblyRange(3)[0] - minimum
+        maximumGrowth = self.assemblyRange(3)[1] - maximum
+        # From r = 2, the gap between the assemblies with r and r + 1
+        # repetitions shrinks by maximumGrowth - minimumGrowth each time.
+        gap = minimum + minimumGrowth - maximum
+        if gap <= 0:
+            return ranges, False
+        shrink = maximumGrowth - minimumGrowth
+        if shrink == 0:
+            return ranges + [self.assemblyRange(3)], True
+        repeat = min(kMaxRepeat, 3 + int(gap // shrink))
+        ranges += [self.assemblyRange(r) for r in range(3, repeat + 1)]
+        return ranges, repeat == kMaxRepeat
+
+    def largestVariant(self):
+        return self.variants[-1][0] if self.variants else 0
+
+    def gaps(self):
+        # Return the ranges (start, end) of sizes larger than the largest
+        # variant that neither a variant nor the assembly can take exactly,
+        # end being None when the glyph can not stretch beyond start, and
+        # whether the last gap repeats forever.
+        ranges, periodic = self.assemblyRanges()
+        reached = self.largestVariant()
+        if not self.variants and ranges:
+            reached = min(ranges)[0]
+        gaps = []
+        for minimum, maximum in sorted(ranges):
+            if minimum > reached:
+                gaps.append((reached, minimum))
+            reached = max(reached, maximum)
+        if not self.grows():
+            gaps.append((reached, None))
+        return gaps, periodic
+
+    def direction(self):
+        return "vertical" if self.vertical else "horizontal"
+
+    def assemblyLayout(self, aRepeat, aSize):
+        # Lay out the assembly with each extender repeated aRepeat times as
+        # close as possible to aSize. Return a list of (glyph name, offset
+        # along the stretch axis) and the size of the assembly.
+        minimum, maximum = self.assemblyRange(aRepeat)
+        size = min(max(aSize, minimum), maximum)
+        sequence = self.partSequence(aRepeat)
+        overlap = 0
+        if len(sequence) > 1:
+            advance = sum(part[4] for part in sequence)
+            overlap = (advance - size) / float(len(sequence) - 1)
+        layout = []
+        offset = 0
+        for part in sequence:
+            layout.append((part[0], offset))
+            offset += part[4] - overlap
+        return layout, size
+
+    def sizeTable(self):
+        # The choices made by the layout engine, as described in MathML Core:
+        # the first variant at least as large as the target size, otherwise
+        # the assembly with the least repetitions reaching it. Return the
+        # sorted list of the largest target size of each choice and the list
+        # of choices, a choice being a variant (glyph name) or a number of
+        # repetitions of the assembly. It is computed once, the assemblies
+        # being listed up to kMaxRepeat repetitions.
+        if self.sizeBounds is None:
+            bounds = [size for size, _ in self.variants]
+            choices = [glyph for _, glyph in self.variants]
+            if self.parts:
+                first = 0 if self.partCount(0) else 1
+                last = kMaxRepeat if self.grows() else first
+                for repeat in range(first, last + 1):
+                    # The maximum size is reached with the smallest overlap.
+                    maximum = self.nonExtenderAdvance + \
+                        repeat * self.extenderAdvance - \
+                        (self.partCount(repeat) - 1) * self.minConnectorOverlap
+                    # Smaller assemblies are never chosen.
+                    if not bounds or maximum > bounds[-1]:
+                        bounds.append(maximum)
+                        choices.append(repeat)
+            self.sizeBounds = bounds
+            self.sizeChoices = choices
+        return self.sizeBounds, self.sizeChoices
+
+    def selectIndex(self, aSize):
+        # Index in the size table of the choice for a target size, found by
+        # binary search. The largest choice is used for the sizes that can
+        # not be reached. Return None if the glyph has no variants nor
+        # assembly.
+        bounds, choices = self.sizeTable()
+        if not choices:
+            return None
+        return min(bisect_left(bounds, aSize), len(choices) - 1)
+
+    def select(self, aSize):
+        index = self.selectIndex(aSize)
+        return None if index is None else self.sizeChoices[index]
+
+    def stretch(self, aSize):
+        # Glyphs used to stretch the operator to aSize. Return a list of
+        # (glyph name, offset) and the size of the result.
+        index = self.selectIndex(aSize)
+        if index is None:
+            return [(self.name, 0)], 0
+        choice = self.sizeChoices[index]
+        if isinstance(choice, int):
+            return self.assemblyLayout(choice, aSize)
+        return [(choice, 0)], self.sizeBounds[index]
+
+    def formatChoice(self, aChoice):
+        if aChoice is None:
+            return "N/A"
+        if isinstance(aChoice, int):
+            # The number of repetitions of the extenders.
+            return "assembly x%d" % aChoice if self.extenderCount \
+                else "assembly"
+        return aChoice
+
+def glyphIndexConstruction(aIndex, aGlyphName, aVertical,
+                           aMinConnectorOverlap):
+    # Construction of a glyph of a fontforge font, from its GlyphIndex. The
+    # sizes of the variants are measured on their bounding boxes.
+    variants = []
+    for name in (aIndex.variants(aGlyphName, aVertical) or "").split():
+        if name in aIndex:
+            variants.append((name, aIndex.height(name) if aVertical
+                             else aIndex.width(name)))
+    return StretchyGlyph(aGlyphName, aVertical, variants,
+                         aIndex.components(aGlyphName, aVertical),
+                         aMinConnectorOverlap)
+
+def glyphIndexConstructions(aIndex, aMinConnectorOverlap):
+    # Stretchy glyphs of a fontforge font, from its GlyphIndex.
+    constructions = []
+    for glyph, isHorizontal, isVertical in aIndex.stretchyGlyphs():
+        for vertical in [True, False]:
+            if not (isVertical if vertical else isHorizontal):
+                continue
+            constructions.append(glyphIndexConstruction(
+                aIndex, glyph.glyphname, vertical, aMinConnectorOverlap))
+    return constructions
+
+def mathTableConstructions(aFont):
+    # Stretchy glyphs of a fonttools font, from its MATH table.
+    constructions = []
+    if "MATH" not in aFont:
+        return constructions
+    variants = aFont["MATH"].table.MathVariants
+    if variants is None:
+        return constructions
+    for vertical in [True, False]:
+        prefix = "Vert" if vertical else "Horiz"
+        coverage = getattr(variants, "%sGlyphCoverage" % prefix)
+        if coverage is None:
+            continue
+        for name, construction in zip(
+                coverage.glyphs,
+                getattr(variants, "%sGlyphConstruction" % prefix)):
+            parts = None
+            if construction.GlyphAssembly:
+                parts = [(part.glyph, bool(part.PartFlags & 1),
+                          part.StartConnectorLength, part.EndConnectorLength,
+                          part.FullAdvance)
+                         for part in construction.GlyphAssembly.PartRecords]
+            constructions.append(StretchyGlyph(
+                name, vertical,
+                [(record.VariantGlyph, record.AdvanceMeasurement)
+                 for record in construction.MathGlyphVariantRecord],
+                parts, variants.MinConnectorOverlap))
+    return constructions
+
+def formatGaps(aGaps, aPeriodic):
+    text = []
+    for start, end in aGaps:
+        if end is None:
+            text.append("above %d" % start)
+        else:
+            text.append("%d-%d" % (start, end))
+    if aPeriodic:
+        text.append("and so on")
+    return ", ".join(text)
+
+if __name__ == "__main__":
+    from fontTools.ttLib import TTFont
+    parser = argparse.ArgumentParser(description="Report the sizes that the stretchy glyphs of a math font can not take exactly.")
+    parser.add_argument("font", type=str, help="Font to verify.")
+    parser.add_argument("--all", action="store_true", help="Also list the glyphs without gaps.")
+    parser.add_argument("--selection", action="store_true", help="Also print the variant or assembly chosen for each size of the MathVariants table of GenerateHTMLTest.py.")
+    parser.add_argument("--sizes", type=int, default=0, help="Simulate the size selection for that many target sizes per glyph, evenly spaced up to --max-size, and report the sizes that are not covered.")
+    parser.add_argument("--max-size", type=float, default=10, help="Largest target size of --sizes, in em (default: %(default)s).")
+    args = parser.parse_args()
+
+    font = TTFont(args.font, lazy=True)
+    unitsPerEm = font["head"].unitsPerEm
+    start = time.time()
+    constructions = mathTableConstructions(font)
+    loaded = time.time() - start
+    failures = 0
+    for construction in constructions:
+        gaps, periodic = construction.gaps()
+        bad = construction.badConnections()
+        status = "OK"
+        if bad or [gap for gap in gaps if gap[1] is not None]:
+            status = "Failed"
+            failures += 1
+        elif not args.all:
+            continue
+        print("%s (%s): %s" % (construction.name, construction.direction(),
+                               status))
+        if gaps:
+            print("  unreachable sizes: %s" % formatGaps(gaps, periodic))
+        for first, second in bad:
+            print("  connection %s-%s shorter than MinConnectorOverlap" %
+                  (first, second))
+        if args.selection:
+            for size in testSizes(construction.vertical):
+                print("  %.2fem: %s" % (size, construction.formatChoice(
+                    construction.select(size * unitsPerEm))))
+    print("Verified %d constructions (%d failed) in %.3fs" %
+          (len(constructions), failures, time.time() - start - loaded))
+
+    if args.sizes > 0:
+        # The size selection of a layout engine, for many sizes: the result
+        # is smaller than the target when the glyph can not stretch enough,
+        # and larger when the target falls into a gap.
+        start = time.time()
+        smaller = larger = 0
+        for construction in constructions:
+            for i in range(1, args.sizes + 1):
+                target = i * args.max_size * unitsPerEm / args.sizes
+                _, size = construction.stretch(target)
+                if size < target:
+                    smaller += 1
+                elif size > target and \
+                     isinstance(construction.select(target), int):
+                    larger += 1
+        count = args.sizes * len(constructions)
+        print("Simulated %d sizes in %.3fs: %d too large for the glyph, %d "
+              "falling into a gap of the assembly" %
+              (count, time.time() - start, smaller, larger))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,379 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Render the glyph-level content of the tests of GenerateHTMLTest.py without
+# a browser and compare it with reference images, so that visual regressions
+# (e.g. in the stretchy operators or the large operators after a font update)
+# are caught automatically. For the math font of each family:
+# - some lines of text are shaped with HarfBuzz;
+# - each large operator is drawn in text and display size, the latter being
+#   the first variant of height at least DisplayOperatorMinHeight;
+# - each stretchy operator is drawn at the sizes of the MathVariants table,
+#   using the size variants and glyph assembly chosen by MathStretchy.py.
+# Glyphs are rasterized with FreeType. Their bounding boxes and their bitmaps
+# are cached per (glyph, size), so that the parts of the assemblies and the
+# glyphs shared by several tests are only rasterized once. The families are
+# rendered in parallel. Images are stored as 8-bit PGM files.
+# This requires uharfbuzz, freetype-py and numpy.
+
+from __future__ import print_function
+from collections import OrderedDict
+from fontTools.pens.boundsPen import BoundsPen
+from fontTools.ttLib import TTFont, woff2
+from io import BytesIO
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import freetype
+    import numpy
+    import uharfbuzz
+except ImportError:
+    freetype = numpy = uharfbuzz = None
+
+from BuildFonts import kFamilies, kRootDirectory
+from MathStretchy import kLargeOperators, mathTableConstructions, testSizes
+
+kDefaultReferenceDirectory = os.path.join(kRootDirectory, "RenderReferences")
+kDefaultOutputDirectory = os.path.join(kRootDirectory, ".cache",
+                                       "render-tests")
+kDefaultPixelsPerEm = 32
+# Pixels whose gray level differ by more than this are counted as different.
+kDefaultTolerance = 32
+# Space around each drawing and between the samples of a row (in em).
+kMargin = .25
+
+# Lines of text shaped with HarfBuzz: (test name, code point ranges). The
+# characters missing from the font are skipped.
+kTextTests = [
+    ("basic-latin", [(0x21, 0x7E)]),
+    ("greek", [(0x391, 0x3A9), (0x3B1, 0x3C9)]),
+    ("operators", [(0x2200, 0x22FF)]),
+    ("alphanumeric", [(0x1D400, 0x1D7FF)]),
+]
+kCharactersPerLine = 32
+
+def mathFont(aFamily):
+    # The WOFF2 version of the math font analyzed by AnalyzeFont.py.
+    return os.path.join(kRootDirectory, aFamily, "%s.woff2" %
+                        os.path.splitext(kFamilies[aFamily]["check"])[0])
+
+class GlyphRenderer:
+    # A font loaded into fontTools, HarfBuzz and FreeType from the same sfnt
+    # data, with cached glyph bounding boxes and bitmaps.
+    def __init__(self, aPath, aPixelsPerEm):
+        sfntData = BytesIO()
+        with open(aPath, "rb") as f:
+            woff2.decompress(f, sfntData)
+        sfntData = sfntData.getvalue()
+        self.font = TTFont(BytesIO(sfntData), lazy=True)
+        self.glyphSet = self.font.getGlyphSet()
+        self.unitsPerEm = self.font["head"].unitsPerEm
+        self.pixelsPerEm = aPixelsPerEm
+        self.scale = float(aPixelsPerEm) / self.unitsPerEm
+        self.hbFont = uharfbuzz.Font(uharfbuzz.Face(uharfbuzz.Blob(sfntData)))
+        self.face = freetype.Face(BytesIO(sfntData))
+        self.face.set_pixel_sizes(0, aPixelsPerEm)
+        self.boundingBoxes = {}
+        self.bitmaps = {}
+        self.hits = 0
+
+    def boundingBox(self, aGlyphName):
+        # (xMin, yMin, xMax, yMax) in font units.
+        if aGlyphName not in self.boundingBoxes:
+            pen = BoundsPen(self.glyphSet)
+            self.glyphSet[aGlyphName].draw(pen)
+            self.boundingBoxes[aGlyphName] = pen.bounds or (0, 0, 0, 0)
+        return self.boundingBoxes[aGlyphName]
+
+    def bitmap(self, aGlyphId):
+        # The anti-aliased bitmap of a glyph, as a (left, top, array) triple
+        # where top is the distance from the baseline to the first row.
+        key = (aGlyphId, self.pixelsPerEm)
+        if key in self.bitmaps:
+            self.hits += 1
+            return self.bitmaps[key]
+        self.face.load_glyph(aGlyphId, freetype.FT_LOAD_RENDER |
+                             freetype.FT_LOAD_NO_HINTING)
+        glyph = self.face.glyph
+        bitmap = glyph.bitmap
+        if bitmap.rows and bitmap.width:
+            array = numpy.array(bitmap.buffer, dtype=numpy.uint8).reshape(
+                bitmap.rows, bitmap.pitch)[:, :bitmap.width]
+        else:
+            array = numpy.zeros((0, 0), dtype=numpy.uint8)
+        self.bitmaps[key] = (glyph.bitmap_left, glyph.bitmap_top, array)
+        return self.bitmaps[key]
+
+    def glyphId(self, aGlyphName):
+        return self.font.getGlyphID(aGlyphName)
+
+    def shape(self, aText):
+        # Shape a line of text, returning a list of (glyph id, x, y) in font
+        # units.
+        buffer = uharfbuzz.Buffer()
+        buffer.add_str(aText)
+        buffer.guess_segment_properties()
+        uharfbuzz.shape(self.hbFont, buffer)
+        glyphs = []
+        x = y = 0
+        for info, position in zip(buffer.glyph_infos, buffer.glyph_positions):
+            glyphs.append((info.codepoint, x + position.x_offset,
+                           y + position.y_offset))
+            x += position.x_advance
+            y += position.y_advance
+        return glyphs
+
+    def draw(self, aGlyphs):
+        # Rasterize a list of (glyph id, x, y), with y going up from the
+        # baseline in font units, into a grayscale image.
+        margin = int(round(kMargin * self.pixelsPerEm))
+        pieces = []
+        for glyphId, x, y in aGlyphs:
+            left, top, array = self.bitmap(glyphId)
+            if array.size:
+                # Left and top edges of the bitmap, in pixels from the origin
+                # and with y going up.
+                pieces.append((int(round(x * self.scale)) + left,
+                               int(round(y * self.scale)) + top, array))
+        if not pieces:
+            return numpy.zeros((2 * margin, 2 * margin), dtype=numpy.uint8)
+        left = min(x for x, _, _ in pieces)
+        top = max(y for _, y, _ in pieces)
+        width = max(x + array.shape[1] for x, _, array in pieces) - left
+        height = top - min(y - array.shape[0] for _, y, array in pieces)
+        image = numpy.zeros((height + 2 * margin, width + 2 * margin),
+                            dtype=numpy.uint8)
+        for x, y, array in pieces:
+            row = top - y + margin
+            column = x - left + margin
+            region = image[row:row + array.shape[0],
+                           column:column + array.shape[1]]
+            numpy.maximum(region, array, out=region)
+        return image
+
+def textTests(aRenderer):
+    cmap = aRenderer.font.getBestCmap()
+    tests = OrderedDict()
+    for name, ranges in kTextTests:
+        text = "".join(chr(u) for start, end in ranges
+                       for u in range(start, end + 1) if u in cmap)
+        if not text:
+            continue
+        glyphs = []
+        for i in range(0, len(text), kCharactersPerLine):
+            y = -1.5 * aRenderer.unitsPerEm * (i // kCharactersPerLine)
+            glyphs.extend((glyphId, x, y + dy) for glyphId, x, dy in
+                          aRenderer.shape(text[i:i + kCharactersPerLine]))
+        tests[name] = glyphs
+    return tests
+
+def centered(aRenderer, aGlyphName, aX, aCenter):
+    # Place a glyph so that its bounding box is vertically centered on
+    # aCenter.
+    box = aRenderer.boundingBox(aGlyphName)
+    return (aRenderer.glyphId(aGlyphName), aX,
+            aCenter - (box[1] + box[3]) / 2.)
+
+def largeOpTests(aRenderer, aConstructions):
+    cmap = aRenderer.font.getBestCmap()
+    constants = aRenderer.font["MATH"].table.MathConstants
+    axisHeight = constants.AxisHeight.Value
+    displayOperatorMinHeight = constants.DisplayOperatorMinHeight
+    verticalVariants = dict((c.name, c.variants) for c in aConstructions
+                            if c.vertical)
+    tests = OrderedDict()
+    for u in kLargeOperators:
+        if u not in cmap:
+            continue
+        base = cmap[u]
+        display = base
+        for size, glyph in verticalVariants.get(base, []):
+            display = glyph
+            if size >= displayOperatorMinHeight:
+                break
+        box = aRenderer.boundingBox(base)
+        tests["largeop-U+%04X" % u] = [
+            centered(aRenderer, base, 0, axisHeight),
+            centered(aRenderer, display,
+                     box[2] + kMargin * aRenderer.unitsPerEm, axisHeight)]
+    return tests
+
+def stretchyTests(aRenderer, aConstructions):
+    tests = OrderedDict()
+    unitsPerEm = aRenderer.unitsPerEm
+    for construction in aConstructions:
+        glyphs = []
+        position = 0
+        for size in testSizes(construction.vertical):
+            layout, _ = construction.stretch(size * unitsPerEm)
+            if construction.vertical:
+                # The operator covers an mspace of height and depth size/2:
+                # the bottom of the first glyph is placed at -size/2 and the
+                # others are stacked above it.
+                bottom = -size * unitsPerEm / 2. - \
+                    aRenderer.boundingBox(layout[0][0])[1]
+                for glyph, offset in layout:
+                    glyphs.append((aRenderer.glyphId(glyph), position,
+                                   bottom + offset))
+                position += max(aRenderer.boundingBox(glyph)[2]
+                                for glyph, _ in layout) + \
+                    kMargin * unitsPerEm
+            else:
+                # One row per size, like the mover elements of the table.
+                for glyph, offset in layout:
+                    glyphs.append((aRenderer.glyphId(glyph), offset,
+                                   position))
+                position -= 1.5 * unitsPerEm
+        tests["stretchy-%s-%s" % (construction.name,
+                                  construction.direction())] = glyphs
+    return tests
+
+def writePGM(aPath, aImage):
+    temporaryPath = "%s.%d.tmp" % (aPath, os.getpid())
+    with open(temporaryPath, "wb") as f:
+        f.write(b"P5\n%d %d\n255\n" % (aImage.shape[1], aImage.shape[0]))
+        f.write(aImage.tobytes())
+    os.replace(temporaryPath, aPath)
+
+def readPGM(aPath):
+    with open(aPath, "rb") as f:
+        data = f.read()
+    fields = data.split(None, 4)
+    if fields[0] != b"P5" or fields[3] != b"255":
+        raise ValueError("%s is not an 8-bit PGM file" % aPath)
+    width, height = int(fields[1]), int(fields[2])
+    return numpy.frombuffer(fields[4][:width * height],
+                            dtype=numpy.uint8).reshape(height, width)
+
+def compareImages(aImage, aReference, aTolerance):
+    # Return the number of pixels that differ, or None if the sizes differ.
+    if aImage.shape != aReference.shape:
+        return None
+    difference = numpy.abs(aImage.astype(numpy.int16) -
+                           aReference.astype(numpy.int16))
+    return int(numpy.count_nonzero(difference > aTolerance))
+
+def renderJob(aJob):
+    # Worker for the process pool: render the tests of one family and
+    # compare them with the references.
+    family, path, pixelsPerEm, referenceDirectory, outputDirectory, \
+        tolerance, update = aJob
+    start = time.time()
+    renderer = GlyphRenderer(path, pixelsPerEm)
+    constructions = mathTableConstructions(renderer.font)
+    tests = textTests(renderer)
+    if "MATH" in renderer.font:
+        tests.update(largeOpTests(renderer, constructions))
+        tests.update(stretchyTests(renderer, constructions))
+    references = os.path.join(referenceDirectory, family)
+    outputs = os.path.join(outputDirectory, family)
+    results = []
+    for name, glyphs in tests.items():
+        image = renderer.draw(glyphs)
+        reference = os.path.join(references, "%s.pgm" % name)
+        if update:
+            os.makedirs(references, exist_ok=True)
+            writePGM(reference, image)
+            results.append((name, "updated", None))
+            continue
+        if not os.path.exists(reference):
+            results.append((name, "missing", None))
+            continue
+        referenceImage = readPGM(reference)
+        difference = compareImages(image, referenceImage, tolerance)
+        if difference == 0:
+            results.append((name, "pass", 0))
+            continue
+        # Keep the rendering and the difference for inspection.
+        os.makedirs(outputs, exist_ok=True)
+        writePGM(os.path.join(outputs, "%s.pgm" % name), image)
+        if difference is not None:
+            writePGM(os.path.join(outputs, "%s.diff.pgm" % name),
+                     numpy.abs(image.astype(numpy.int16) -
+                               referenceImage).astype(numpy.uint8))
+        results.append((name, "fail", difference))
+    return family, results, len(renderer.bitmaps), renderer.hits, \
+        time.time() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the glyphs of the tests of GenerateHTMLTest.py (text, large operators and stretchy operators) with HarfBuzz and FreeType and compare them with reference images.")
+    parser.add_argument("families", type=str, nargs="*", metavar="family", help="Families to render (default: all of them).")
+    parser.add_argument("-r", "--reference-dir", type=str, default=kDefaultReferenceDirectory, help="Directory of the reference images, one subdirectory per family (default: %(default)s).")
+    parser.add_argument("-o", "--output-dir", type=str, default=kDefaultOutputDirectory, help="Directory where the renderings that differ from the references are written, with their difference (default: %(default)s).")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument("--size", type=int, default=kDefaultPixelsPerEm, help="Font size in pixels per em (default: %(default)s).")
+    parser.add_argument("--tolerance", type=int, default=kDefaultTolerance, help="Gray level difference above which two pixels are considered different (default: %(default)s).")
+    parser.add_argument("--update", action="store_true", help="Write the renderings as the new references instead of comparing them.")
+    parser.add_argument("--report", type=str, help="Also write the result of each test into this JSON file.")
+    args = parser.parse_args()
+
+    if freetype is None:
+        print("RenderTests.py requires uharfbuzz, freetype-py and numpy!",
+              file=sys.stderr)
+        sys.exit(1)
+    families = args.families or list(kFamilies)
+    for name in families:
+        if name not in kFamilies:
+            print("Unknown family %s!" % name, file=sys.stderr)
+            sys.exit(1)
+
+    start = time.time()
+    jobs = []
+    for family in families:
+        path = mathFont(family)
+        if not os.path.isfile(path):
+            print("Skipping %s: %s not found" % (family, path),
+                  file=sys.stderr)
+            continue
+        jobs.append((family, path, args.size, args.reference_dir,
+                     args.output_dir, args.tolerance, args.update))
+    if not jobs:
+        print("No WOFF2 font found, build the families first!",
+              file=sys.stderr)
+        sys.exit(1)
+    numberOfWorkers = max(1, min(args.jobs or 1, len(jobs)))
+    if numberOfWorkers > 1:
+        pool = multiprocessing.Pool(numberOfWorkers)
+        results = pool.map(renderJob, jobs)
+        pool.close()
+        pool.join()
+    else:
+        results = list(map(renderJob, jobs))
+
+    failures = 0
+    report = OrderedDict()
+    for family, tests, rasterized, hits, duration in results:
+        counts = OrderedDict()
+        for name, status, difference in tests:
+            counts[status] = counts.get(status, 0) + 1
+            if status == "fail":
+                print("FAIL %s/%s: %s" %
+                      (family, name, "size differs" if difference is None
+                       else "%d pixels differ" % difference))
+        # Tests without reference images are reported but do not fail, so
+        # that families can be added before their references.
+        if "missing" in counts:
+            print("%s: no reference image for %d test(s), use --update to "
+                  "record them" % (family, counts["missing"]))
+        failures += counts.get("fail", 0)
+        print("%s: %s (%d glyphs rasterized, %d cache hits) in %.2fs" %
+              (family, ", ".join("%d %s" % (count, status)
+                                 for status, count in counts.items()),
+               rasterized, hits, duration))
+        report[family] = OrderedDict(
+            (name, OrderedDict([("status", status),
+                                ("differentPixels", difference)]))
+            for name, status, difference in tests)
+    print("Rendered %d family(ies) in %.2fs" % (len(results),
+                                                time.time() - start))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=1)
+            f.write("\n")
+    sys.exit(1 if failures else 0)
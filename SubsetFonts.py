@@ -0,0 +1,306 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Subset the WOFF2 fonts of the families to the characters used by a corpus
+# of HTML/MathML documents (e.g. mozilla_mathml_test/index.html) and report
+# how many bytes each family would save. The fonts are subset with the
+# fontTools subsetter, which keeps the glyphs needed to render the corpus
+# characters via the GSUB (e.g. ssty) and MATH (size variants and assembly
+# parts of stretchy and large operators) tables, then encoded with the
+# compress-font.py functions.
+
+from __future__ import print_function
+from collections import OrderedDict
+from fontTools import subset
+from fontTools.ttLib import TTFont
+from html.parser import HTMLParser
+import argparse
+import glob
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time
+import unicodedata
+
+from BuildFonts import kFamilies, kRootDirectory
+
+# compress-font.py can not be imported by name.
+kCompressFontSpec = importlib.util.spec_from_file_location(
+    "compressFont", os.path.join(kRootDirectory, "compress-font.py"))
+compressFont = importlib.util.module_from_spec(kCompressFontSpec)
+kCompressFontSpec.loader.exec_module(compressFont)
+
+kCorpusExtensions = [".html", ".htm", ".xhtml", ".xml", ".mml"]
+kDefaultOutputDirectory = os.path.join(kRootDirectory, ".cache", "subset")
+
+# Mathematical Alphanumeric Symbols, see
+# https://www.unicode.org/charts/PDF/U1D400.pdf
+# Latin letters: 52 (A-Z, a-z) per mathvariant, starting at U+1D400.
+kLatinMathvariants = ["bold", "italic", "bold-italic", "script",
+                      "bold-script", "fraktur", "double-struck",
+                      "bold-fraktur", "sans-serif", "bold-sans-serif",
+                      "sans-serif-italic", "sans-serif-bold-italic",
+                      "monospace"]
+# Greek letters and symbols: 58 per mathvariant, starting at U+1D6A8.
+kGreekMathvariants = ["bold", "italic", "bold-italic", "bold-sans-serif",
+                      "sans-serif-bold-italic"]
+# Digits: 10 per mathvariant, starting at U+1D7CE.
+kDigitMathvariants = ["bold", "double-struck", "sans-serif",
+                      "bold-sans-serif", "monospace"]
+# Reserved code points of the block, whose characters are in the Letterlike
+# Symbols block.
+kHoles = {
+    0x1D455: 0x210E, 0x1D49D: 0x212C, 0x1D4A0: 0x2130, 0x1D4A1: 0x2131,
+    0x1D4A3: 0x210B, 0x1D4A4: 0x2110, 0x1D4A7: 0x2112, 0x1D4A8: 0x2133,
+    0x1D4AD: 0x211B, 0x1D4BA: 0x212F, 0x1D4BC: 0x210A, 0x1D4C4: 0x2134,
+    0x1D506: 0x212D, 0x1D50B: 0x210C, 0x1D50C: 0x2111, 0x1D515: 0x211C,
+    0x1D51D: 0x2128, 0x1D53A: 0x2102, 0x1D53F: 0x210D, 0x1D545: 0x2115,
+    0x1D547: 0x2119, 0x1D548: 0x211A, 0x1D549: 0x211D, 0x1D551: 0x2124,
+}
+# Arabic Mathematical Alphabetic Symbols, by the word following
+# "ARABIC MATHEMATICAL" in their name.
+kArabicMathvariants = {"INITIAL": "initial", "TAILED": "tailed",
+                       "LOOPED": "looped", "STRETCHED": "stretched",
+                       "DOUBLE-STRUCK": "double-struck"}
+
+def mathvariantOf(aCodePoint):
+    # Return the mathvariant of a code point of the Mathematical Alphanumeric
+    # Symbols block.
+    if aCodePoint < 0x1D6A4:
+        return kLatinMathvariants[(aCodePoint - 0x1D400) // 52]
+    if aCodePoint < 0x1D6A8:
+        return "italic" # dotless i and j
+    if aCodePoint < 0x1D7CA:
+        return kGreekMathvariants[(aCodePoint - 0x1D6A8) // 58]
+    if aCodePoint < 0x1D7CE:
+        return "bold" # digamma
+    return kDigitMathvariants[(aCodePoint - 0x1D7CE) // 10]
+
+def mathvariantTables():
+    # Return {mathvariant: {code point: transformed code point}}.
+    tables = {}
+    def add(aMathvariant, aCodePoint):
+        decomposition = unicodedata.decomposition(chr(aCodePoint)).split()
+        if len(decomposition) == 2 and decomposition[0] == "<font>":
+            tables.setdefault(aMathvariant, {})[
+                int(decomposition[1], 16)] = aCodePoint
+    for codePoint in range(0x1D400, 0x1D800):
+        add(mathvariantOf(codePoint), kHoles.get(codePoint, codePoint))
+    for codePoint in range(0x1EE00, 0x1EF00):
+        words = unicodedata.name(chr(codePoint), "").split()
+        if words[:2] == ["ARABIC", "MATHEMATICAL"] and \
+           words[2] in kArabicMathvariants:
+            add(kArabicMathvariants[words[2]], codePoint)
+    return tables
+
+kMathvariants = mathvariantTables()
+
+# Characters drawn by MathML elements in addition to their text content.
+kRadical = 0x221A
+kMfencedDefaults = {"open": "(", "close": ")", "separators": ","}
+kMathMLTokens = ["mi", "mn", "mo", "ms", "mtext"]
+kVoidElements = ["area", "base", "br", "col", "embed", "hr", "img", "input",
+                 "link", "meta", "source", "track", "wbr"]
+
+class CorpusParser(HTMLParser):
+    # Collect the code points rendered by a document, with the mathvariant
+    # transforms applied by the MathML token elements.
+    def __init__(self, aCodePoints):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.codePoints = aCodePoints
+        self.skip = 0
+        self.stack = []
+
+    def handle_starttag(self, aTag, aAttributes):
+        tag = aTag.split(":")[-1]
+        attributes = dict(aAttributes)
+        if tag in kVoidElements:
+            return
+        self.stack.append((tag, attributes.get("mathvariant")))
+        if tag in ["script", "style"]:
+            self.skip += 1
+        elif tag in ["msqrt", "mroot"] or \
+             (tag == "menclose" and
+              "radical" in (attributes.get("notation") or "")):
+            self.codePoints.add(kRadical)
+        elif tag == "mfenced":
+            for name, default in kMfencedDefaults.items():
+                value = attributes.get(name)
+                self.addText(default if value is None else value)
+
+    def handle_startendtag(self, aTag, aAttributes):
+        self.handle_starttag(aTag, aAttributes)
+        self.handle_endtag(aTag)
+
+    def handle_endtag(self, aTag):
+        tag = aTag.split(":")[-1]
+        # Be tolerant with unclosed elements.
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                for name, _ in self.stack[i:]:
+                    if name in ["script", "style"]:
+                        self.skip -= 1
+                del self.stack[i:]
+                break
+
+    def handle_data(self, aData):
+        if self.skip:
+            return
+        mathvariant = None
+        if self.stack and self.stack[-1][0] in kMathMLTokens:
+            for tag, value in reversed(self.stack):
+                if value:
+                    mathvariant = value
+                    break
+                if tag == "math":
+                    break
+            # Single-character mi are rendered in italic.
+            if mathvariant is None and self.stack[-1][0] == "mi" and \
+               len(aData.strip()) == 1:
+                mathvariant = "italic"
+        self.addText(aData, mathvariant)
+
+    def addText(self, aText, aMathvariant=None):
+        table = kMathvariants.get(aMathvariant, {})
+        for character in aText:
+            codePoint = ord(character)
+            self.codePoints.add(table.get(codePoint, codePoint))
+
+def corpusFiles(aPaths):
+    files = []
+    for path in aPaths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for directory, _, names in sorted(os.walk(path)):
+            files.extend(os.path.join(directory, name) for name in sorted(names)
+                         if os.path.splitext(name)[1].lower() in
+                         kCorpusExtensions)
+    return files
+
+def corpusCodePoints(aPaths):
+    codePoints = set()
+    for path in corpusFiles(aPaths):
+        parser = CorpusParser(codePoints)
+        with open(path, encoding="utf-8", errors="replace") as f:
+            parser.feed(f.read())
+        parser.close()
+    # Controls are never rendered.
+    return sorted(u for u in codePoints
+                  if unicodedata.category(chr(u)) != "Cc")
+
+def familyFonts(aFamily):
+    # The WOFF2 fonts of a family, but not the chunks of compress-font.py
+    # --split.
+    chunks = set(name for name, _ in compressFont.kChunks)
+    return [path for path in
+            sorted(glob.glob(os.path.join(kRootDirectory, aFamily, "*.woff2")))
+            if os.path.splitext(os.path.splitext(path)[0])[1][1:]
+            not in chunks]
+
+def subsetJob(aJob):
+    # Worker for the process pool: subset one font and write its WOFF2.
+    family, path, codePoints, outputDirectory = aJob
+    start = time.time()
+    font = TTFont(path, recalcBBoxes=False, recalcTimestamp=False)
+    glyphCount = len(font.getGlyphOrder())
+    cmap = font.getBestCmap()
+    used = [u for u in codePoints if u in cmap]
+    subsetter = subset.Subsetter(compressFont.subsetOptions())
+    subsetter.populate(unicodes=used)
+    subsetter.subset(font)
+    # Glyphs added by the closure over the GSUB and MATH tables.
+    closure = len(font.getGlyphOrder()) - len(set(cmap[u] for u in used))
+    sfntVersion, tables = compressFont.compileFont(font)
+    outfilename = os.path.join(outputDirectory, family,
+                               os.path.basename(path))
+    os.makedirs(os.path.dirname(outfilename), exist_ok=True)
+    with open(outfilename, "wb") as f:
+        compressFont.writeFont(f, "woff2", sfntVersion, tables)
+    result = OrderedDict()
+    result["family"] = family
+    result["font"] = os.path.basename(path)
+    result["output"] = os.path.relpath(outfilename, kRootDirectory)
+    result["codePoints"] = len(used)
+    result["glyphs"] = len(font.getGlyphOrder())
+    result["closureGlyphs"] = closure
+    result["originalGlyphs"] = glyphCount
+    result["originalSize"] = os.path.getsize(path)
+    result["size"] = os.path.getsize(outfilename)
+    result["time"] = round(time.time() - start, 3)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Subset the WOFF2 fonts of the families to the characters used by a corpus of HTML/MathML documents and report the byte savings.")
+    parser.add_argument("families", type=str, nargs="*", metavar="family", help="Families whose fonts are subset (default: all of them).")
+    parser.add_argument("-c", "--corpus", type=str, action="append", required=True, help="HTML/MathML document or directory of documents to scan. Can be repeated.")
+    parser.add_argument("-o", "--output-dir", type=str, default=kDefaultOutputDirectory, help="Directory where the subset fonts are written, in a subdirectory per family (default: %(default)s).")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument("--profile", choices=sorted(compressFont.kProfiles), default=compressFont.kDefaultProfile, help="Compression profile of compress-font.py (default: %(default)s).")
+    parser.add_argument("--report", type=str, help="Also write the sizes of each subset font into this JSON file.")
+    args = parser.parse_args()
+    compressFont.applyProfile(args.profile)
+
+    families = args.families or list(kFamilies)
+    for name in families:
+        if name not in kFamilies:
+            print("Unknown family %s!" % name, file=sys.stderr)
+            sys.exit(1)
+
+    start = time.time()
+    codePoints = corpusCodePoints(args.corpus)
+    print("%d code points used by the corpus" % len(codePoints))
+    jobs = [(family, path, codePoints, args.output_dir)
+            for family in families for path in familyFonts(family)]
+    if not jobs:
+        print("No WOFF2 font found, build the families first!",
+              file=sys.stderr)
+        sys.exit(1)
+    numberOfWorkers = max(1, min(args.jobs or 1, len(jobs)))
+    if numberOfWorkers > 1:
+        pool = multiprocessing.Pool(numberOfWorkers,
+                                    compressFont.applyProfile,
+                                    (args.profile,))
+        results = pool.map(subsetJob, jobs)
+        pool.close()
+        pool.join()
+    else:
+        results = list(map(subsetJob, jobs))
+
+    totals = OrderedDict()
+    for result in results:
+        print("%s => %s: %d code points, %d/%d glyphs (%d from the closure), "
+              "%d => %d bytes" %
+              (os.path.join(result["family"], result["font"]),
+               result["output"], result["codePoints"], result["glyphs"],
+               result["originalGlyphs"], result["closureGlyphs"],
+               result["originalSize"], result["size"]))
+        total = totals.setdefault(result["family"], [0, 0])
+        total[0] += result["originalSize"]
+        total[1] += result["size"]
+    print("")
+    print("%-24s %12s %12s %12s %7s" %
+          ("Family", "WOFF2", "Subset", "Saved", "Saved"))
+    for family, (originalSize, size) in totals.items():
+        print("%-24s %12d %12d %12d %6.1f%%" %
+              (family, originalSize, size, originalSize - size,
+               100. * (originalSize - size) / originalSize))
+    originalSize = sum(total[0] for total in totals.values())
+    size = sum(total[1] for total in totals.values())
+    print("%-24s %12d %12d %12d %6.1f%%" %
+          ("Total", originalSize, size, originalSize - size,
+           100. * (originalSize - size) / originalSize))
+
+    if args.report:
+        report = OrderedDict()
+        report["corpus"] = args.corpus
+        report["codePoints"] = len(codePoints)
+        report["fonts"] = results
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=1)
+            f.write("\n")
+    print("Subset %d font(s) of %d family(ies) in %.2fs" %
+          (len(results), len(totals), time.time() - start))
@@ -3,24 +3,564 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 from __future__ import print_function
-from fontTools.ttLib import TTFont, sfnt
+from FontSources import archiveMember, fileDigest, openSource, sourceSize
+from collections import OrderedDict
+from fontTools import subset
+from fontTools.ttLib import TTFont, getTableClass, sfnt, woff2
+from fontTools.ttLib.ttFont import sortedTagList
+from io import BytesIO
 from os.path import splitext
+import argparse
+import fontTools
+import hashlib
+import importlib
+import multiprocessing
+import json
+import os
+import re
+import shutil
 import sys
+import time
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("usage: python %s filename" % sys.argv[0], file=sys.stderr)
-        sys.exit(1)
-    filename = sys.argv[1]
-    basename = splitext(filename)[0]
-
-    sfnt.USE_ZOPFLI = True
-    for flavor in ["woff", "woff2"]:
-        outfilename = "%s.%s" % (basename, flavor)
-        print("Processing %s => %s" % (filename, outfilename))
-        font = TTFont(filename, recalcBBoxes=False, recalcTimestamp=False)
+# Compressed fonts are stored in a content-addressed cache, so that running
+# make again does not recompress fonts that did not change.
+# Bump kCacheVersion when the way fonts are processed below changes.
+kCacheVersion = 1
+kDefaultCacheDirectory = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "compress-font")
+
+kFlavors = ["woff", "woff2"]
+
+# Compression profiles. zopfliIterations is the number of zopfli iterations
+# used for each WOFF table (0 means plain zlib) while brotliQuality and
+# brotliWindow are the quality and base 2 logarithm of the window size of the
+# WOFF2 brotli stream. The release profile matches fontTools' defaults with
+# zopfli enabled, which is what has always been used to build the fonts.
+kProfiles = {
+    "fast": {"zopfliIterations": 0, "brotliQuality": 4, "brotliWindow": 22},
+    "release": {"zopfliIterations": 15, "brotliQuality": 11,
+                "brotliWindow": 22},
+}
+kDefaultProfile = "release"
+
+class BrotliWithSettings(object):
+    # The WOFF2 writer of fontTools calls brotli.compress without quality nor
+    # window size, so it is given this wrapper instead of the brotli module.
+    def __init__(self, aBrotli, aQuality, aWindow):
+        self.brotli = aBrotli
+        self.quality = aQuality
+        self.window = aWindow
+
+    def compress(self, aData, **aKeywords):
+        aKeywords["quality"] = self.quality
+        aKeywords["lgwin"] = self.window
+        return self.brotli.compress(aData, **aKeywords)
+
+    def __getattr__(self, aName):
+        return getattr(self.brotli, aName)
+
+def applyProfile(aProfile):
+    # This is called in each worker process, before any compression.
+    settings = kProfiles[aProfile]
+    sfnt.USE_ZOPFLI = settings["zopfliIterations"] > 0
+    if sfnt.USE_ZOPFLI:
+        sfnt.ZOPFLI_LEVELS[sfnt.ZLIB_COMPRESSION_LEVEL] = \
+            settings["zopfliIterations"]
+    brotli = woff2.brotli
+    if isinstance(brotli, BrotliWithSettings):
+        brotli = brotli.brotli
+    woff2.brotli = BrotliWithSettings(brotli, settings["brotliQuality"],
+                                      settings["brotliWindow"])
+
+def libraryVersion(aModule):
+    # Version of a compression library, so that upgrading the encoder
+    # invalidates the cached outputs.
+    try:
+        module = importlib.import_module(aModule)
+    except ImportError:
+        return "none"
+    return getattr(module, "__version__", "unknown")
+
+def compressionSettings(aFlavor, aProfile):
+    # Everything, apart from the source font, that may affect the output.
+    settings = kProfiles[aProfile]
+    if aFlavor == "woff":
+        return "fontTools=%s;flavor=woff;zopfli=%d;zopfliVersion=%s;zlib=%d" % \
+            (fontTools.version, settings["zopfliIterations"],
+             libraryVersion("zopfli") if settings["zopfliIterations"] else "",
+             sfnt.ZLIB_COMPRESSION_LEVEL)
+    return "fontTools=%s;flavor=%s;brotli=%d;lgwin=%d;brotliVersion=%s" % \
+        (fontTools.version, aFlavor, settings["brotliQuality"],
+         settings["brotliWindow"], libraryVersion("brotli"))
+
+def cacheKey(aSourceDigest, aFlavor, aProfile, aChunk=None):
+    # In split mode, each chunk of a font is cached separately.
+    settings = compressionSettings(aFlavor, aProfile)
+    if aChunk:
+        settings += ";chunk=%s;chunks=%r" % (aChunk, kChunks)
+    key = "%d\n%s\n%s" % (kCacheVersion, aSourceDigest, settings)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def splitKey(aSourceDigest):
+    # Key of the chunks of a font, i.e. their names and code points.
+    key = "%d\n%s\nfontTools=%s;chunks=%r" % (kCacheVersion, aSourceDigest,
+                                              fontTools.version, kChunks)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def cachePath(aCacheDirectory, aKey):
+    return os.path.join(aCacheDirectory, aKey[:2], aKey)
+
+def storeInCache(aCacheDirectory, aKey, aFilename):
+    path = cachePath(aCacheDirectory, aKey)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Copy to a temporary file first so that concurrent builds never see a
+    # partially written cache entry.
+    temporaryPath = "%s.%d.tmp" % (path, os.getpid())
+    shutil.copyfile(aFilename, temporaryPath)
+    os.replace(temporaryPath, path)
+
+def lookupSplit(aCacheDirectory, aSourceDigest):
+    # Return the cached (descriptors, chunks) of a font, or None.
+    if not aCacheDirectory:
+        return None
+    path = cachePath(aCacheDirectory, splitKey(aSourceDigest))
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        split = json.load(f)
+    return split["descriptors"], split["chunks"]
+
+def storeSplitInCache(aCacheDirectory, aSourceDigest, aDescriptors, aChunks):
+    path = cachePath(aCacheDirectory, splitKey(aSourceDigest))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporaryPath = "%s.%d.tmp" % (path, os.getpid())
+    with open(temporaryPath, "w") as f:
+        json.dump({"descriptors": aDescriptors, "chunks": aChunks}, f)
+    os.replace(temporaryPath, path)
+
+def outputFilename(aFilename, aFlavor, aOutputDirectory=None):
+    # Fonts read from an archive are written into the output directory (the
+    # current one by default), other fonts next to their source unless an
+    # output directory is specified.
+    location = archiveMember(aFilename)
+    if location is not None:
+        aFilename = os.path.join(aOutputDirectory or os.curdir,
+                                 os.path.basename(location[1]))
+    elif aOutputDirectory:
+        aFilename = os.path.join(aOutputDirectory, os.path.basename(aFilename))
+    return "%s.%s" % (splitext(aFilename)[0], aFlavor)
+
+def readSource(aFilename):
+    # Zip members are read into memory, since TTFont needs to seek.
+    with openSource(aFilename) as f:
+        return f.read()
+
+def compileTables(aFilename):
+    # Decode and compile each table exactly once. The returned data is shared
+    # by the WOFF and WOFF2 writers, so a font is never parsed once per flavor.
+    font = TTFont(BytesIO(readSource(aFilename)), recalcBBoxes=False,
+                  recalcTimestamp=False)
+    return compileFont(font)
+
+def compileFont(aFont):
+    font = aFont
+    tables = OrderedDict()
+    def compileTable(aTag):
+        if aTag in tables:
+            return
+        # Same dependency order as TTFont.save (e.g. glyf before loca).
+        for masterTable in getTableClass(aTag).dependencies:
+            if masterTable in font:
+                compileTable(masterTable)
+        font[aTag]  # Force decompilation, getTableData then recompiles.
+        tables[aTag] = font.getTableData(aTag)
+    tags = [tag for tag in font.keys() if tag != "GlyphOrder"]
+    for tag in tags:
+        compileTable(tag)
+    # Keep the table order of the original font, like
+    # TTFont.save(reorderTables=False) does.
+    tags = sortedTagList(tags, list(font.reader.keys()))
+    sfntVersion = font.sfntVersion
+    font.close()
+    return sfntVersion, [(tag, tables[tag]) for tag in tags]
+
+# In split mode, the code points of a font are partitioned into the chunks
+# below, in that order: a code point goes to the first chunk containing it
+# and the last chunk receives the remaining ones. Each chunk is subset into
+# its own font and the @font-face rules generated for the chunks use
+# unicode-range, so that browsers only download the chunks used by a page.
+kChunks = [
+    ("core", [(0x0000, 0x00FF),   # Basic Latin, Latin-1 Supplement
+              (0x0300, 0x036F),   # Combining Diacritical Marks
+              (0x0370, 0x03FF),   # Greek and Coptic
+              (0x2000, 0x206F),   # General Punctuation
+              (0x20D0, 0x20FF),   # Combining Diacritical Marks for Symbols
+              (0x2100, 0x214F),   # Letterlike Symbols
+              (0x2190, 0x21FF),   # Arrows
+              (0x2200, 0x22FF),   # Mathematical Operators
+              (0x2300, 0x23FF),   # Miscellaneous Technical
+              (0x27C0, 0x27FF),   # Misc. Mathematical Symbols-A, Arrows-A
+              (0x2980, 0x2AFF)]), # Misc. Mathematical Symbols-B, Operators
+    ("alphanumeric", [(0x1D400, 0x1D7FF)]),
+    ("arabic", [(0x1EE00, 0x1EEFF)]),
+    ("other", None),
+]
+
+def partitionCodePoints(aCodePoints):
+    # Return the non-empty chunks as a list of (name, sorted code points).
+    chunks = OrderedDict((name, []) for name, ranges in kChunks)
+    for codePoint in sorted(aCodePoints):
+        for name, ranges in kChunks:
+            if ranges is None or \
+               any(start <= codePoint <= end for start, end in ranges):
+                chunks[name].append(codePoint)
+                break
+    return [(name, codePoints) for name, codePoints in chunks.items()
+            if codePoints]
+
+def chunkFilename(aFilename, aChunk):
+    # e.g. XITS-Regular.otf => XITS-Regular.core.otf, so that outputFilename
+    # gives the name of the compressed chunk.
+    base, extension = splitext(aFilename)
+    return "%s.%s%s" % (base, aChunk, extension)
+
+def subsetOptions():
+    # Keep everything but the glyphs, the subsetter closes the glyph set over
+    # GSUB (e.g. ssty variants) and MATH (size variants and assembly parts),
+    # so that they stay in the chunk of their base glyph.
+    options = subset.Options()
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    options.name_languages = ["*"]
+    options.name_legacy = True
+    options.notdef_glyph = True
+    options.notdef_outline = True
+    options.glyph_names = True
+    options.legacy_kern = True
+    options.symbol_cmap = True
+    options.recalc_bounds = False
+    options.recalc_timestamp = False
+    options.ignore_missing_unicodes = True
+    return options
+
+def fontFaceDescriptors(aFont):
+    # The font-family, font-weight and font-style of the @font-face rules.
+    names = aFont["name"]
+    family = names.getDebugName(16) or names.getDebugName(1)
+    weight = aFont["OS/2"].usWeightClass
+    italic = aFont["OS/2"].fsSelection & 1
+    return family, weight, italic
+
+def splitJob(aFilename):
+    # Subset a font into its chunks and compile each of them.
+    start = time.time()
+    source = readSource(aFilename)
+    font = TTFont(BytesIO(source), recalcBBoxes=False, recalcTimestamp=False)
+    descriptors = fontFaceDescriptors(font)
+    codePoints = font.getBestCmap().keys()
+    font.close()
+    chunks = []
+    for name, chunkCodePoints in partitionCodePoints(codePoints):
+        font = TTFont(BytesIO(source), recalcBBoxes=False,
+                      recalcTimestamp=False)
+        subsetter = subset.Subsetter(subsetOptions())
+        subsetter.populate(unicodes=chunkCodePoints)
+        subsetter.subset(font)
+        sfntVersion, tables = compileFont(font)
+        chunks.append((name, chunkCodePoints, sfntVersion, tables))
+    return aFilename, descriptors, chunks, time.time() - start
+
+def unicodeRange(aCodePoints):
+    # e.g. [0x20, 0x21, 0x22, 0x2200] => "U+20-22, U+2200"
+    ranges = []
+    for codePoint in aCodePoints:
+        if ranges and ranges[-1][1] == codePoint - 1:
+            ranges[-1][1] = codePoint
+        else:
+            ranges.append([codePoint, codePoint])
+    return ", ".join("U+%X" % start if start == end else
+                     "U+%X-%X" % (start, end) for start, end in ranges)
+
+def fontFaceRules(aFilename, aOutputDirectory, aDescriptors, aChunks,
+                  aFamily=None, aLocalSources=()):
+    family, weight, italic = aDescriptors
+    family = aFamily or family
+    if not family:
+        # Fonts without a family name are named after their file.
+        location = archiveMember(aFilename)
+        family = os.path.splitext(os.path.basename(
+            location[1] if location else aFilename))[0]
+    if family[0] not in "'\"" and \
+       not family.replace("-", "").replace(" ", "").isalnum():
+        family = "'%s'" % family
+    rules = ""
+    for name, codePoints in aChunks:
+        sources = ["url('%s') format('%s')" % (os.path.basename(
+            outputFilename(chunkFilename(aFilename, name), flavor,
+                           aOutputDirectory)), flavor)
+                   for flavor in reversed(kFlavors)]
+        if aLocalSources:
+            sources.insert(0, ", ".join(aLocalSources))
+        rules += "@font-face {\n"
+        rules += "    font-family: %s;\n" % family
+        rules += "    src: %s;\n" % ",\n         ".join(sources)
+        if weight != 400:
+            rules += "    font-weight: %s;\n" % \
+                ("bold" if weight == 700 else weight)
+        if italic:
+            rules += "    font-style: italic;\n"
+        rules += "    unicode-range: %s;\n" % unicodeRange(codePoints)
+        rules += "}\n"
+    return rules
+
+kFontFaceRule = re.compile(r"@font-face\s*\{[^}]*\}\n?")
+
+def updateStylesheet(aPath, aFilename, aOutputDirectory, aDescriptors,
+                     aChunks, aFamily=None):
+    # Replace the @font-face rules of a font in a stylesheet (the
+    # mathfonts.css of the family by default) with the rules of its chunks.
+    # These are delimited by comments, so that splitting the font again
+    # replaces them. The font-family and local() sources of the replaced
+    # rules are kept.
+    location = archiveMember(aFilename)
+    name = os.path.basename(location[1] if location else aFilename)
+    begin = "/* Chunks of %s, generated by compress-font.py --split */\n" % \
+        name
+    end = "/* End of the chunks of %s */\n" % name
+    stylesheet = ""
+    if os.path.isfile(aPath):
+        with open(aPath) as f:
+            stylesheet = f.read()
+    replaced = []
+    start = stylesheet.find(begin)
+    if start >= 0:
+        stop = stylesheet.find(end, start)
+        if stop < 0:
+            print("%s: '%s' was not found after '%s', restore it or remove "
+                  "the chunks of %s" % (aPath, end.strip(), begin.strip(),
+                                        name), file=sys.stderr)
+            sys.exit(1)
+        stop += len(end)
+        replaced.append(stylesheet[start:stop])
+        stylesheet = stylesheet[:start] + "\0" + stylesheet[stop:]
+    urls = ["url(%s%s%s)" % (quote, os.path.basename(
+        outputFilename(aFilename, flavor, aOutputDirectory)), quote)
+        for flavor in kFlavors for quote in ("'", '"', "")]
+    def removeRule(aMatch):
+        if not any(url in aMatch.group(0) for url in urls):
+            return aMatch.group(0)
+        replaced.append(aMatch.group(0))
+        return "\0"
+    stylesheet = kFontFaceRule.sub(removeRule, stylesheet)
+    localSources = []
+    for rule in replaced:
+        for source in re.findall(r"local\([^)]*\)", rule):
+            if source not in localSources:
+                localSources.append(source)
+    if not aFamily:
+        families = re.findall(r"font-family:\s*([^;]*);", "".join(replaced))
+        aFamily = families[0].strip() if families else None
+    block = begin + fontFaceRules(aFilename, aOutputDirectory, aDescriptors,
+                                  aChunks, aFamily, localSources) + end
+    if "\0" in stylesheet:
+        stylesheet = stylesheet.replace("\0", block, 1).replace("\0", "")
+    else:
+        # Add the rules after the last @font-face rule, if any.
+        rules = list(kFontFaceRule.finditer(stylesheet))
+        position = rules[-1].end() if rules else len(stylesheet)
+        stylesheet = stylesheet[:position] + block + stylesheet[position:]
+    temporaryPath = "%s.%d.tmp" % (aPath, os.getpid())
+    with open(temporaryPath, "w") as f:
+        f.write(stylesheet)
+    os.replace(temporaryPath, aPath)
+    print("%s => %s" % (aFilename, aPath))
+
+def writeFont(aFile, aFlavor, aSfntVersion, aTables):
+    writer = sfnt.SFNTWriter(aFile, len(aTables), aSfntVersion, aFlavor)
+    for tag, data in aTables:
+        writer[tag] = data
+    writer.close()
+
+def lookupCache(aFilename, aFlavor, aProfile, aCacheDirectory,
+                aSourceDigest, aOutputDirectory=None, aChunk=None):
+    # Copy the output from the cache if possible. Return whether that
+    # succeeded and the cache key to use otherwise.
+    if not aCacheDirectory:
+        return False, None
+    key = cacheKey(aSourceDigest, aFlavor, aProfile, aChunk)
+    cached = cachePath(aCacheDirectory, key)
+    if not os.path.isfile(cached):
+        return False, key
+    outfilename = outputFilename(aFilename, aFlavor, aOutputDirectory)
+    print("Reusing %s => %s (cached)" % (aFilename, outfilename))
+    shutil.copyfile(cached, outfilename)
+    return True, key
+
+def compileJob(aFilename):
+    start = time.time()
+    sfntVersion, tables = compileTables(aFilename)
+    return aFilename, sfntVersion, tables, time.time() - start
+
+def compressJob(aJob):
+    # Worker for the process pool: a job is a (font, flavor) pair.
+    filename, flavor, outputDirectory, cacheDirectory, key, sfntVersion, \
+        tables = aJob
+    start = time.time()
+    outfilename = outputFilename(filename, flavor, outputDirectory)
+    print("Processing %s => %s" % (filename, outfilename))
+    with open(outfilename, "wb") as f:
+        writeFont(f, flavor, sfntVersion, tables)
+    duration = time.time() - start
+    if key:
+        storeInCache(cacheDirectory, key, outfilename)
+    return filename, flavor, os.path.getsize(outfilename), duration
+
+def benchmark(aFilename):
+    # Compare the former pipeline, which parsed and compiled the font once
+    # per flavor, with the compileTables/writeFont one.
+    start = time.time()
+    for flavor in kFlavors:
+        with openSource(aFilename) as f:
+            font = TTFont(BytesIO(f.read()), recalcBBoxes=False,
+                          recalcTimestamp=False)
         for t in font.keys():
             if hasattr(font[t], "compile"):
                 font[t].compile(font)
         font.flavor = flavor
-        font.save(outfilename, reorderTables=False)
+        font.save(BytesIO(), reorderTables=False)
+    perFlavor = time.time() - start
+
+    start = time.time()
+    sfntVersion, tables = compileTables(aFilename)
+    compileTime = time.time() - start
+    for flavor in kFlavors:
+        writeFont(BytesIO(), flavor, sfntVersion, tables)
+    once = time.time() - start
+
+    print("%s: parse per flavor %.2fs, parse once %.2fs (compile %.2fs), "
+          "saved %.2fs" % (aFilename, perFlavor, once, compileTime,
+                          perFlavor - once))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert fonts into WOFF and WOFF2 formats.")
+    parser.add_argument("filenames", type=str, nargs="+", metavar="filename", help="Fonts to convert. Use archive.zip!path/to/font.otf to read a font from a zip archive without extracting it.")
+    parser.add_argument("-o", "--output-dir", type=str, help="Directory where the WOFF and WOFF2 fonts are written (default: next to the source fonts, or the current directory for fonts read from an archive).")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument("--cache-dir", type=str, default=kDefaultCacheDirectory, help="Directory where compressed fonts are cached (default: %(default)s).")
+    parser.add_argument("--no-cache", action="store_true", help="Always compress the fonts, ignoring and not updating the cache.")
+    parser.add_argument("--profile", choices=sorted(kProfiles), default=kDefaultProfile, help="Compression effort: 'fast' for quick development builds, 'release' for the smallest fonts (default: %(default)s).")
+    parser.add_argument("--split", action="store_true", help="Split each font into a core chunk and secondary chunks (e.g. the mathematical alphanumeric symbols) and replace the @font-face rules of the font in the stylesheet by rules with the unicode-range of each chunk.")
+    parser.add_argument("--stylesheet", type=str, help="Stylesheet updated by --split (default: mathfonts.css in the directory of the WOFF and WOFF2 fonts).")
+    parser.add_argument("--font-family", type=str, help="Family name of the @font-face rules generated by --split (default: the one of the replaced rules, or the family name of the font).")
+    parser.add_argument("--benchmark", action="store_true", help="Measure the time saved by parsing each font once for all flavors, without writing any file.")
+    args = parser.parse_args()
+    applyProfile(args.profile)
+
+    if args.benchmark:
+        for filename in args.filenames:
+            benchmark(filename)
+        sys.exit(0)
+
+    cacheDirectory = None if args.no_cache else args.cache_dir
+    start = time.time()
+
+    # Fonts for which at least one flavor, or in split mode one flavor of a
+    # chunk, is not in the cache.
+    pending = OrderedDict()
+    # In split mode, the (descriptors, chunks) of each font.
+    splits = OrderedDict()
+    for filename in args.filenames:
+        sourceDigest = fileDigest(filename) if cacheDirectory else None
+        if args.split:
+            split = lookupSplit(cacheDirectory, sourceDigest)
+            if split and all(lookupCache(chunkFilename(filename, name), flavor,
+                                         args.profile, cacheDirectory,
+                                         sourceDigest, args.output_dir,
+                                         name)[0]
+                             for name, codePoints in split[1]
+                             for flavor in kFlavors):
+                splits[filename] = split
+            else:
+                pending[filename] = sourceDigest
+            continue
+        for flavor in kFlavors:
+            found, key = lookupCache(filename, flavor, args.profile,
+                                     cacheDirectory, sourceDigest,
+                                     args.output_dir)
+            if not found:
+                pending.setdefault(filename, []).append((flavor, key))
+
+    if args.split:
+        numberOfJobs = len(pending) * len(kChunks) * len(kFlavors)
+    else:
+        numberOfJobs = sum(len(flavors) for flavors in pending.values())
+    numberOfWorkers = max(1, min(args.jobs or 1, numberOfJobs))
+    pool = None
+    if numberOfWorkers > 1:
+        pool = multiprocessing.Pool(numberOfWorkers, applyProfile,
+                                    (args.profile,))
+
+    # Each font is compiled once, then its flavors are encoded in parallel.
+    # In split mode, each chunk of a font is compiled once instead.
+    results = []
+    def encode(aSource, aFilename, aSfntVersion, aTables, aKeys):
+        for flavor, key in aKeys:
+            job = (aFilename, flavor, args.output_dir, cacheDirectory, key,
+                   aSfntVersion, aTables)
+            if pool:
+                results.append((aSource,
+                                pool.apply_async(compressJob, (job,))))
+            else:
+                results.append((aSource, compressJob(job)))
+    if args.split:
+        if pool:
+            split = pool.imap_unordered(splitJob, pending.keys())
+        else:
+            split = map(splitJob, pending.keys())
+        for filename, descriptors, chunks, duration in split:
+            print("%s split into %s: %.2fs" %
+                  (filename, ", ".join("%s (%d code points)" %
+                                       (name, len(codePoints))
+                                       for name, codePoints, _, _ in chunks),
+                   duration))
+            sourceDigest = pending[filename]
+            for name, codePoints, sfntVersion, tables in chunks:
+                encode(filename, chunkFilename(filename, name), sfntVersion,
+                       tables, [(flavor, cacheKey(sourceDigest, flavor,
+                                                  args.profile, name)
+                                 if cacheDirectory else None)
+                                for flavor in kFlavors])
+            splits[filename] = (descriptors,
+                                [chunk[:2] for chunk in chunks])
+            if cacheDirectory:
+                storeSplitInCache(cacheDirectory, sourceDigest,
+                                  *splits[filename])
+    else:
+        if pool:
+            compiled = pool.imap_unordered(compileJob, pending.keys())
+        else:
+            compiled = map(compileJob, pending.keys())
+        for filename, sfntVersion, tables, duration in compiled:
+            print("%s compiled: %.2fs" % (filename, duration))
+            encode(filename, filename, sfntVersion, tables,
+                   pending[filename])
+    for source, result in results:
+        filename, flavor, size, duration = result.get() if pool else result
+        originalSize = sourceSize(source)
+        print("%s => %s: %d bytes (%.1f%% of %d), encoded in %.2fs" %
+              (filename, outputFilename(filename, flavor, args.output_dir),
+               size, 100. * size / originalSize, originalSize, duration))
+    if pool:
+        pool.close()
+        pool.join()
+
+    # The stylesheet only refers to the chunks once they are all written.
+    for filename, split in splits.items():
+        stylesheet = args.stylesheet or os.path.join(os.path.dirname(
+            outputFilename(filename, "css", args.output_dir)), "mathfonts.css")
+        updateStylesheet(stylesheet, filename, args.output_dir, *split,
+                         aFamily=args.font_family)
+
+    print("Compressed %d font(s) with %d worker(s) and profile '%s' in %.2fs" %
+          (len(args.filenames), numberOfWorkers, args.profile,
+           time.time() - start))